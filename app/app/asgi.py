@@ -0,0 +1,18 @@
+"""
+ASGI config for app project.
+
+It exposes the ASGI callable as a module-level variable named ``application``. Deployments served through it get
+the async variant of the assets aggregation endpoint unless ASYNC_AGGREGATION_VIEWS says otherwise.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
+os.environ.setdefault("ASYNC_AGGREGATION_VIEWS", "True")
+
+application = get_asgi_application()
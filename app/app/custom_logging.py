@@ -2,13 +2,37 @@
 from __future__ import unicode_literals
 
 
+# Every record is handed over to the `queue` handler, whose background thread writes it to the console and to the
+# files of its logger, the request and task threads never wait on the log I/O
 CUSTOM_LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'filters': {
         'request_id': {
             '()': 'log_request_id.filters.RequestIDFilter'
-        }
+        },
+        'job_id': {
+            '()': 'app.log.JobIDFilter'
+        },
+        # Share of the DEBUG records kept per logger, see LOG_DEBUG_SAMPLING
+        'sampling': {
+            '()': 'app.log.SamplingFilter'
+        },
+        'django_records': {
+            'name': 'django'
+        },
+        'file_upload_records': {
+            'name': 'file_upload'
+        },
+        'queue_tasks_records': {
+            'name': 'queue_tasks'
+        },
+        'assets_info_aggregation_records': {
+            'name': 'assets_info_aggregation'
+        },
+        'request_timing_records': {
+            'name': 'request_timing'
+        },
     },
     'formatters': {
         'console_default': {
@@ -22,75 +46,105 @@ CUSTOM_LOGGING = {
         'detail': {
             'format': '\n%(asctime)s [request_id=%(request_id)s] %(message)s',
             'datefmt': '%d-%m-%Y %H:%M:%S',
-        }
+        },
+        'json': {
+            '()': 'app.log.JSONFormatter',
+            'datefmt': '%Y-%m-%dT%H:%M:%S%z',
+        },
     },
     'handlers': {
+        'queue': {
+            '()': 'app.log.QueueListenerHandler',
+            # The records are stamped with the ids of the request or task thread before being queued
+            'filters': ['sampling', 'request_id', 'job_id'],
+            'handlers': [
+                'cfg://handlers.console',
+                'cfg://handlers.file',
+                'cfg://handlers.mail_admins',
+                'cfg://handlers.file_upload',
+                'cfg://handlers.queue_tasks',
+                'cfg://handlers.assets_info_aggregation',
+                'cfg://handlers.request_timing',
+            ],
+        },
         'console': {
             'level': 'INFO',
-            'filters': ['request_id'],
             'class': 'logging.StreamHandler',
             'formatter': 'console_default'
         },
         'file': {
             'level': 'DEBUG',
-            'filters': ['request_id'],
+            'filters': ['django_records'],
             'class': 'logging.FileHandler',
-            'formatter': 'detail',
+            'formatter': 'json',
             'filename': 'logs/debug.log',
         },
         'mail_admins': {
             'level': 'ERROR',
-            'filters': ['request_id'],
+            'filters': ['django_records'],
             'formatter': 'detail',
             'class': 'django.utils.log.AdminEmailHandler',
             'include_html': True,
         },
         'file_upload': {
             'level': 'DEBUG',
-            'filters': ['request_id'],
-            'formatter': 'detail',
+            'filters': ['file_upload_records'],
+            'formatter': 'json',
             'class': 'logging.FileHandler',
             'filename': 'logs/file_upload.log',
         },
         'queue_tasks': {
             'level': 'DEBUG',
-            'filters': ['request_id'],
-            'formatter': 'detail',
+            'filters': ['queue_tasks_records'],
+            'formatter': 'json',
             'class': 'logging.FileHandler',
             'filename': 'logs/queue_tasks.log',
         },
         'assets_info_aggregation': {
             'level': 'DEBUG',
-            'filters': ['request_id'],
-            'formatter': 'detail',
+            'filters': ['assets_info_aggregation_records'],
+            'formatter': 'json',
             'class': 'logging.FileHandler',
             'filename': 'logs/assets_info_aggregation.log',
         },
+        'request_timing': {
+            'level': 'DEBUG',
+            'filters': ['request_timing_records'],
+            'formatter': 'json',
+            'class': 'logging.FileHandler',
+            'filename': 'logs/request_timing.log',
+        },
     },
+    # The loggers writing to their own file don't propagate, so their records are queued once
     'loggers': {
         '': {
-            'handlers': ['console'],
+            'handlers': ['queue'],
             'level': 'DEBUG',
         },
         'django': {
-            'handlers': ['file', 'mail_admins'],
+            'handlers': ['queue'],
             'level': 'DEBUG',
-            'propagate': True,
+            'propagate': False,
         },
         'file_upload': {
-            'handlers': ['file_upload'],
+            'handlers': ['queue'],
             'level': 'DEBUG',
-            'propagate': True,
+            'propagate': False,
         },
         'queue_tasks': {
-            'handlers': ['queue_tasks'],
+            'handlers': ['queue'],
             'level': 'DEBUG',
-            'propagate': True,
+            'propagate': False,
         },
         'assets_info_aggregation': {
-            'handlers': ['assets_info_aggregation'],
+            'handlers': ['queue'],
+            'level': 'DEBUG',
+            'propagate': False,
+        },
+        'request_timing': {
+            'handlers': ['queue'],
             'level': 'DEBUG',
-            'propagate': True,
+            'propagate': False,
         },
     },
 }
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import contextvars
+import copy
+import json
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import os
+import queue
+import random
+import weakref
+
+from django.conf import settings
+
+
+# Id of the celery task being run, stamped on its log records next to the request id of the requests
+_job_id = contextvars.ContextVar("job_id", default=None)
+# Every queue handler of the process, so their pending records can be flushed before the process exits
+_queue_handlers = weakref.WeakSet()
+
+
+def set_job_id(job_id):
+    """
+    :param job_id: id of the job whose records are logged from now on in the current context, None once it's over
+    """
+    _job_id.set(job_id)
+
+
+def bind_task_job_id(task_id=None, **kwargs):
+    """
+    `task_prerun` receiver stamping the records of the task about to run with its id
+    """
+    set_job_id(task_id)
+
+
+def unbind_task_job_id(**kwargs):
+    """
+    `task_postrun` receiver
+    """
+    set_job_id(None)
+
+
+def flush_logs(**kwargs):
+    """
+    Writes the pending records of every queue handler and stops their listeners, the listeners start again with the
+    next record. Meant for the processes exiting without running the `atexit` hooks, e.g. the celery workers children.
+    """
+    for handler in list(_queue_handlers):
+        handler.stop_listener()
+
+
+class JobIDFilter(logging.Filter):
+    """
+    Stamps the records with the id of the job being run, see `set_job_id()`
+    """
+
+    def filter(self, record):
+        record.job_id = _job_id.get() or getattr(settings, "NO_REQUEST_ID", "none")
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a share of the DEBUG records of the loggers listed in LOG_DEBUG_SAMPLING as `logger=rate` entries, e.g.
+    `assets_info_aggregation=0.1`, the rate of a logger applies to its children. Records of the other levels and
+    loggers are all kept.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        if rates is None:
+            rates = dict(entry.split("=", 1) for entry in getattr(settings, "LOG_DEBUG_SAMPLING", []))
+        self.rates = {name.strip(): float(rate) for name, rate in rates.items()}
+        self._logger_rates = {}
+
+    def rate(self, name):
+        """
+        :param name: name of the logger
+        :return: share of the DEBUG records of the logger to keep, the one of its closest sampled ancestor
+        """
+        if name not in self._logger_rates:
+            ancestor = name
+            while ancestor and ancestor not in self.rates:
+                ancestor = ancestor.rpartition(".")[0]
+            self._logger_rates[name] = self.rates.get(ancestor, 1.0)
+
+        return self._logger_rates[name]
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+
+        rate = self.rate(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Formats the records as one JSON object per line, carrying the request and job ids they were logged for and the
+    structured `data` given through `extra` if any
+    """
+
+    def format(self, record):
+        payload = {
+            "timestamp": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "job_id": getattr(record, "job_id", None),
+        }
+        if getattr(record, "data", None) is not None:
+            payload["data"] = record.data
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(payload, default=str)
+
+
+class QueueListenerHandler(QueueHandler):
+    """
+    Hands the records over to a background thread writing them through `handlers`, so the file, console and email
+    I/O never slows down the request or task that logged them. When the queue is full, the records are dropped rather
+    than waited on.
+
+    Configured through `()`, with the handlers given as `cfg://handlers.<name>` references, resolved once the first
+    record is logged so they are configured whatever their order:
+
+        "queue": {"()": "app.log.QueueListenerHandler", "handlers": ["cfg://handlers.console"]}
+    """
+
+    def __init__(self, handlers, queue_size=10000, respect_handler_level=True):
+        super().__init__(queue.Queue(queue_size))
+        self.queue_size = queue_size
+        self.target_handlers = handlers
+        self.respect_handler_level = respect_handler_level
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        _queue_handlers.add(self)
+
+    def start_listener(self):
+        # The listener thread of the parent process isn't carried over to the forked ones
+        if self._pid != os.getpid():
+            self.queue = queue.Queue(self.queue_size)
+            # Indexing resolves the `cfg://` references, iterating doesn't
+            handlers = [self.target_handlers[index] for index in range(len(self.target_handlers))]
+            self._listener = QueueListener(self.queue, *handlers, respect_handler_level=self.respect_handler_level)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def stop_listener(self):
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+        self._listener = self._pid = None
+
+    def prepare(self, record):
+        """
+        Unlike `QueueHandler.prepare()`, keeps the exception of the record: it never leaves the process, so the target
+        handlers get to format it their own way, e.g. the JSON `exception` field or the frames of the admins emails
+        :param record: the record being logged
+        :return: copy of the record with its message merged with its arguments, which may change once queued
+        """
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def emit(self, record):
+        self.start_listener()
+        super().emit(record)
+
+    def close(self):
+        self.stop_listener()
+        super().close()
@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from decouple import config
+from celery.schedules import crontab
+from decouple import Csv, config
 import os
 
 from ..custom_logging import CUSTOM_LOGGING
@@ -40,6 +41,8 @@ INSTALLED_APPS += USER_DEFINED_APPS
 MIDDLEWARE = [
     # https://github.com/dabapps/django-log-request-id
     'log_request_id.middleware.RequestIDMiddleware',
+    # Right after the request id is set, so every other middleware is timed too
+    'core.middleware.RequestTimingMiddleware',
 
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -48,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.ReplicaReadsMiddleware',
 ]
 
 ROOT_URLCONF = 'app.urls'
@@ -69,6 +73,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'app.wsgi.application'
+ASGI_APPLICATION = 'app.asgi.application'
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
@@ -111,8 +116,40 @@ MEDIA_URL = '/media/'
 STATIC_ROOT = '/app/staticfiles'
 MEDIA_ROOT = '/app/mediafiles'
 
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
+# Read replicas, the safe requests of the read only paths below are served by a healthy replica (checked every
+# DATABASE_REPLICA_HEALTH_INTERVAL seconds, lagging at most DATABASE_REPLICA_MAX_LAG seconds), all the reads go to the
+# primary for DATABASE_REPLICA_STICKY_SECONDS after an import, flagged by the workers through the shared cache
+DATABASE_ROUTERS = ['core.routers.ReadReplicaRouter']
+DATABASE_REPLICAS = config('DATABASE_REPLICAS', default='', cast=Csv())
+DATABASE_REPLICA_PATHS = [
+    r'^/api/secure/v\d+/(assets|portfolios|leases|forecast)/',
+    r'^/(admin|secure-portal)/core/\w+/$',
+]
+DATABASE_REPLICA_HEALTH_INTERVAL = config('DATABASE_REPLICA_HEALTH_INTERVAL', default=10, cast=int)
+DATABASE_REPLICA_MAX_LAG = config('DATABASE_REPLICA_MAX_LAG', default=30, cast=int)
+DATABASE_REPLICA_STICKY_SECONDS = config('DATABASE_REPLICA_STICKY_SECONDS', default=30, cast=int)
+
+# The records are written by a background thread, see `app.log`, the DEBUG ones of the loggers listed as
+# `logger=rate` entries (e.g. `assets_info_aggregation=0.1`) are sampled before being formatted
+LOG_DEBUG_SAMPLING = config('LOG_DEBUG_SAMPLING', default='', cast=Csv())
+# Per request queries and timings, sent back in the `Server-Timing` header and logged to `request_timing`, the requests
+# running more than REQUEST_TIMING_QUERY_BUDGET queries or taking more than REQUEST_TIMING_TIME_BUDGET milliseconds are
+# logged as warnings
+REQUEST_TIMING = config('REQUEST_TIMING', default=False, cast=bool)
+REQUEST_TIMING_QUERY_BUDGET = config('REQUEST_TIMING_QUERY_BUDGET', default=50, cast=int)
+REQUEST_TIMING_TIME_BUDGET = config('REQUEST_TIMING_TIME_BUDGET', default=500, cast=int)
 LOGGING = CUSTOM_LOGGING
 
+# Counters, gauges and timings histograms (e.g. of the imports stages) served in the Prometheus text format at
+# `metrics/` when METRICS_ENDPOINT is on. The celery workers children write theirs to METRICS_DIR after every task and
+# the web processes at most every METRICS_WRITE_INTERVAL seconds, it needs to be a directory shared by all of them for
+# their metrics to be served whichever process answers
+METRICS_ENDPOINT = config('METRICS_ENDPOINT', default=False, cast=bool)
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_WRITE_INTERVAL = config('METRICS_WRITE_INTERVAL', default=15, cast=int)
+
 # Django Rest Framework Configurations
 REST_FRAMEWORK = {
     'PAGE_SIZE': 2,
@@ -126,11 +163,67 @@ REST_FRAMEWORK = {
     },
 }
 
+# Assets listing keyset pagination, clients can pick any page size up to the maximum through `page_size`
+ASSETS_PAGE_SIZE = config('ASSETS_PAGE_SIZE', default=50, cast=int)
+ASSETS_MAX_PAGE_SIZE = config('ASSETS_MAX_PAGE_SIZE', default=500, cast=int)
+
+# Maximum number of asset references a single bulk aggregation request can look up
+ASSETS_BULK_LOOKUP_LIMIT = config('ASSETS_BULK_LOOKUP_LIMIT', default=500, cast=int)
+
+# Assets KPIs streaming export, assets are read from a server side cursor and aggregated one chunk at a time
+ASSETS_EXPORT_CHUNK_SIZE = config('ASSETS_EXPORT_CHUNK_SIZE', default=2000, cast=int)
+ASSETS_EXPORT_GZIP = config('ASSETS_EXPORT_GZIP', default=True, cast=bool)
+
+# Cache of the derived results and of the data version they are keyed by, the imports move the version forward from
+# the celery workers so the version keyed caches below need a backend shared with the app (the `core.E001` check fails
+# otherwise), e.g. `django.core.cache.backends.memcached.PyMemcacheCache` at `memcached:11211` with docker compose
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='real-estate-data-processor'),
+    },
+}
+
+# Assets and portfolios aggregation payloads cache, off by default as the payloads are warmed by the workers after
+# every import, which only pays off with a cache shared by the app and the workers
+AGGREGATION_CACHE_TIMEOUT = config('AGGREGATION_CACHE_TIMEOUT', default=0, cast=int)
+# Number of threads warming the payloads of the imported assets and portfolios at once
+CACHE_WARMING_CONCURRENCY = config('CACHE_WARMING_CONCURRENCY', default=2, cast=int)
+
+# Occupancy and rent roll forecast, results are cached per data version, off by default as it needs a shared cache
+FORECAST_MAX_MONTHS = config('FORECAST_MAX_MONTHS', default=120, cast=int)
+FORECAST_CACHE_TIMEOUT = config('FORECAST_CACHE_TIMEOUT', default=0, cast=int)
+
+# In memory columnar KPI engine, every process keeps a snapshot of the units rebuilt whenever the data version moves
+# forward, the aggregation API falls back to SQL when it's disabled or the units don't fit the budget (in MB)
+COLUMNAR_KPI_ENGINE = config('COLUMNAR_KPI_ENGINE', default=False, cast=bool)
+COLUMNAR_KPI_MEMORY_BUDGET = config('COLUMNAR_KPI_MEMORY_BUDGET', default=256, cast=int)
+
+# Async assets aggregation endpoint, on by default when served through `app/asgi.py`, its database work runs in a
+# pool of at most ASYNC_DB_THREADS threads (and connections) per process
+ASYNC_AGGREGATION_VIEWS = config('ASYNC_AGGREGATION_VIEWS', default=False, cast=bool)
+ASYNC_DB_THREADS = config('ASYNC_DB_THREADS', default=8, cast=int)
+
+# Portfolio data sheets imports, the csv sheets are read INGESTION_CHUNK_SIZE rows at a time at first, then the chunks
+# shrink or grow (between INGESTION_MIN_CHUNK_SIZE and INGESTION_MAX_CHUNK_SIZE rows) to keep the memory allocated by
+# an import within INGESTION_MEMORY_BUDGET (in MB). The memory is sampled from the resident memory of the worker child,
+# set INGESTION_TRACE_MEMORY=True to trace every allocation instead, exact but more than twice as slow
+INGESTION_MEMORY_BUDGET = config('INGESTION_MEMORY_BUDGET', default=256, cast=int)
+INGESTION_CHUNK_SIZE = config('INGESTION_CHUNK_SIZE', default=1000, cast=int)
+INGESTION_MIN_CHUNK_SIZE = config('INGESTION_MIN_CHUNK_SIZE', default=100, cast=int)
+INGESTION_MAX_CHUNK_SIZE = config('INGESTION_MAX_CHUNK_SIZE', default=50000, cast=int)
+INGESTION_TRACE_MEMORY = config('INGESTION_TRACE_MEMORY', default=False, cast=bool)
+
 # Admin Panel Typos
 ADMIN_SITE_HEADER = 'Real Estate Admin Panel'
 ADMIN_SITE_TITLE = 'RealEstate'
 ADMIN_INDEX_TITLE = 'RealEstate Administration'
 
+# Admin changelists of the large tables, counted from the planner statistics above ADMIN_EXACT_COUNT_THRESHOLD rows
+# (PostgreSQL only) and logged when slower than ADMIN_SLOW_PAGE_SECONDS
+ADMIN_EXACT_COUNT_THRESHOLD = config('ADMIN_EXACT_COUNT_THRESHOLD', default=10000, cast=int)
+ADMIN_SLOW_PAGE_SECONDS = config('ADMIN_SLOW_PAGE_SECONDS', default=1.0, cast=float)
+
 # Celery configs
 # Send results back as AMQP messages
 CELERY_RESULT_BACKEND = 'rpc://'
@@ -141,6 +234,22 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_PERSISTENT = False
 CELERY_TIMEZONE = 'Africa/Cairo'
 MAX_TASK_RETRIES = 10
+# The workers children keep their database connections open across tasks for WORKER_CONN_MAX_AGE seconds, a
+# connection idle for more than WORKER_CONN_HEALTH_CHECK_INTERVAL seconds is checked before the next task uses it
+WORKER_CONN_MAX_AGE = config('WORKER_CONN_MAX_AGE', default=600, cast=int)
+WORKER_CONN_HEALTH_CHECK_INTERVAL = config('WORKER_CONN_HEALTH_CHECK_INTERVAL', default=30, cast=int)
+
+# Time dependent KPIs recomputation, daily by default after midnight UTC so the year boundary is caught the same
+# night, the asset batches are spread at random over KPI_RECOMPUTE_SPREAD seconds
+KPI_RECOMPUTE_HOUR = config('KPI_RECOMPUTE_HOUR', default='3')
+KPI_RECOMPUTE_MINUTE = config('KPI_RECOMPUTE_MINUTE', default='0')
+KPI_RECOMPUTE_SPREAD = config('KPI_RECOMPUTE_SPREAD', default=600, cast=int)
+CELERY_BEAT_SCHEDULE = {
+    'recompute-time-dependent-kpis': {
+        'task': 'core.tasks.RecomputeTimeDependentKPIsTask',
+        'schedule': crontab(hour=KPI_RECOMPUTE_HOUR, minute=KPI_RECOMPUTE_MINUTE),
+    },
+}
 
 # Email Reporting
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
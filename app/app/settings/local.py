@@ -17,3 +17,9 @@ DATABASES = {
         'PORT': '',
     },
 }
+# Second alias of the same database, set DATABASE_REPLICAS=replica to try the read replica routing locally
+DATABASES['replica'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+
+# SQLite builds the covering indexes of the units without their INCLUDE columns, which only PostgreSQL keeps
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    SILENCED_SYSTEM_CHECKS = ['models.W040']
@@ -16,6 +16,11 @@ DATABASES = {
     }
 }
 
+# Read replicas, one alias per host of DB_REPLICA_HOSTS
+for index, replica_host in enumerate(config('DB_REPLICA_HOSTS', default='', cast=Csv()), start=1):
+    DATABASES[f'replica_{index}'] = {**DATABASES['default'], 'HOST': replica_host}
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
 # SSL
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 SECURE_SSL_REDIRECT = True
@@ -4,7 +4,8 @@ from __future__ import unicode_literals
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
 
-from .models import Asset, Document, Portfolio, Unit
+from ..models import Asset, Document, Portfolio, Unit
+from .performance import AutocompleteFilter, LargeTableAdmin
 
 
 @admin.register(Portfolio)
@@ -14,6 +15,7 @@ class PortfolioAdmin(admin.ModelAdmin):
     """
 
     list_display = ['name', 'created_at', 'updated_at']
+    search_fields = ['name']
     readonly_fields = ['created_at', 'updated_at']
     ordering = ['-updated_at', '-created_at']
     fieldsets = (
@@ -27,15 +29,20 @@ class PortfolioAdmin(admin.ModelAdmin):
 
 
 @admin.register(Asset)
-class AssetAdmin(admin.ModelAdmin):
+class AssetAdmin(LargeTableAdmin):
     """
     Admin model for customizing the Asset admin view
     """
 
     list_display = ['reference', 'portfolio', 'city', 'address', 'zipcode', 'is_restricted', 'year_of_construction']
-    list_filter = ['portfolio__name', 'is_restricted', 'city']
+    list_select_related = ['portfolio']
+    autocomplete_fields = ['portfolio']
+    list_filter = [('portfolio', AutocompleteFilter), 'is_restricted', 'city']
+    # Served by the trigram indexes on PostgreSQL, also used by the autocomplete of the units filter
+    search_fields = ['reference', 'address', 'city']
     readonly_fields = ['created_at', 'updated_at']
-    ordering = ['-updated_at', '-created_at']
+    # Served by the `(updated_at, id)` index, the changelist appends the primary key anyway
+    ordering = ['-updated_at', '-id']
     fieldsets = (
         (None, {
             'fields': list_display
@@ -47,15 +54,18 @@ class AssetAdmin(admin.ModelAdmin):
 
 
 @admin.register(Unit)
-class UnitAdmin(admin.ModelAdmin):
+class UnitAdmin(LargeTableAdmin):
     """
     Admin model for customizing the Unit admin view
     """
 
     list_display = ['reference', 'asset', 'unit_type', 'size', 'is_rented', 'tenant', 'rent', 'lease_end']
-    list_filter = ['asset__reference', 'unit_type', 'is_rented']
+    list_select_related = ['asset']
+    autocomplete_fields = ['asset']
+    list_filter = [('asset', AutocompleteFilter), 'unit_type', 'is_rented']
     readonly_fields = ['created_at', 'updated_at']
-    ordering = ['-updated_at', '-created_at']
+    # Latest units first straight from the primary key, there's no index on the update time of the units
+    ordering = ['-id']
     fieldsets = (
         (None, {
             'fields': ('asset', 'reference', 'unit_type', 'size', 'is_rented', 'tenant', 'rent')
@@ -72,7 +82,8 @@ class DocumentAdmin(admin.ModelAdmin):
     Admin model for customizing the Document admin view
     """
 
-    list_display = ['file']
+    list_display = ['file', 'peak_memory', 'created_at']
+    readonly_fields = ['peak_memory', 'chunk_sizes']
 
     def has_add_permission(self, request):
         """Prevent admin users from uploading sheets from the admin view"""
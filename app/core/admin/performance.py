@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from contextlib import ExitStack
+import logging
+import time
+
+from django import forms
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.utils import get_fields_from_path
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models.query import QuerySet
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+
+from ..metrics import METRICS
+
+
+ADMIN_PERFORMANCE_LOGGER = logging.getLogger("admin_performance")
+
+
+def estimated_count(queryset):
+    """
+    :param queryset: the rows to count
+    :return: the number of rows the PostgreSQL planner expects the queryset to return, read from the table statistics
+        instead of scanning the table, None on other databases
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class ApproximateCountPaginator(Paginator):
+    """
+    Paginator trusting the planner estimate of the number of rows once it's over ADMIN_EXACT_COUNT_THRESHOLD, the
+    exact `COUNT(*)` of millions of rows would take longer than the page itself. The small results keep their exact
+    count, the planner can be far off on them.
+    """
+
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySet):
+            estimate = estimated_count(self.object_list)
+            if estimate is not None and estimate > settings.ADMIN_EXACT_COUNT_THRESHOLD:
+                return estimate
+
+        return super().count
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """
+    Filter on a foreign key picking the related object through the admin autocomplete, instead of listing every
+    related object as a choice. The admin of the related model needs `search_fields`.
+
+    Usage: `list_filter = [("asset", AutocompleteFilter)]`
+    """
+
+    template = "admin/core/autocomplete_filter.html"
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f"{field_path}__{field.target_field.name}__exact"
+        self.lookup_val = params.get(self.lookup_kwarg)
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.form_field = forms.ModelChoiceField(
+                queryset=field.remote_field.model._default_manager.all(), required=False,
+                widget=AutocompleteSelect(field, model_admin.admin_site)
+        )
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def choices(self, changelist):
+        # The related objects are picked through the widget, the only link left is the one clearing the filter
+        self.query_string = changelist.get_query_string(remove=[self.lookup_kwarg])
+        yield {
+            "selected": self.lookup_val is None,
+            "query_string": self.query_string,
+            "display": _("All"),
+        }
+
+    def widget(self):
+        """
+        :return: the autocomplete select rendered with the selected object, the page is reloaded once another one is
+            picked
+        """
+        return self.form_field.widget.render(self.lookup_kwarg, self.lookup_val, attrs={
+            "class": "admin-autocomplete-filter",
+            "data-lookup": self.lookup_kwarg,
+            "data-query-string": self.query_string,
+            "style": "width: 100%",
+        })
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Admin of the tables grown to millions of rows: foreign keys are expected to be joined through
+    `list_select_related` and filtered through `AutocompleteFilter`, the changelist is paginated without exact
+    counts and the changelists slower than ADMIN_SLOW_PAGE_SECONDS are logged along with their number of queries
+    """
+
+    paginator = ApproximateCountPaginator
+    # Skips the count of the whole table shown next to the filtered one
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        media = super().media
+        for list_filter in self.list_filter:
+            if isinstance(list_filter, (list, tuple)) and issubclass(list_filter[1], AutocompleteFilter):
+                field = get_fields_from_path(self.model, list_filter[0])[-1]
+                # The select2 assets are the same for every autocomplete filter
+                return media + AutocompleteSelect(field, self.admin_site).media + forms.Media(
+                        js=["core/js/autocomplete_filter.js"]
+                )
+
+        return media
+
+    def changelist_view(self, request, extra_context=None):
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        started = time.monotonic()
+        with ExitStack() as stack:
+            # The changelist may read from a replica, see `core.routers`
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_query))
+            response = super().changelist_view(request, extra_context)
+            # The rows are only rendered, and their lazy relations loaded, along with the template
+            if hasattr(response, "render"):
+                response.render()
+        elapsed = time.monotonic() - started
+
+        METRICS.observe("admin_changelist_seconds", elapsed)
+        if elapsed >= settings.ADMIN_SLOW_PAGE_SECONDS:
+            ADMIN_PERFORMANCE_LOGGER.warning(
+                    "[SLOW ADMIN PAGE]\n%s: %.3f seconds, %s queries", request.get_full_path(), elapsed, len(queries)
+            )
+
+        return response
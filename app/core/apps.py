@@ -1,5 +1,21 @@
 from django.apps import AppConfig
+from django.core.signals import request_finished
+from django.db.models.signals import post_delete, post_save, pre_save
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        # Registers the system checks
+        from . import checks
+        from .metrics import write_request_metrics
+        from .models import Unit
+        from .signals import refresh_unit_asset_kpis, remember_unit_asset
+
+        # The assets KPIs follow the units edited one by one, e.g. from the admin
+        pre_save.connect(remember_unit_asset, sender=Unit, dispatch_uid="remember_unit_asset")
+        post_save.connect(refresh_unit_asset_kpis, sender=Unit, dispatch_uid="refresh_unit_asset_kpis_on_save")
+        post_delete.connect(refresh_unit_asset_kpis, sender=Unit, dispatch_uid="refresh_unit_asset_kpis_on_delete")
+        # The web processes share their metrics with the other processes serving `metrics/`
+        request_finished.connect(write_request_metrics, dispatch_uid="write_request_metrics")
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import hashlib
+import time
+
+from django.core.cache import cache
+
+
+DATA_VERSION_CACHE_KEY = "core:data_version"
+
+
+def get_data_version():
+    """
+    The data version identifies the state of the portfolio data, every derived result cached under a key holding it
+    is implicitly invalidated as soon as new data gets imported
+    :return: the current data version
+    """
+    version = cache.get(DATA_VERSION_CACHE_KEY)
+    if version is None:
+        # Seeded from the clock so a version lost to an eviction never resurrects results cached under an older one
+        cache.add(DATA_VERSION_CACHE_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(DATA_VERSION_CACHE_KEY)
+
+    return version
+
+
+def bump_data_version():
+    """
+    Moves the data version forward, to be called whenever the portfolio data changes
+    :return: the new data version
+    """
+    try:
+        return cache.incr(DATA_VERSION_CACHE_KEY)
+    except ValueError:
+        # Not initialized yet or evicted
+        get_data_version()
+        return cache.incr(DATA_VERSION_CACHE_KEY)
+
+
+def versioned_cache_key(prefix, *parts, version=None):
+    """
+    :param prefix: namespace of the cached results
+    :param parts: the parameters the cached result depends on
+    :param version: the data version to bind the key to, defaults to the current one
+    :return: cache key bound to the data version, the parameters are hashed to keep the key backend safe
+    """
+    digest = hashlib.md5(":".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f"core:{prefix}:v{get_data_version() if version is None else version}:{digest}"
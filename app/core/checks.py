@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+
+# Backends whose entries are private to every process, the app and the celery workers never see each other's
+PROCESS_LOCAL_CACHE_BACKENDS = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+# Settings turning on the features that rely on the data version, or other state, shared through the cache
+SHARED_CACHE_SETTINGS = [
+    "AGGREGATION_CACHE_TIMEOUT", "FORECAST_CACHE_TIMEOUT", "COLUMNAR_KPI_ENGINE",
+    # The imports stick the reads to the primary from the workers, see `core.routers.stick_to_primary()`
+    "DATABASE_REPLICAS",
+]
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    The imports move the data version forward from the celery workers, the results cached and the columnar snapshot
+    built by the app under the previous version would be served on and on unless both share the cache. The same goes
+    for the reads the imports stick to the primary.
+    """
+    backend = settings.CACHES["default"]["BACKEND"]
+    enabled = [name for name in SHARED_CACHE_SETTINGS if getattr(settings, name)]
+    if backend not in PROCESS_LOCAL_CACHE_BACKENDS or not enabled:
+        return []
+
+    return [Error(
+            f"{', '.join(enabled)} need a cache shared by the app and the celery workers, {backend} isn't",
+            hint="Point CACHE_BACKEND and CACHE_LOCATION at a shared cache, e.g. the memcached service of the docker "
+                 "compose setup, or turn them off",
+            id="core.E001",
+    )]
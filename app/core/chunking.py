@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+
+class AdaptiveChunkSize:
+    """
+    Number of rows of the next chunk of a job, adapted to the memory the previous chunk took so the job stays within
+    its memory budget whatever the size of its rows: the chunks shrink as soon as one goes over the high watermark of
+    the budget, and grow (at most twice as big at once) while they stay under its low watermark.
+    """
+
+    HIGH_WATERMARK = 0.8
+    LOW_WATERMARK = 0.5
+    MAX_GROWTH = 2
+
+    def __init__(self, budget, size, minimum, maximum):
+        """
+        :param budget: memory the job may take, in bytes
+        :param size: number of rows of the first chunk
+        :param minimum: smallest number of rows of a chunk
+        :param maximum: largest number of rows of a chunk
+        """
+        self.budget = budget
+        self.minimum = minimum
+        self.maximum = maximum
+        self.size = self._bounded(size)
+        # Every size picked in turn, the first one included
+        self.sizes = [self.size]
+
+    def _bounded(self, size):
+        return int(min(max(size, self.minimum), self.maximum))
+
+    def update(self, memory):
+        """
+        :param memory: memory taken by processing the last chunk, in bytes
+        :return: number of rows of the next chunk
+        """
+        # Aims at the middle of the watermarks, so the next chunks don't bounce between shrinking and growing
+        target = self.budget * (self.HIGH_WATERMARK + self.LOW_WATERMARK) / 2
+        if memory > self.budget * self.HIGH_WATERMARK:
+            size = self.size * target / memory
+        elif memory < self.budget * self.LOW_WATERMARK:
+            size = self.size * min(target / memory, self.MAX_GROWTH) if memory else self.size * self.MAX_GROWTH
+        else:
+            size = self.size
+
+        size = self._bounded(size)
+        if size != self.size:
+            self.size = size
+            self.sizes.append(size)
+
+        return self.size
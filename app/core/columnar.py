@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from array import array
+from datetime import datetime, timedelta
+from decimal import Decimal
+import logging
+import threading
+
+import numpy as np
+
+from django.conf import settings
+from django.db.models.functions import ExtractYear
+from django.utils import timezone
+
+from .caching import get_data_version
+from .kpis import compute_asset_kpis, empty_kpis
+from .models import Asset, Unit
+
+
+COLUMNAR_ENGINE_LOGGER = logging.getLogger("columnar_kpi_engine")
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# Marks the units without a lease end and the assets without units in the integer columns
+MISSING = -1
+# size, rent, is_rented and lease end year per unit, asset id, offset and latest update per asset
+UNIT_BYTES = 8 + 8 + 1 + 4
+ASSET_BYTES = 8 + 8 + 8
+# The asset id and update time of every unit are only held while loading
+LOADING_UNIT_BYTES = 8 + 8
+
+
+class MemoryBudgetExceeded(Exception):
+    """Raised while loading a snapshot that wouldn't fit the configured memory budget"""
+
+
+class ColumnarUnits:
+    """
+    Per process columnar snapshot of the units the asset KPIs are derived from.
+
+    The units are sorted by asset and laid out as CSR-like arrays: the units of the asset at position `i` of
+    `asset_ids` are the `offsets[i]:offsets[i + 1]` slice of every unit column, so the KPIs of any set of assets are
+    computed with a handful of vectorized reductions instead of a query.
+    """
+
+    def __init__(self, version, asset_ids, offsets, size, rent_cents, is_rented, lease_end_year, latest_update):
+        self.version = version
+        self.asset_ids = asset_ids
+        self.offsets = offsets
+        self.size = size
+        self.rent_cents = rent_cents
+        self.is_rented = is_rented
+        self.lease_end_year = lease_end_year
+        self.latest_update = latest_update
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in (
+            self.asset_ids, self.offsets, self.size, self.rent_cents, self.is_rented, self.lease_end_year,
+            self.latest_update
+        ))
+
+    @classmethod
+    def load(cls, version, memory_budget):
+        """
+        Streams the units through a server side cursor into compact typed arrays, giving up as soon as they outgrow
+        the memory budget
+        :param version: the data version the snapshot is taken at
+        :param memory_budget: maximum size of the snapshot in bytes
+        :return: the loaded ColumnarUnits
+        """
+        asset_ids = np.fromiter(Asset.objects.order_by("id").values_list("id", flat=True), dtype=np.int64)
+        max_units = (memory_budget - len(asset_ids) * ASSET_BYTES) // (UNIT_BYTES + LOADING_UNIT_BYTES)
+        if max_units < 0:
+            raise MemoryBudgetExceeded(f"{len(asset_ids)} assets")
+
+        # Assets created while loading are left out rather than having their units spill into another asset
+        last_asset_id = asset_ids[-1] if len(asset_ids) else 0
+        units = Unit.objects.filter(asset_id__lte=last_asset_id).order_by("asset_id").annotate(
+                lease_end_year=ExtractYear("lease_end")
+        ).values_list("asset_id", "size", "rent", "is_rented", "lease_end_year", "updated_at")
+
+        unit_assets, size, rent_cents, updated_at = array("q"), array("q"), array("q"), array("q")
+        lease_end_year, is_rented = array("i"), bytearray()
+        for unit_asset, unit_size, rent, rented, end_year, unit_updated_at in units.iterator(chunk_size=2000):
+            if len(size) >= max_units:
+                raise MemoryBudgetExceeded(f"more than {max_units} units")
+
+            unit_assets.append(unit_asset)
+            size.append(unit_size)
+            rent_cents.append(int(rent * 100) if rent is not None else 0)
+            is_rented.append(bool(rented))
+            lease_end_year.append(end_year if end_year is not None else MISSING)
+            updated_at.append((unit_updated_at - EPOCH) // timedelta(microseconds=1) if unit_updated_at else MISSING)
+
+        unit_assets = np.frombuffer(unit_assets, dtype=np.int64)
+        offsets = np.append(np.searchsorted(unit_assets, asset_ids), len(unit_assets)).astype(np.int64)
+        latest_update = np.full(len(asset_ids), MISSING, dtype=np.int64)
+        np.maximum.at(latest_update, np.searchsorted(asset_ids, unit_assets), np.frombuffer(updated_at, dtype=np.int64))
+
+        return cls(
+                version=version,
+                asset_ids=asset_ids,
+                offsets=offsets,
+                size=np.frombuffer(size, dtype=np.int64),
+                rent_cents=np.frombuffer(rent_cents, dtype=np.int64),
+                is_rented=np.frombuffer(bytes(is_rented), dtype=np.bool_),
+                lease_end_year=np.frombuffer(lease_end_year, dtype=np.int32),
+                latest_update=latest_update,
+        )
+
+    def positions(self, asset_ids):
+        """
+        :param asset_ids: array of asset ids
+        :return: tuple of the positions of the assets in the snapshot and the mask of the assets found in it
+        """
+        positions = np.searchsorted(self.asset_ids, asset_ids)
+        found = positions < len(self.asset_ids)
+        found[found] = self.asset_ids[positions[found]] == asset_ids[found]
+        return positions[found], found
+
+    def compute(self, asset_ids, current_year=None):
+        """
+        Computes the raw KPIs of the assets of the snapshot, the same values `compute_asset_kpis()` gets from the
+        database
+        :param asset_ids: ids of the assets to compute the KPIs for
+        :param current_year: the year the remaining lease terms are measured against
+        :return: tuple of the dict mapping every asset id found in the snapshot to its raw KPIs and the missing ids
+        """
+        current_year = current_year or timezone.now().year
+        requested = np.fromiter(asset_ids, dtype=np.int64)
+        positions, found = self.positions(requested)
+
+        # Gather the units of the requested assets, `segment` maps every gathered unit to its requested asset
+        starts = self.offsets[positions]
+        counts = self.offsets[positions + 1] - starts
+        segment = np.repeat(np.arange(len(positions)), counts)
+        units = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+
+        size, rented = self.size[units], self.is_rented[units]
+        end_year = self.lease_end_year[units].astype(np.int64)
+        remaining_years = np.where(end_year == MISSING, current_year, end_year) - current_year
+
+        def segment_sum(values):
+            totals = np.zeros(len(positions), dtype=np.int64)
+            np.add.at(totals, segment, values)
+            return totals
+
+        vacant_units = segment_sum(~rented)
+        rented_units = counts - vacant_units
+        total_rent = segment_sum(np.where(rented, self.rent_cents[units], 0))
+        total_area = segment_sum(size)
+        area_rented = segment_sum(np.where(rented, size, 0))
+        weighted_lease_years = segment_sum(np.where(rented, size * remaining_years, 0))
+
+        asset_kpis = {}
+        for index, asset_id in enumerate(requested[found].tolist()):
+            kpis = empty_kpis()
+            kpis["number_of_units"] = int(counts[index])
+            kpis["vacant_units"] = int(vacant_units[index])
+            kpis["total_area"] = int(total_area[index])
+            # Sums over no rented unit are NULLs in SQL, which are normalized to zeros
+            if rented_units[index]:
+                kpis["total_rent"] = Decimal(int(total_rent[index])).scaleb(-2)
+                kpis["area_rented"] = int(area_rented[index])
+                kpis["weighted_lease_years"] = int(weighted_lease_years[index])
+            if self.latest_update[positions[index]] != MISSING:
+                kpis["latest_update"] = EPOCH + timedelta(microseconds=int(self.latest_update[positions[index]]))
+            asset_kpis[asset_id] = kpis
+
+        return asset_kpis, requested[~found].tolist()
+
+
+_snapshot = None
+_skipped_version = None
+_snapshot_lock = threading.Lock()
+
+
+def get_columnar_units():
+    """
+    :return: the snapshot of the current data version, rebuilt on the first call after the version moved forward,
+        None when the engine is disabled or the units don't fit the memory budget
+    """
+    global _snapshot, _skipped_version
+
+    if not settings.COLUMNAR_KPI_ENGINE:
+        return None
+
+    version = get_data_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    if _skipped_version == version:
+        return None
+
+    with _snapshot_lock:
+        # Another thread may have rebuilt it while this one was waiting
+        if _skipped_version != version and (_snapshot is None or _snapshot.version != version):
+            # Drop the outdated snapshot first, so the old and new ones never add up in memory
+            _snapshot = None
+            try:
+                _snapshot = ColumnarUnits.load(version, settings.COLUMNAR_KPI_MEMORY_BUDGET * 1024 * 1024)
+                _skipped_version = None
+                COLUMNAR_ENGINE_LOGGER.debug(
+                        "[COLUMNAR SNAPSHOT LOADED]\nVersion %s: %s units, %s bytes",
+                        version, len(_snapshot.size), _snapshot.nbytes
+                )
+            except MemoryBudgetExceeded as err:
+                _skipped_version = version
+                COLUMNAR_ENGINE_LOGGER.warning(
+                        "[COLUMNAR SNAPSHOT SKIPPED]\nVersion %s exceeds the memory budget with %s",
+                        version, err.args[0]
+                )
+
+        return _snapshot
+
+
+def columnar_asset_kpis(asset_ids, current_year=None, kpis=None):
+    """
+    Computes the raw KPIs of many assets from the in memory snapshot when the engine is enabled, the assets outside
+    of it are computed by the database
+    :param asset_ids: ids of the assets to compute the KPIs for
+    :param current_year: the year the remaining lease terms are measured against
+    :param kpis: names of the raw aggregates needed, see `compute_asset_kpis()`
+    :return: dict mapping every asset id to its raw KPIs
+    """
+    asset_ids = list(asset_ids)
+    snapshot = get_columnar_units()
+    if snapshot is None or not asset_ids or kpis == set():
+        return compute_asset_kpis(asset_ids, current_year=current_year, kpis=kpis)
+
+    asset_kpis, missing = snapshot.compute(asset_ids, current_year=current_year)
+    if missing:
+        asset_kpis.update(compute_asset_kpis(missing, current_year=current_year, kpis=kpis))
+
+    return asset_kpis
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.utils import OperationalError
+
+from .metrics import METRICS
+
+
+WORKER_CONNECTIONS_LOGGER = logging.getLogger("queue_tasks")
+
+# Postgres refuses new connections with these once max_connections is reached
+EXHAUSTION_ERRORS = ("too many clients", "remaining connection slots are reserved")
+
+# Last time every connection of the process was released by a task, alias: monotonic time
+_last_used = {}
+
+
+def keep_worker_connections(**kwargs):
+    """
+    Lets every celery child keep its database connections open across tasks for WORKER_CONN_MAX_AGE seconds, celery
+    closes them after every task otherwise
+    """
+    for alias in connections:
+        connections[alias].settings_dict["CONN_MAX_AGE"] = settings.WORKER_CONN_MAX_AGE
+
+
+def checkout_connections(sender=None, **kwargs):
+    """
+    Hands the connections of the process over to the next task: a connection idle for more than
+    WORKER_CONN_HEALTH_CHECK_INTERVAL seconds is checked first and replaced when it's gone, and the default one is
+    opened upfront, so the checkout latency covers the reconnections
+    :param sender: the task about to run, eager ones run within the caller's own connections
+    """
+    if getattr(getattr(sender, "request", None), "is_eager", False):
+        return
+
+    started = time.monotonic()
+    for connection in connections.all():
+        idle = started - _last_used.get(connection.alias, 0)
+        if connection.connection is None or idle < settings.WORKER_CONN_HEALTH_CHECK_INTERVAL:
+            continue
+
+        if not connection.is_usable():
+            METRICS.increment("db_connection_failed_checks_total")
+            WORKER_CONNECTIONS_LOGGER.debug("[STALE CONNECTION]\n%s is replaced", connection.alias)
+            connection.close()
+
+    default = connections["default"]
+    try:
+        if default.connection is None:
+            METRICS.increment("db_connections_opened_total")
+        default.ensure_connection()
+    except OperationalError as err:
+        if any(error in str(err) for error in EXHAUSTION_ERRORS):
+            METRICS.increment("db_connections_exhausted_total")
+        WORKER_CONNECTIONS_LOGGER.debug("[CONNECTION FAILED]\n%s", err)
+    finally:
+        METRICS.observe("db_connection_checkout_seconds", time.monotonic() - started)
+
+
+def release_connections(**kwargs):
+    """
+    Marks the connections of the process as idle once a task is over
+    """
+    released = time.monotonic()
+    _last_used.update({connection.alias: released for connection in connections.all()})
+
+
+def log_connection_metrics(**kwargs):
+    WORKER_CONNECTIONS_LOGGER.debug("[CONNECTION METRICS]\n%s", METRICS.snapshot())
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+from functools import partial
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .metrics import METRICS
+
+
+_db_executor = None
+_db_executor_lock = threading.Lock()
+_in_flight = 0
+
+
+def db_executor():
+    """
+    :return: the thread pool the async views run their database work in, shared by the whole process and bounded by
+        ASYNC_DB_THREADS so the in flight requests never hold more database connections than that
+    """
+    global _db_executor
+
+    if _db_executor is None:
+        with _db_executor_lock:
+            if _db_executor is None:
+                _db_executor = ThreadPoolExecutor(max_workers=settings.ASYNC_DB_THREADS, thread_name_prefix="db")
+
+    return _db_executor
+
+
+def _call_with_connections(submitted, func, *args, **kwargs):
+    METRICS.observe("db_executor_checkout_seconds", time.monotonic() - submitted)
+    # The pool threads live longer than the requests, their connections are recycled the way Django does it around
+    # every request
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_db_executor(func, *args, **kwargs):
+    """
+    Runs blocking (database) work from a coroutine without blocking the event loop, the time spent waiting for a free
+    thread and the calls queued because all of them were busy are tracked in the metrics
+    :param func: the callable to run in the database thread pool
+    :return: the result of the callable
+    """
+    global _in_flight
+
+    with _db_executor_lock:
+        if _in_flight >= settings.ASYNC_DB_THREADS:
+            METRICS.increment("db_executor_exhausted_total")
+        _in_flight += 1
+
+    context = contextvars.copy_context()
+    call = partial(context.run, _call_with_connections, time.monotonic(), func, *args, **kwargs)
+    try:
+        return await asyncio.get_event_loop().run_in_executor(db_executor(), call)
+    finally:
+        with _db_executor_lock:
+            _in_flight -= 1
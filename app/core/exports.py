@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import csv
+import json
+import zlib
+
+from .kpis import EXPORT_COLUMNS, iter_asset_kpis_batches
+
+
+CSV_FORMAT = "csv"
+NDJSON_FORMAT = "ndjson"
+EXPORT_CONTENT_TYPES = {
+    CSV_FORMAT: "text/csv; charset=utf-8",
+    NDJSON_FORMAT: "application/x-ndjson; charset=utf-8",
+}
+
+
+class Echo:
+    """
+    File like object that hands back whatever the csv writer writes instead of buffering it
+    """
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(batches):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for rows in batches:
+        yield "".join(writer.writerow([row[column] for column in EXPORT_COLUMNS]) for row in rows)
+
+
+def _ndjson_lines(batches):
+    for rows in batches:
+        yield "".join(json.dumps(row) + "\n" for row in rows)
+
+
+def _gzip(chunks):
+    """
+    :param chunks: the encoded export chunks
+    :return: generator of gzip members flushed after every chunk, so the client keeps receiving bytes
+    """
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def stream_asset_kpis(queryset, export_format, chunk_size, compress=False):
+    """
+    Streams every asset of the queryset along with its KPIs, one chunk of assets at a time
+    :param queryset: the assets to export
+    :param export_format: one of the EXPORT_CONTENT_TYPES formats
+    :param chunk_size: number of assets read from the server side cursor and aggregated at once
+    :param compress: gzip the stream on the fly
+    :return: generator of the encoded export chunks
+    """
+    batches = iter_asset_kpis_batches(queryset, chunk_size)
+    lines = _csv_lines(batches) if export_format == CSV_FORMAT else _ndjson_lines(batches)
+    chunks = (line.encode("utf-8") for line in lines)
+
+    return _gzip(chunks) if compress else chunks
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import namedtuple
+
+import numpy as np
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import FloatField, IntegerField, Value
+from django.db.models.functions import Cast, Coalesce, ExtractMonth, ExtractYear
+from django.utils import timezone
+
+from .caching import versioned_cache_key
+from .models import Asset, Portfolio, Unit
+
+
+DEFAULT_FORECAST_MONTHS = 12
+
+# Leases without a start are already running, leases without an end never expire within the horizon
+OPEN_START_MONTH = 0
+OPEN_END_MONTH = 10 ** 6
+
+UnitColumns = namedtuple(
+        "UnitColumns", ["asset_id", "portfolio_id", "size", "rent", "is_rented", "start_month", "end_month"]
+)
+
+
+def default_forecast_months():
+    """
+    :return: the horizon of the forecasts not asking for one
+    """
+    return min(DEFAULT_FORECAST_MONTHS, settings.FORECAST_MAX_MONTHS)
+
+
+def month_index(date):
+    """
+    :param date: any date or datetime
+    :return: absolute number of months since year 0, so months can be compared and subtracted as integers
+    """
+    return date.year * 12 + date.month - 1
+
+
+def _month_index_expression(field, default):
+    return Coalesce(
+            ExtractYear(field) * Value(12) + ExtractMonth(field) - Value(1), Value(default), output_field=IntegerField()
+    )
+
+
+def load_unit_columns(queryset):
+    """
+    Loads the columns the forecast needs into NumPy arrays with a single query, the lease dates are converted to month
+    indices by the database so no Python date handling happens per unit
+    :param queryset: the units to forecast
+    :return: UnitColumns of equally sized arrays
+    """
+    rows = queryset.order_by().annotate(
+            forecast_rent=Cast(Coalesce("rent", Value(0)), FloatField()),
+            start_month=_month_index_expression("lease_start", OPEN_START_MONTH),
+            end_month=_month_index_expression("lease_end", OPEN_END_MONTH),
+    ).values_list("asset_id", "asset__portfolio_id", "size", "forecast_rent", "is_rented", "start_month", "end_month")
+
+    data = np.array(list(rows), dtype=np.float64).reshape(-1, len(UnitColumns._fields))
+    return UnitColumns(
+            asset_id=data[:, 0].astype(np.int64),
+            portfolio_id=data[:, 1].astype(np.int64),
+            size=data[:, 2],
+            rent=data[:, 3],
+            is_rented=data[:, 4].astype(bool),
+            start_month=data[:, 5].astype(np.int64),
+            end_month=data[:, 6].astype(np.int64),
+    )
+
+
+def monthly_timeline(columns, group_index, groups_count, first_month, months):
+    """
+    Builds the month by month occupied area and contracted rent of every group with interval arithmetic: every lease
+    adds its size and rent on its first month and removes them the month after its last one, a cumulative sum over
+    those events then yields the running totals
+    :param columns: UnitColumns of the units
+    :param group_index: array mapping every unit to its group, in `[0, groups_count)`
+    :param groups_count: number of groups
+    :param first_month: month index of the first forecast month
+    :param months: number of forecast months
+    :return: tuple of the (groups_count, months) occupied area and contracted rent arrays
+    """
+    start = np.clip(columns.start_month - first_month, 0, months)
+    stop = np.clip(columns.end_month - first_month + 1, 0, months)
+    active = columns.is_rented & (start < stop)
+
+    area_events = np.zeros((groups_count, months + 1))
+    rent_events = np.zeros((groups_count, months + 1))
+    for events, values in ((area_events, columns.size), (rent_events, columns.rent)):
+        np.add.at(events, (group_index[active], start[active]), values[active])
+        np.add.at(events, (group_index[active], stop[active]), -values[active])
+
+    return np.cumsum(area_events, axis=1)[:, :months], np.cumsum(rent_events, axis=1)[:, :months]
+
+
+def _series(total_area, occupied_area, contracted_rent):
+    return {
+        "total_area": float(total_area),
+        "occupied_area": np.round(occupied_area, 2).tolist(),
+        "contracted_rent": np.round(contracted_rent, 2).tolist(),
+    }
+
+
+def build_forecast(queryset, months, include_assets=False, start=None):
+    """
+    Projects the occupied area and the contracted rent month by month, per portfolio and optionally per asset
+    :param queryset: the units to forecast
+    :param months: forecast horizon in months
+    :param include_assets: also return the series of every asset
+    :param start: first forecast month, defaults to the current month
+    :return: dict of the forecast months and the series of every portfolio
+    """
+    start = start or timezone.localdate()
+    first_month = month_index(start)
+    columns = load_unit_columns(queryset)
+
+    portfolio_ids, portfolio_index = np.unique(columns.portfolio_id, return_inverse=True)
+    portfolio_area = np.bincount(portfolio_index, weights=columns.size, minlength=len(portfolio_ids))
+    occupied, rent = monthly_timeline(columns, portfolio_index, len(portfolio_ids), first_month, months)
+    portfolio_names = dict(Portfolio.objects.filter(id__in=portfolio_ids.tolist()).values_list("id", "name"))
+
+    portfolios = []
+    for index, portfolio_id in enumerate(portfolio_ids.tolist()):
+        portfolios.append({"portfolio": portfolio_names[portfolio_id], **_series(
+                portfolio_area[index], occupied[index], rent[index]
+        )})
+
+    if include_assets:
+        asset_ids, asset_index = np.unique(columns.asset_id, return_inverse=True)
+        asset_area = np.bincount(asset_index, weights=columns.size, minlength=len(asset_ids))
+        asset_occupied, asset_rent = monthly_timeline(columns, asset_index, len(asset_ids), first_month, months)
+        asset_portfolios = np.zeros(len(asset_ids), dtype=np.int64)
+        asset_portfolios[asset_index] = portfolio_index
+        asset_references = dict(Asset.objects.filter(id__in=asset_ids.tolist()).values_list("id", "reference"))
+
+        for portfolio in portfolios:
+            portfolio["assets"] = []
+        for index, asset_id in enumerate(asset_ids.tolist()):
+            portfolios[asset_portfolios[index]]["assets"].append({"asset": asset_references[asset_id], **_series(
+                    asset_area[index], asset_occupied[index], asset_rent[index]
+            )})
+
+    return {
+        "months": [f"{(first_month + offset) // 12}-{(first_month + offset) % 12 + 1:02d}" for offset in range(months)],
+        "portfolios": portfolios,
+    }
+
+
+def forecast_units(portfolio_name=None, asset_ref=None):
+    """
+    :param portfolio_name: restricts the units to one portfolio if given
+    :param asset_ref: restricts the units to one asset if given
+    :return: the units to forecast
+    """
+    queryset = Unit.objects.all()
+    if portfolio_name:
+        queryset = queryset.filter(asset__portfolio__name=portfolio_name)
+    if asset_ref:
+        queryset = queryset.filter(asset__reference=asset_ref)
+
+    return queryset
+
+
+def cached_forecast(months, portfolio_name=None, asset_ref=None, include_assets=False, version=None, refresh=False):
+    """
+    Builds the forecast, or reads it from the cache when the same forecast was built for the data version
+    :param months: forecast horizon in months
+    :param portfolio_name: restricts the forecast to one portfolio if given
+    :param asset_ref: restricts the forecast to one asset if given
+    :param include_assets: also return the series of every asset
+    :param version: the data version to cache the forecast for, defaults to the current one
+    :param refresh: rebuild the forecast even if it is cached already
+    :return: the forecast payload
+    """
+    start = timezone.localdate().replace(day=1)
+    cache_key = versioned_cache_key(
+            "forecast", start, months, portfolio_name, asset_ref, include_assets, version=version
+    )
+    if settings.FORECAST_CACHE_TIMEOUT and not refresh:
+        payload = cache.get(cache_key)
+        if payload is not None:
+            return payload
+
+    payload = build_forecast(
+            forecast_units(portfolio_name, asset_ref), months, include_assets=include_assets, start=start
+    )
+    if settings.FORECAST_CACHE_TIMEOUT:
+        cache.set(cache_key, payload, settings.FORECAST_CACHE_TIMEOUT)
+
+    return payload
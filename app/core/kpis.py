@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import transaction
+from django.db.models import Count, F, FloatField, IntegerField, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, ExtractYear, NullIf
+from django.utils import timezone
+
+from .models import AssetKPI, AssetKPISnapshot, Unit
+
+
+KPI_DATE_FORMAT = "%d.%m.%Y"
+KPI_REFRESH_BATCH_SIZE = 500
+EXPORT_ASSET_FIELDS = ["id", "reference", "address", "zipcode", "city", "year_of_construction", "is_restricted",
+                       "updated_at"]
+EXPORT_COLUMNS = ["reference", "address", "zipcode", "city", "year_of_construction", "restricted_area",
+                  "number_of_units", "total_rent", "total_area", "area_rented", "vacancy", "walt", "latest_update"]
+
+
+# The raw aggregates every exposed asset KPI is derived from
+KPI_DEPENDENCIES = {
+    "restricted_area": [],
+    "number_of_units": ["number_of_units"],
+    "total_rent": ["total_rent"],
+    "total_area": ["total_area"],
+    "area_rented": ["area_rented"],
+    "vacancy": ["number_of_units", "vacant_units"],
+    "walt": ["area_rented", "total_area", "weighted_lease_years"],
+    "latest_update": ["latest_update"],
+}
+
+
+def required_kpis(fields=None):
+    """
+    :param fields: the exposed KPIs that are requested, None for all of them
+    :return: set of the raw aggregates needed to compute them
+    """
+    fields = KPI_DEPENDENCIES if fields is None else fields
+    return {kpi for field in fields for kpi in KPI_DEPENDENCIES.get(field, [])}
+
+
+def unit_kpi_aggregates(units_path=None, current_year=None, kpis=None):
+    """
+    Builds the aggregate expressions every asset KPI is derived from, so the KPIs of any number of assets (or any
+    grouping of them) are computed by the database in a single GROUP BY query
+    :param units_path: lookup path from the aggregated model to its units, None when aggregating units directly
+    :param current_year: the year the remaining lease terms are measured against, defaults to the current year
+    :param kpis: names of the raw aggregates to build, see `required_kpis()`, None for all of them
+    :return: dict of aggregate expressions ready to be passed to `.annotate()` or `.aggregate()`
+    """
+    current_year = current_year or timezone.now().year
+
+    def lookup(name):
+        return f"{units_path}__{name}" if units_path else name
+
+    rented = Q(**{lookup("is_rented"): True})
+    remaining_years = Coalesce(ExtractYear(lookup("lease_end")), Value(current_year)) - Value(current_year)
+
+    aggregates = {
+        "number_of_units": Count(lookup("id")),
+        "vacant_units": Count(lookup("id"), filter=Q(**{lookup("is_rented"): False})),
+        "total_rent": Sum(lookup("rent"), filter=rented),
+        "total_area": Sum(lookup("size")),
+        "area_rented": Sum(lookup("size"), filter=rented),
+        "weighted_lease_years": Sum(F(lookup("size")) * remaining_years, filter=rented, output_field=IntegerField()),
+        "latest_update": Max(lookup("updated_at")),
+    }
+
+    return aggregates if kpis is None else {name: aggregates[name] for name in kpis}
+
+
+def empty_kpis():
+    """
+    :return: the raw KPIs of an asset without any units
+    """
+    return {
+        "number_of_units": 0,
+        "vacant_units": 0,
+        "total_rent": 0,
+        "total_area": 0,
+        "area_rented": 0,
+        "weighted_lease_years": 0,
+        "latest_update": None,
+    }
+
+
+def normalize_kpis(row):
+    """
+    :param row: raw aggregated values as returned by the database
+    :return: the same values with the SQL NULLs of empty sums replaced by zeros
+    """
+    kpis = empty_kpis()
+    kpis.update({key: value for key, value in row.items() if key in kpis and value is not None})
+    return kpis
+
+
+def kpis_from_instance(instance):
+    """
+    :param instance: model instance annotated with the `unit_kpi_aggregates()` expressions
+    :return: raw KPIs read from the annotations
+    """
+    return normalize_kpis({key: getattr(instance, key, None) for key in empty_kpis()})
+
+
+def compute_asset_kpis(asset_ids, current_year=None, kpis=None):
+    """
+    Computes the raw KPIs of many assets at once
+    :param asset_ids: ids of the assets to compute the KPIs for
+    :param current_year: the year the remaining lease terms are measured against
+    :param kpis: names of the raw aggregates to compute, None for all of them, the others are left to zero
+    :return: dict mapping every asset id to its raw KPIs
+    """
+    asset_ids = list(asset_ids)
+    aggregates = unit_kpi_aggregates(current_year=current_year, kpis=kpis)
+    asset_kpis = {asset_id: empty_kpis() for asset_id in asset_ids}
+    if not asset_ids or not aggregates:
+        return asset_kpis
+
+    # The default Unit ordering would leak into the GROUP BY, hence the empty order_by()
+    rows = Unit.objects.filter(asset_id__in=asset_ids).order_by().values("asset_id").annotate(**aggregates)
+    for row in rows:
+        asset_kpis[row["asset_id"]] = normalize_kpis(row)
+
+    return asset_kpis
+
+
+def refresh_asset_kpis(asset_ids, current_year=None):
+    """
+    Recomputes the precomputed KPIs rows of the given assets, batch by batch with one aggregation query and one
+    bulk write each
+    :param asset_ids: ids of the assets to refresh
+    :param current_year: the year the remaining lease terms are measured against
+    :return: number of refreshed assets
+    """
+    asset_ids = sorted(set(asset_ids))
+    refreshed = 0
+    for start in range(0, len(asset_ids), KPI_REFRESH_BATCH_SIZE):
+        refreshed += _refresh_asset_kpis_batch(asset_ids[start:start + KPI_REFRESH_BATCH_SIZE], current_year)
+
+    return refreshed
+
+
+def _refresh_asset_kpis_batch(asset_ids, current_year):
+    kpis = compute_asset_kpis(asset_ids, current_year=current_year)
+    rows = [
+        AssetKPI(
+                asset_id=asset_id,
+                number_of_units=asset_kpis["number_of_units"],
+                vacant_units=asset_kpis["vacant_units"],
+                total_rent=asset_kpis["total_rent"],
+                total_area=asset_kpis["total_area"],
+                area_rented=asset_kpis["area_rented"],
+                vacancy=vacancy_rate(asset_kpis),
+                walt=walt(asset_kpis),
+                latest_update=asset_kpis["latest_update"],
+        )
+        for asset_id, asset_kpis in kpis.items()
+    ]
+
+    with transaction.atomic():
+        AssetKPI.objects.filter(asset_id__in=kpis).delete()
+        AssetKPI.objects.bulk_create(rows)
+
+    return len(rows)
+
+
+def asset_id_ranges(batch_size=KPI_REFRESH_BATCH_SIZE):
+    """
+    Splits the assets having precomputed KPIs into contiguous id ranges, reading their ids only
+    :param batch_size: number of assets per range
+    :return: generator of `(first_asset_id, last_asset_id)` tuples
+    """
+    batch = []
+    for asset_id in AssetKPI.objects.order_by("asset_id").values_list("asset_id", flat=True).iterator(batch_size):
+        batch.append(asset_id)
+        if len(batch) >= batch_size:
+            yield batch[0], batch[-1]
+            batch = []
+
+    if batch:
+        yield batch[0], batch[-1]
+
+
+def recompute_asset_walt(first_asset_id, last_asset_id, current_year=None):
+    """
+    Recomputes the WALT of the precomputed KPIs of an asset id range with a single set based UPDATE, as it is the only
+    KPI that changes with time alone
+    :param first_asset_id: first asset id of the range
+    :param last_asset_id: last asset id of the range, included
+    :param current_year: the year the remaining lease terms are measured against
+    :return: number of updated assets
+    """
+    weighted_lease_years = Unit.objects.filter(asset_id=OuterRef("asset_id")).order_by().values("asset_id").annotate(
+            **unit_kpi_aggregates(current_year=current_year, kpis=["weighted_lease_years"])
+    ).values("weighted_lease_years")
+
+    # Same as `walt()`: zero whenever there's no rented area or no area at all
+    return AssetKPI.objects.filter(asset_id__gte=first_asset_id, asset_id__lte=last_asset_id).update(
+            walt=Coalesce(
+                    Cast(Subquery(weighted_lease_years), FloatField()) / NullIf(Cast("total_area", FloatField()), 0.0),
+                    Value(0.0)
+            ),
+            updated_at=timezone.now(),
+    )
+
+
+def snapshot_asset_kpis(asset_ids, document=None, snapshot_date=None):
+    """
+    Copies the precomputed KPIs of the given assets into their history, to be called once they are refreshed. A later
+    snapshot of the same day replaces the earlier one
+    :param asset_ids: ids of the assets to snapshot
+    :param document: the imported document the KPIs result from
+    :param snapshot_date: the day of the snapshot, defaults to today
+    :return: number of written snapshots
+    """
+    asset_ids = sorted(set(asset_ids))
+    snapshot_date = snapshot_date or timezone.localdate()
+    written = 0
+    for start in range(0, len(asset_ids), KPI_REFRESH_BATCH_SIZE):
+        batch = asset_ids[start:start + KPI_REFRESH_BATCH_SIZE]
+        rows = [
+            AssetKPISnapshot(
+                    asset_id=asset_kpi.asset_id,
+                    document=document,
+                    snapshot_date=snapshot_date,
+                    number_of_units=asset_kpi.number_of_units,
+                    vacant_units=asset_kpi.vacant_units,
+                    total_rent=asset_kpi.total_rent,
+                    total_area=asset_kpi.total_area,
+                    area_rented=asset_kpi.area_rented,
+                    vacancy=asset_kpi.vacancy,
+                    walt=asset_kpi.walt,
+            )
+            for asset_kpi in AssetKPI.objects.filter(asset_id__in=batch)
+        ]
+
+        with transaction.atomic():
+            AssetKPISnapshot.objects.filter(asset_id__in=batch, snapshot_date=snapshot_date).delete()
+            AssetKPISnapshot.objects.bulk_create(rows)
+        written += len(rows)
+
+    return written
+
+
+def vacancy_rate(kpis):
+    """
+    :param kpis: raw KPIs of an asset or a group of assets
+    :return: percentage of the vacant units out of all units
+    """
+    if kpis["number_of_units"] > 0:
+        return (kpis["vacant_units"] * 100) / kpis["number_of_units"]
+
+    return 0.0
+
+
+def walt(kpis):
+    """
+    :param kpis: raw KPIs of an asset or a group of assets
+    :return: the weighted average lease term in years, weighted by the share of the total area every tenant occupies
+    """
+    if kpis["area_rented"] and kpis["total_area"]:
+        return kpis["weighted_lease_years"] / kpis["total_area"]
+
+    return 0.0
+
+
+def format_vacancy(kpis):
+    """Formats the vacancy rate the way the aggregation API always exposed it"""
+    return f"{round(vacancy_rate(kpis), 2)} %"
+
+
+def format_walt(kpis):
+    """Formats the WALT the way the aggregation API always exposed it"""
+    return f"{round(walt(kpis), 1)} years"
+
+
+def format_latest_update(kpis, fallback):
+    """
+    :param kpis: raw KPIs of an asset or a group of assets
+    :param fallback: the datetime to use when there are no units, usually the asset's own update time
+    :return: the latest update date formatted the way the aggregation API always exposed it
+    """
+    latest_update = kpis["latest_update"] or fallback
+    return latest_update.strftime(KPI_DATE_FORMAT) if latest_update else None
+
+
+def asset_kpis_row(asset_row, kpis):
+    """
+    Flattens an asset with its KPIs into plain numeric values, ready to be written to CSV/NDJSON exports
+    :param asset_row: `.values()` dict of the asset
+    :param kpis: raw KPIs of the asset
+    :return: dict of the asset attributes and its numeric KPIs
+    """
+    latest_update = kpis["latest_update"] or asset_row.get("updated_at")
+
+    return {
+        "reference": asset_row["reference"],
+        "address": asset_row["address"],
+        "zipcode": asset_row["zipcode"],
+        "city": asset_row["city"],
+        "year_of_construction": asset_row["year_of_construction"],
+        "restricted_area": asset_row["is_restricted"],
+        "number_of_units": kpis["number_of_units"],
+        "total_rent": float(kpis["total_rent"]),
+        "total_area": kpis["total_area"],
+        "area_rented": kpis["area_rented"],
+        "vacancy": round(vacancy_rate(kpis), 2),
+        "walt": round(walt(kpis), 1),
+        "latest_update": latest_update.date().isoformat() if latest_update else None,
+    }
+
+
+def iter_asset_kpis_batches(queryset, chunk_size):
+    """
+    Streams the assets of a queryset through a server side cursor and computes their KPIs one batch at a time,
+    so memory stays bounded by the chunk size whatever the number of assets is
+    :param queryset: the assets to go through
+    :param chunk_size: number of assets fetched and aggregated per round trip
+    :return: generator of lists of flattened asset KPIs rows
+    """
+    batch = []
+    for asset_row in queryset.order_by("id").values(*EXPORT_ASSET_FIELDS).iterator(chunk_size=chunk_size):
+        batch.append(asset_row)
+        if len(batch) >= chunk_size:
+            yield _kpis_rows(batch)
+            batch = []
+
+    if batch:
+        yield _kpis_rows(batch)
+
+
+def _kpis_rows(batch):
+    kpis = compute_asset_kpis(asset_row["id"] for asset_row in batch)
+    return [asset_kpis_row(asset_row, kpis[asset_row["id"]]) for asset_row in batch]
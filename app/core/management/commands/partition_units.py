@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.partitioning import (
+    DEFAULT_UNIT_PARTITIONS, PartitioningError, partition_unit_statements, partition_unit_table
+)
+
+
+class Command(BaseCommand):
+    """Django command to hash partition the units table by asset on PostgreSQL"""
+
+    help = (
+        "Django command to convert the units table into a PostgreSQL table hash partitioned by asset, the units "
+        "writes are blocked while it runs, so stop the workers first"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--partitions", type=int, default=DEFAULT_UNIT_PARTITIONS, help="Number of partitions")
+        parser.add_argument("--dry-run", action="store_true", help="Only print the partitioned table definition")
+
+    def handle(self, *args, **options):
+        if options["partitions"] < 2:
+            raise CommandError("At least 2 partitions are needed")
+
+        if options["dry_run"]:
+            self.stdout.write(";\n".join(partition_unit_statements(options["partitions"])) + ";")
+            return
+
+        try:
+            moved = partition_unit_table(options["partitions"])
+        except PartitioningError as err:
+            raise CommandError(err.args[0])
+
+        self.stdout.write(self.style.SUCCESS(f"\nMoved {moved} unit(s) to {options['partitions']} partitions\n"))
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from core.caching import bump_data_version
+from core.kpis import refresh_asset_kpis
+from core.models import Asset
+
+
+class Command(BaseCommand):
+    """Django command to recompute the precomputed KPIs of the assets"""
+
+    help = "Django command to recompute the precomputed KPIs of all the assets or of the given asset references"
+
+    def add_arguments(self, parser):
+        parser.add_argument("asset_refs", nargs="*", help="Only refresh the assets with these references")
+
+    def handle(self, *args, **options):
+        queryset = Asset.objects.all()
+        if options["asset_refs"]:
+            queryset = queryset.filter(reference__in=options["asset_refs"])
+
+        refreshed = refresh_asset_kpis(queryset.values_list("id", flat=True).iterator())
+        # The results cached and the columnar snapshots built from the previous KPIs are stale
+        bump_data_version()
+        self.stdout.write(self.style.SUCCESS(f"\nRefreshed the KPIs of {refreshed} asset(s)\n"))
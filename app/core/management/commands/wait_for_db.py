@@ -3,9 +3,9 @@ from __future__ import unicode_literals
 
 import time
 
-from django.db import connections
+from django.db import DEFAULT_DB_ALIAS, connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 
 class Command(BaseCommand):
@@ -13,14 +13,36 @@ class Command(BaseCommand):
 
     help = "Django command to pause the execution until database is available"
 
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS, help="Alias of the database to wait for")
+        parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for before giving up")
+        parser.add_argument("--max-delay", type=float, default=5, help="Longest pause between two attempts, in seconds")
+
+    def probe(self, database):
+        """
+        :param database: alias of the database to probe
+        :raise OperationalError: the database doesn't accept connections or queries yet
+        """
+        with connections[database].cursor() as cursor:
+            cursor.execute("SELECT 1")
+
     def handle(self, *args, **options):
         self.stdout.write(self.style.ERROR("\nWaiting for database...\n"))
-        db_conn = None
-        while not db_conn:
+        deadline = time.monotonic() + options["timeout"]
+        delay = 0.5
+        while True:
             try:
-                db_conn = connections["default"]
-            except OperationalError :
-                self.stdout.write(self.style.ERROR("\nDatabase unavailable, waiting 1 second...\n"))
-                time.sleep(1)
+                self.probe(options["database"])
+                break
+            except OperationalError:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError(f"Database unavailable after {options['timeout']:g} seconds")
+
+                # Exponential backoff, bounded by the maximum delay and by the time left
+                delay = min(delay, options["max_delay"], remaining)
+                self.stdout.write(self.style.ERROR(f"\nDatabase unavailable, waiting {delay:g} seconds...\n"))
+                time.sleep(delay)
+                delay *= 2
 
         self.stdout.write(self.style.SUCCESS("\nDatabase available!\n"))
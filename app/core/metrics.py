@@ -0,0 +1,446 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import defaultdict
+from contextlib import contextmanager
+import fcntl
+import glob
+import json
+import os
+import re
+import resource
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+
+from django.conf import settings
+
+
+# Upper bounds of the timings histograms buckets, in seconds
+TIMING_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _metric_key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+
+    def escape(value):
+        return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value):
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+class MetricsRegistry:
+    """
+    Process wide counters, gauges and timings, every process (web worker, celery child) keeps its own. They can be
+    given labels as keyword arguments, e.g. `METRICS.increment("ingestion_rows_written_total", outcome="created")`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._timings = {}
+
+    def increment(self, name, value=1, **labels):
+        """
+        :param name: name of the counter
+        :param value: amount to add to the counter
+        """
+        with self._lock:
+            self._counters[_metric_key(name, labels)] += value
+
+    def gauge(self, name, value, **labels):
+        """
+        :param name: name of the gauge
+        :param value: current value of the gauge
+        """
+        with self._lock:
+            self._gauges[_metric_key(name, labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        """
+        :param name: name of the timing
+        :param seconds: duration of one occurrence
+        """
+        key = _metric_key(name, labels)
+        with self._lock:
+            count, total, maximum, buckets = self._timings.get(key, (0, 0.0, 0.0, [0] * len(TIMING_BUCKETS)))
+            for index, bound in enumerate(TIMING_BUCKETS):
+                if seconds <= bound:
+                    buckets[index] += 1
+                    break
+            self._timings[key] = (count + 1, total + seconds, max(maximum, seconds), buckets)
+
+    def snapshot(self):
+        """
+        :return: dict of the counters and gauges values and of the count, sum and max of every timing, the labelled
+            ones keyed as `name{label="value"}`
+        """
+        with self._lock:
+            metrics = {name + _format_labels(labels): value for (name, labels), value in self._counters.items()}
+            metrics.update({name + _format_labels(labels): value for (name, labels), value in self._gauges.items()})
+            for (name, labels), (count, total, maximum, __) in self._timings.items():
+                labels = _format_labels(labels)
+                metrics.update({
+                    f"{name}_count{labels}": count, f"{name}_sum{labels}": total, f"{name}_max{labels}": maximum
+                })
+
+        return metrics
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._timings.clear()
+
+    def dump(self, gauges=True):
+        """
+        :param gauges: whether to include the gauges, which only make sense while the process is alive
+        :return: JSON serializable state of the registry, see `merge()`
+        """
+        with self._lock:
+            return {
+                "counters": [[name, labels, value] for (name, labels), value in self._counters.items()],
+                "gauges": [[name, labels, value] for (name, labels), value in self._gauges.items()] if gauges else [],
+                "timings": [
+                    [name, labels, count, total, maximum, list(buckets)]
+                    for (name, labels), (count, total, maximum, buckets) in self._timings.items()
+                ],
+            }
+
+    def merge(self, state, **labels):
+        """
+        Adds up the counters and timings dumped by another process to the ones of the registry
+        :param state: output of `dump()`
+        :param labels: labels added to the gauges, which are per process and can't be added up
+        """
+        with self._lock:
+            for name, metric_labels, value in state["counters"]:
+                self._counters[_metric_key(name, dict(metric_labels))] += value
+            for name, metric_labels, value in state["gauges"]:
+                self._gauges[_metric_key(name, dict(metric_labels, **labels))] = value
+            for name, metric_labels, count, total, maximum, buckets in state["timings"]:
+                key = _metric_key(name, dict(metric_labels))
+                known = self._timings.get(key, (0, 0.0, 0.0, [0] * len(TIMING_BUCKETS)))
+                self._timings[key] = (
+                    known[0] + count, known[1] + total, max(known[2], maximum),
+                    [known_bucket + bucket for known_bucket, bucket in zip(known[3], buckets)]
+                )
+
+    def render_prometheus(self):
+        """
+        :return: the metrics in the Prometheus text exposition format, the timings as histograms along with a
+            `<name>_max` gauge
+        """
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            timings = sorted(self._timings.items())
+
+        def add(metric_type, name, known_names):
+            if name not in known_names:
+                lines.append(f"# TYPE {name} {metric_type}")
+                known_names.add(name)
+
+        known_names = set()
+        for (name, labels), value in counters:
+            add("counter", name, known_names)
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for (name, labels), value in gauges:
+            add("gauge", name, known_names)
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for (name, labels), (count, total, __, buckets) in timings:
+            add("histogram", name, known_names)
+            cumulative = 0
+            for bound, bucket in zip(TIMING_BUCKETS + (float("inf"),), buckets + [count - sum(buckets)]):
+                cumulative += bucket
+                le_labels = _format_labels(labels + (("le", _format_value(bound)),))
+                lines.append(f"{name}_bucket{le_labels} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        for (name, labels), (__, __, maximum, __) in timings:
+            add("gauge", f"{name}_max", known_names)
+            lines.append(f"{name}_max{_format_labels(labels)} {_format_value(maximum)}")
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, gauges=True, **fields):
+        """
+        Writes the state of the registry to `path`, so the metrics of the other processes can be served along with
+        the ones of the current process, see `collect_metrics()`
+        :param path: file in a directory shared by the processes
+        :param gauges: whether to include the gauges
+        :param fields: identify the process the state is from, e.g. its `host` and `pid`
+        """
+        # Replaced at once so the readers never see a partially written file
+        with open(f"{path}.tmp", "w") as fp:
+            json.dump(dict(self.dump(gauges=gauges), **fields), fp)
+        os.replace(f"{path}.tmp", path)
+
+
+METRICS = MetricsRegistry()
+
+HOSTNAME = socket.gethostname()
+# Name of the metrics file of the current process, along with the pid it was picked by, see `process_metrics_file()`
+_process_file = (None, None)
+_last_write = 0.0
+
+
+def process_metrics_file():
+    """
+    :return: name of the metrics file of the current process, `<host>-<pid>-<token>.json`. The token is drawn anew
+        in every forked process, so a process reusing the pid of a retired one never overwrites its metrics.
+    """
+    global _process_file
+    pid, name = _process_file
+    if pid != os.getpid():
+        _process_file = pid, name = os.getpid(), f"{HOSTNAME}-{os.getpid()}-{uuid.uuid4().hex}.json"
+    return name
+
+
+def _process_is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Alive, run by another user
+        pass
+    return True
+
+
+def _retire_metrics_files(directory, names):
+    """
+    Adds up the counters and timings of the files to the ones of the retired processes of the host, their gauges are
+    left out, then removes the files. Locked, so the files retired by concurrent processes are counted once.
+    :param directory: directory the processes write their metrics to
+    :param names: names of the metrics files of the host processes to retire
+    """
+    retired_path = os.path.join(directory, f"{HOSTNAME}-retired.json")
+    paths = [os.path.join(directory, name) for name in names]
+    with open(os.path.join(directory, f"{HOSTNAME}.lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            registry = MetricsRegistry()
+            for path in [retired_path] + paths:
+                try:
+                    with open(path) as fp:
+                        registry.merge(json.load(fp))
+                except (OSError, ValueError):
+                    # Retired by another process in the meantime
+                    continue
+
+            registry.write(retired_path, gauges=False, host=HOSTNAME)
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def prune_metrics_files(directory):
+    """
+    Retires the metrics files of the processes of the host that are gone, e.g. the celery workers children killed
+    before they could retire by themselves, or the web workers recycled by the app server
+    :param directory: directory the processes write their metrics to
+    """
+    pattern = re.compile(rf"^{re.escape(HOSTNAME)}-(\d+)-[0-9a-f]+\.json$")
+    matches = [pattern.match(name) for name in os.listdir(directory)]
+    names = [match.group(0) for match in matches if match and not _process_is_alive(int(match.group(1)))]
+    if names:
+        _retire_metrics_files(directory, names)
+
+
+def collect_metrics(directory=None):
+    """
+    :param directory: directory the processes write their metrics to, METRICS_DIR by default
+    :return: registry holding the metrics of the current process added up with the ones written by the other
+        processes, their gauges labelled with the `host` and `pid` of the process
+    """
+    directory = settings.METRICS_DIR if directory is None else directory
+    registry = MetricsRegistry()
+    registry.merge(METRICS.dump())
+    if not directory or not os.path.isdir(directory):
+        return registry
+
+    prune_metrics_files(directory)
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        if os.path.basename(path) == process_metrics_file():
+            continue
+        try:
+            with open(path) as fp:
+                state = json.load(fp)
+        except (OSError, ValueError):
+            # Retired or replaced in the meantime
+            continue
+        registry.merge(state, host=state.get("host", ""), pid=state.get("pid", ""))
+
+    return registry
+
+
+def write_metrics_file(directory):
+    """
+    :param directory: directory shared by the processes, the metrics of the current process are written to its
+        `process_metrics_file()`
+    """
+    global _last_write
+    os.makedirs(directory, exist_ok=True)
+    METRICS.write(os.path.join(directory, process_metrics_file()), host=HOSTNAME, pid=os.getpid())
+    _last_write = time.monotonic()
+
+
+def write_process_metrics(**kwargs):
+    """
+    `task_postrun` receiver writing the metrics of the worker child to METRICS_DIR, if set
+    """
+    if settings.METRICS_DIR:
+        write_metrics_file(settings.METRICS_DIR)
+
+
+def write_request_metrics(**kwargs):
+    """
+    `request_finished` receiver writing the metrics of the web process to METRICS_DIR, if set, at most every
+    METRICS_WRITE_INTERVAL seconds, so `metrics/` serves the same metrics whichever process answers it
+    """
+    if settings.METRICS_DIR and time.monotonic() - _last_write >= settings.METRICS_WRITE_INTERVAL:
+        write_metrics_file(settings.METRICS_DIR)
+
+
+def retire_process_metrics(**kwargs):
+    """
+    `worker_process_shutdown` receiver, the counters and timings of the exiting child are kept along with the ones of
+    the retired processes of the host, not its gauges, and the children gone without retiring are retired too
+    """
+    if settings.METRICS_DIR and os.path.isdir(settings.METRICS_DIR):
+        write_metrics_file(settings.METRICS_DIR)
+        _retire_metrics_files(settings.METRICS_DIR, [process_metrics_file()])
+        prune_metrics_files(settings.METRICS_DIR)
+
+
+class StageTimer:
+    """
+    Time spent per stage of one job, the stages run over and over (e.g. once per row) are added up and observed once
+    the job is over, so the histograms compare whole jobs
+    """
+
+    def __init__(self):
+        self.durations = defaultdict(float)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        :param name: name of the stage
+        :return: context manager adding the time spent within the block to the stage
+        """
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.durations[name] += time.monotonic() - started
+
+    def observe(self, name, registry=METRICS):
+        """
+        :param name: name of the timing the stages are observed as, labelled with their `stage`
+        :param registry: registry to observe them in
+        """
+        for stage, seconds in self.durations.items():
+            registry.observe(name, seconds, stage=stage)
+
+
+def resident_memory():
+    """
+    :return: memory resident in RAM of the current process, in bytes, read from `/proc/self/statm` (a few
+        microseconds), or its highest value so far from `getrusage()` where there's no `/proc`
+    """
+    try:
+        with open("/proc/self/statm") as fp:
+            return int(fp.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        # Kilobytes on Linux, bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+class PeakMemory:
+    """
+    Context manager keeping the highest memory taken within the block over what was taken when entering, sampled from
+    the resident memory of the process, numpy (and so pandas) allocations included. Tracing every allocation through
+    `tracemalloc` is more accurate, and slows the block down more than twice, so it's only done when asked for.
+    """
+
+    def __init__(self, trace=None):
+        """
+        :param trace: whether to trace the allocations through `tracemalloc`, INGESTION_TRACE_MEMORY by default
+        """
+        self.trace = settings.INGESTION_TRACE_MEMORY if trace is None else trace
+        self.peak = 0
+        self._baseline = 0
+        self._last_sample = 0
+        self._max_resident = 0
+        self._started = False
+
+    def sample(self):
+        """
+        :return: memory taken when called over what was taken when entering the block, in bytes
+        """
+        if self.trace:
+            current, peak = tracemalloc.get_traced_memory()
+        else:
+            current = peak = resident_memory()
+
+        self.peak = max(self.peak, peak - self._baseline)
+        return max(current - self._baseline, 0)
+
+    def growth(self):
+        """
+        :return: memory taken since the previous call, or since entering the block, in bytes. The resident memory
+            freed by the process is mostly kept for its next allocations rather than given back, its growth is what
+            the work done in between took; the traced memory drops as soon as it's freed, it's taken whole instead
+        """
+        current = self.sample()
+        if self.trace:
+            return current
+
+        growth, self._last_sample = max(current - self._last_sample, 0), current
+        return growth
+
+    def __enter__(self):
+        if not self.trace:
+            self._baseline = resident_memory()
+            self._max_resident = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return self
+
+        self._started = not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start()
+        elif hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        self._baseline = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, *exc_info):
+        self.sample()
+        if not self.trace:
+            # The process highest resident memory moved within the block, a peak missed between the samples
+            max_resident = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            if max_resident > self._max_resident:
+                scale = 1 if sys.platform == "darwin" else 1024
+                self.peak = max(self.peak, max_resident * scale - self._baseline)
+        elif self._started:
+            tracemalloc.stop()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import asyncio
+import logging
+import re
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from .routers import replica_reads, routed_iterator
+from .timing import install_query_recorder, timed_request
+
+
+REQUEST_TIMING_LOGGER = logging.getLogger("request_timing")
+
+
+class ReplicaReadsMiddleware:
+    """
+    Serves the safe requests of the read only paths (DATABASE_REPLICA_PATHS) from a read replica, streaming
+    responses included
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.paths = [re.compile(path) for path in settings.DATABASE_REPLICA_PATHS]
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Lets Django call the middleware without an extra sync/async adaptation
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def is_read_only(self, request):
+        """
+        :param request: the request being served
+        :return: whether the request only reads data
+        """
+        if not settings.DATABASE_REPLICAS or request.method not in ("GET", "HEAD", "OPTIONS"):
+            return False
+        return any(path.match(request.path) for path in self.paths)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not self.is_read_only(request):
+            return self.get_response(request)
+
+        with replica_reads():
+            return self.route_streaming_content(self.get_response(request))
+
+    async def __acall__(self, request):
+        if not self.is_read_only(request):
+            return await self.get_response(request)
+
+        with replica_reads():
+            return self.route_streaming_content(await self.get_response(request))
+
+    def route_streaming_content(self, response):
+        """
+        :param response: the response of the read only request
+        :return: the response, its streaming content if any keeps reading from the replica after the view returned
+        """
+        if response.streaming:
+            response.streaming_content = routed_iterator(response.streaming_content)
+        return response
+
+
+class RequestTimingMiddleware:
+    """
+    Times every request when REQUEST_TIMING is on: number of queries, time spent in the database, serializing and
+    rendering (see `core.timing.timed()`) and in total. The timings are sent back in the `Server-Timing` header and
+    logged along with the request id, as warnings for the requests running more than REQUEST_TIMING_QUERY_BUDGET
+    queries or taking more than REQUEST_TIMING_TIME_BUDGET milliseconds.
+
+    Streaming responses are timed until their first byte.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        connection_created.connect(install_query_recorder)
+        if asyncio.iscoroutinefunction(self.get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        # The connections opened before the middleware was loaded
+        for connection in connections.all():
+            install_query_recorder(None, connection)
+
+        started = time.monotonic()
+        with timed_request() as timings:
+            response = self.get_response(request)
+        return self.report(request, response, timings, time.monotonic() - started)
+
+    async def __acall__(self, request):
+        started = time.monotonic()
+        with timed_request() as timings:
+            response = await self.get_response(request)
+        return self.report(request, response, timings, time.monotonic() - started)
+
+    def report(self, request, response, timings, elapsed):
+        """
+        :param request: the request served
+        :param response: its response
+        :param timings: the `RequestTimings` collected while serving it
+        :param elapsed: the time it took in seconds
+        :return: the response along with its `Server-Timing` header
+        """
+        durations = {"db": 0.0, **timings.spans, "total": elapsed}
+        durations = {name: round(seconds * 1000, 1) for name, seconds in durations.items()}
+        response["Server-Timing"] = ", ".join(
+                f'{name};dur={duration}' + (f';desc="{timings.queries} queries"' if name == "db" else "")
+                for name, duration in durations.items()
+        )
+
+        over_budget = (
+                timings.queries > settings.REQUEST_TIMING_QUERY_BUDGET
+                or durations["total"] > settings.REQUEST_TIMING_TIME_BUDGET
+        )
+        REQUEST_TIMING_LOGGER.log(
+                logging.WARNING if over_budget else logging.DEBUG, "%s\n%s %s: %s queries in %sms",
+                "[REQUEST OVER BUDGET]" if over_budget else "[REQUEST TIMING]", request.method, request.path,
+                timings.queries, durations["total"], extra={"data": {
+                    "request_id": getattr(request, "id", None),
+                    "method": request.method,
+                    "path": request.path,
+                    "status": response.status_code,
+                    "queries": timings.queries,
+                    "over_budget": over_budget,
+                    **{f"{name}_ms": duration for name, duration in durations.items()},
+                }}
+        )
+
+        return response
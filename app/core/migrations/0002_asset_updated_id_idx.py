@@ -0,0 +1,17 @@
+# Generated by Django 3.0 on 2026-10-19 17:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['-updated_at', '-id'], name='core_asset_updated_id_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.0 on 2026-10-19 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_asset_updated_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['city', 'zipcode'], name='core_asset_city_zipcode_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['zipcode'], name='core_asset_zipcode_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['portfolio', 'city', 'zipcode'], name='core_asset_portfolio_geo_idx'),
+        ),
+    ]
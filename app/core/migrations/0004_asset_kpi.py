@@ -0,0 +1,59 @@
+# Generated by Django 3.0 on 2026-10-19 17:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_asset_geo_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssetKPI',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, null=True, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True, null=True, verbose_name='Updated At')),
+                ('asset', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='kpi', serialize=False, to='core.Asset', verbose_name='Asset')),
+                ('number_of_units', models.PositiveIntegerField(default=0, verbose_name='Number Of Units')),
+                ('vacant_units', models.PositiveIntegerField(default=0, verbose_name='Vacant Units')),
+                ('total_rent', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='Total Rent')),
+                ('total_area', models.BigIntegerField(default=0, verbose_name='Total Area')),
+                ('area_rented', models.BigIntegerField(default=0, verbose_name='Area Rented')),
+                ('vacancy', models.FloatField(default=0.0, help_text='Percentage of the vacant units', verbose_name='Vacancy Rate')),
+                ('walt', models.FloatField(default=0.0, help_text='Weighted average lease term in years', verbose_name='WALT')),
+                ('latest_update', models.DateTimeField(blank=True, null=True, verbose_name='Latest Unit Update')),
+            ],
+            options={
+                'verbose_name': 'Asset KPI',
+                'verbose_name_plural': 'Asset KPIs',
+                'get_latest_by': '-updated_at',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='assetkpi',
+            index=models.Index(fields=['number_of_units', 'asset'], name='core_assetkpi_units_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assetkpi',
+            index=models.Index(fields=['total_rent', 'asset'], name='core_assetkpi_rent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assetkpi',
+            index=models.Index(fields=['total_area', 'asset'], name='core_assetkpi_area_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assetkpi',
+            index=models.Index(fields=['area_rented', 'asset'], name='core_assetkpi_rented_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assetkpi',
+            index=models.Index(fields=['vacancy', 'asset'], name='core_assetkpi_vacancy_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assetkpi',
+            index=models.Index(fields=['walt', 'asset'], name='core_assetkpi_walt_idx'),
+        ),
+    ]
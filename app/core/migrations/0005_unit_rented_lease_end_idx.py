@@ -0,0 +1,17 @@
+# Generated by Django 3.0 on 2026-10-19 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_asset_kpi'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='unit',
+            index=models.Index(condition=models.Q(is_rented=True), fields=['lease_end', 'id'], name='core_unit_rented_lease_end_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.0 on 2026-10-19 17:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_unit_rented_lease_end_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssetKPISnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('snapshot_date', models.DateField(verbose_name='Snapshot Date')),
+                ('number_of_units', models.PositiveIntegerField(default=0, verbose_name='Number Of Units')),
+                ('vacant_units', models.PositiveIntegerField(default=0, verbose_name='Vacant Units')),
+                ('total_rent', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='Total Rent')),
+                ('total_area', models.BigIntegerField(default=0, verbose_name='Total Area')),
+                ('area_rented', models.BigIntegerField(default=0, verbose_name='Area Rented')),
+                ('vacancy', models.FloatField(default=0.0, help_text='Percentage of the vacant units', verbose_name='Vacancy Rate')),
+                ('walt', models.FloatField(default=0.0, help_text='Weighted average lease term in years', verbose_name='WALT')),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='kpi_snapshots', to='core.Asset', verbose_name='Asset')),
+                ('document', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='kpi_snapshots', to='core.Document', verbose_name='Document')),
+            ],
+            options={
+                'verbose_name': 'Asset KPI Snapshot',
+                'verbose_name_plural': 'Asset KPI Snapshots',
+                'get_latest_by': 'snapshot_date',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='assetkpisnapshot',
+            constraint=models.UniqueConstraint(fields=('asset', 'snapshot_date'), name='core_assetkpisnapshot_asset_date_uniq'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-19 17:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_asset_kpi_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='unit',
+            index=models.Index(fields=['reference', 'unit_type'], name='core_unit_ref_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='unit',
+            index=models.Index(fields=['asset', 'is_rented', '-updated_at'], include=('size', 'rent', 'lease_end', 'id'), name='core_unit_asset_kpi_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db import migrations
+
+
+# (table, column) pairs searched by `core.search.search_assets()`
+TRIGRAM_INDEXED_COLUMNS = [
+    ('core_asset', 'reference'),
+    ('core_asset', 'address'),
+    ('core_asset', 'city'),
+    ('core_unit', 'tenant'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # Trigram indexes only exist on PostgreSQL, the other databases scan the tables
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            raise ImproperlyConfigured(
+                    "The assets search needs the pg_trgm extension, which this PostgreSQL server doesn't ship: "
+                    "install the contrib modules of the server, e.g. the postgresql-contrib package, then migrate again"
+            )
+
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, column in TRIGRAM_INDEXED_COLUMNS:
+        # Over the same expression the `icontains` lookups are compiled to
+        schema_editor.execute(
+                f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm_idx ON {table} '
+                f'USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    for table, column in TRIGRAM_INDEXED_COLUMNS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_unit_importer_kpi_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-19 17:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_search_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='chunk_sizes',
+            field=models.JSONField(blank=True, default=list, help_text='Number of rows of the chunks picked in turn while the document was processed', verbose_name='Chunk Sizes'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='peak_memory',
+            field=models.BigIntegerField(blank=True, help_text='Highest memory allocated while the document was processed, in bytes', null=True, verbose_name='Peak Memory'),
+        ),
+    ]
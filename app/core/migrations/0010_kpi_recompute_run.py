@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-19 18:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_document_import_memory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KPIRecomputeRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_id', models.CharField(max_length=32, unique=True, verbose_name='Run Id')),
+                ('remaining', models.PositiveIntegerField(verbose_name='Remaining Batches')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+            ],
+            options={
+                'verbose_name': 'KPI Recompute Run',
+                'verbose_name_plural': 'KPI Recompute Runs',
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-19 18:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_kpi_recompute_run'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='unit',
+            name='asset',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='units', to='core.asset', verbose_name='Asset'),
+        ),
+        migrations.AlterField(
+            model_name='unit',
+            name='reference',
+            field=models.CharField(max_length=254, verbose_name='Unit Reference'),
+        ),
+    ]
@@ -4,7 +4,8 @@ from __future__ import unicode_literals
 from datetime import datetime
 
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.utils.translation import gettext_lazy as _
 
 from . import AbstractTimeStamp, AbstractUnitType
@@ -96,6 +97,14 @@ class Asset(AbstractTimeStamp):
         verbose_name_plural = _("Assets")
         get_latest_by = "-updated_at"
         ordering = ["-created_at", "-updated_at"]
+        indexes = [
+            # Serves the keyset pagination of the assets listings
+            models.Index(fields=["-updated_at", "-id"], name="core_asset_updated_id_idx"),
+            # Serve the geographic rollups, globally and within one portfolio
+            models.Index(fields=["city", "zipcode"], name="core_asset_city_zipcode_idx"),
+            models.Index(fields=["zipcode"], name="core_asset_zipcode_idx"),
+            models.Index(fields=["portfolio", "city", "zipcode"], name="core_asset_portfolio_geo_idx"),
+        ]
 
     def __str__(self):
         "String representation for the asset model objects"
@@ -112,12 +121,15 @@ class Unit(AbstractTimeStamp, AbstractUnitType):
             on_delete=models.CASCADE,
             related_name=_("units"),
             verbose_name=_("Asset"),
+            # Led by the asset, core_unit_asset_kpi_idx serves the lookups by asset
+            db_index=False,
             null=False,
             blank=False
     )
     reference = models.CharField(
             _("Unit Reference"),
-            db_index=True,
+            # Led by the reference, core_unit_ref_type_idx serves the lookups by reference
+            db_index=False,
             max_length=254,
             null=False,
             blank=False
@@ -165,12 +177,96 @@ class Unit(AbstractTimeStamp, AbstractUnitType):
         verbose_name_plural = _("Units")
         get_latest_by = "-updated_at"
         ordering = ["-created_at", "-updated_at"]
+        indexes = [
+            # Serves the keyset paginated lease expiry queries, which only ever look at rented units
+            models.Index(
+                    fields=["lease_end", "id"], name="core_unit_rented_lease_end_idx", condition=Q(is_rented=True)
+            ),
+            # Serves the importer's lookup of the existing units
+            models.Index(fields=["reference", "unit_type"], name="core_unit_ref_type_idx"),
+            # Covers the KPI aggregations of given assets, which are then computed by index only scans, and the
+            # latest update per asset
+            models.Index(
+                    fields=["asset", "is_rented", "-updated_at"], include=["size", "rent", "lease_end", "id"],
+                    name="core_unit_asset_kpi_idx"
+            ),
+        ]
 
     def __str__(self):
         """String representation for the unit model objects"""
         return self.reference
 
 
+class AssetKPI(AbstractTimeStamp):
+    """
+    AssetKPI model holds the numeric KPIs of an asset precomputed from its units, so assets can be filtered and
+    sorted by them in the database.
+    """
+
+    asset = models.OneToOneField(
+            Asset,
+            on_delete=models.CASCADE,
+            primary_key=True,
+            related_name="kpi",
+            verbose_name=_("Asset")
+    )
+    number_of_units = models.PositiveIntegerField(
+            _("Number Of Units"),
+            default=0
+    )
+    vacant_units = models.PositiveIntegerField(
+            _("Vacant Units"),
+            default=0
+    )
+    total_rent = models.DecimalField(
+            _("Total Rent"),
+            max_digits=16,
+            decimal_places=2,
+            default=0
+    )
+    total_area = models.BigIntegerField(
+            _("Total Area"),
+            default=0
+    )
+    area_rented = models.BigIntegerField(
+            _("Area Rented"),
+            default=0
+    )
+    vacancy = models.FloatField(
+            _("Vacancy Rate"),
+            default=0.0,
+            help_text=_("Percentage of the vacant units")
+    )
+    walt = models.FloatField(
+            _("WALT"),
+            default=0.0,
+            help_text=_("Weighted average lease term in years")
+    )
+    latest_update = models.DateTimeField(
+            _("Latest Unit Update"),
+            null=True,
+            blank=True
+    )
+
+    class Meta:
+        verbose_name = _("Asset KPI")
+        verbose_name_plural = _("Asset KPIs")
+        get_latest_by = "-updated_at"
+        indexes = [
+            # Every KPI the assets can be filtered and sorted by, the asset is the keyset pagination tie breaker
+            models.Index(fields=["number_of_units", "asset"], name="core_assetkpi_units_idx"),
+            models.Index(fields=["total_rent", "asset"], name="core_assetkpi_rent_idx"),
+            models.Index(fields=["total_area", "asset"], name="core_assetkpi_area_idx"),
+            models.Index(fields=["area_rented", "asset"], name="core_assetkpi_rented_idx"),
+            models.Index(fields=["vacancy", "asset"], name="core_assetkpi_vacancy_idx"),
+            models.Index(fields=["walt", "asset"], name="core_assetkpi_walt_idx"),
+        ]
+
+    def __str__(self):
+        """String representation for the asset kpi model objects"""
+        return str(self.asset_id)
+
+
 class Document(AbstractTimeStamp):
     """
     Document model is responsible for validating and saving the portfolio data to be processed.
@@ -183,6 +279,18 @@ class Document(AbstractTimeStamp):
             null=False,
             blank=False
     )
+    peak_memory = models.BigIntegerField(
+            _("Peak Memory"),
+            null=True,
+            blank=True,
+            help_text=_("Highest memory allocated while the document was processed, in bytes")
+    )
+    chunk_sizes = models.JSONField(
+            _("Chunk Sizes"),
+            default=list,
+            blank=True,
+            help_text=_("Number of rows of the chunks picked in turn while the document was processed")
+    )
 
     class Meta:
         verbose_name = _("Document")
@@ -193,3 +301,114 @@ class Document(AbstractTimeStamp):
     def __str__(self):
         """String representation for the document model objects"""
         return self.file.name
+
+
+class AssetKPISnapshot(models.Model):
+    """
+    AssetKPISnapshot model keeps the numeric KPIs an asset had after an import, so their history survives the units
+    being overwritten in place by the following imports.
+    """
+
+    asset = models.ForeignKey(
+            Asset,
+            on_delete=models.CASCADE,
+            related_name="kpi_snapshots",
+            verbose_name=_("Asset")
+    )
+    document = models.ForeignKey(
+            Document,
+            on_delete=models.SET_NULL,
+            related_name="kpi_snapshots",
+            null=True,
+            blank=True,
+            verbose_name=_("Document")
+    )
+    snapshot_date = models.DateField(
+            _("Snapshot Date")
+    )
+    number_of_units = models.PositiveIntegerField(
+            _("Number Of Units"),
+            default=0
+    )
+    vacant_units = models.PositiveIntegerField(
+            _("Vacant Units"),
+            default=0
+    )
+    total_rent = models.DecimalField(
+            _("Total Rent"),
+            max_digits=16,
+            decimal_places=2,
+            default=0
+    )
+    total_area = models.BigIntegerField(
+            _("Total Area"),
+            default=0
+    )
+    area_rented = models.BigIntegerField(
+            _("Area Rented"),
+            default=0
+    )
+    vacancy = models.FloatField(
+            _("Vacancy Rate"),
+            default=0.0,
+            help_text=_("Percentage of the vacant units")
+    )
+    walt = models.FloatField(
+            _("WALT"),
+            default=0.0,
+            help_text=_("Weighted average lease term in years")
+    )
+
+    class Meta:
+        verbose_name = _("Asset KPI Snapshot")
+        verbose_name_plural = _("Asset KPI Snapshots")
+        get_latest_by = "snapshot_date"
+        constraints = [
+            # One snapshot per asset and day, its index turns the trend of an asset into a range scan
+            models.UniqueConstraint(fields=["asset", "snapshot_date"], name="core_assetkpisnapshot_asset_date_uniq"),
+        ]
+
+    def __str__(self):
+        """String representation for the asset kpi snapshot model objects"""
+        return f"{self.asset_id} @ {self.snapshot_date}"
+
+
+class KPIRecomputeRun(models.Model):
+    """
+    KPIRecomputeRun model counts down the batches of a time dependent KPIs recomputation still to run, the workers
+    running them all see the same row whatever their cache.
+    """
+
+    run_id = models.CharField(
+            _("Run Id"),
+            max_length=32,
+            unique=True
+    )
+    remaining = models.PositiveIntegerField(
+            _("Remaining Batches")
+    )
+    created_at = models.DateTimeField(
+            _("Created At"),
+            auto_now_add=True
+    )
+
+    class Meta:
+        verbose_name = _("KPI Recompute Run")
+        verbose_name_plural = _("KPI Recompute Runs")
+
+    def __str__(self):
+        """String representation for the kpi recompute run model objects"""
+        return self.run_id
+
+    @classmethod
+    def count_down(cls, run_id):
+        """
+        Takes one batch off the run within a single UPDATE, the row stays locked until the end of the transaction so
+        concurrent batches never read the same count
+        :param run_id: identifies the recomputation run
+        :return: number of batches still to run, None if the run is gone
+        """
+        with transaction.atomic():
+            if not cls.objects.filter(run_id=run_id, remaining__gt=0).update(remaining=F("remaining") - 1):
+                return None
+            return cls.objects.filter(run_id=run_id).values_list("remaining", flat=True).get()
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from urllib import parse
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import F, Q
+from django.utils.translation import gettext as _
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Keyset (seek) pagination over a composite `(field, id)` ordering.
+
+    Unlike `PageNumberPagination` it never runs an OFFSET scan: every page is fetched with a
+    `WHERE (field, id) < (last_field, last_id)` predicate that can be served straight from a composite index,
+    so walking the last page costs the same as walking the first one. The total count is skipped unless the
+    client explicitly asks for it.
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    count_query_param = "with_count"
+    invalid_cursor_message = _("Invalid cursor")
+
+    # The tie breaker has to be unique, so the last ordering column is always the primary key
+    ordering = ("-updated_at", "-id")
+
+    # Fall back to the ASSETS_PAGE_SIZE/ASSETS_MAX_PAGE_SIZE settings when left unset
+    page_size = None
+    max_page_size = None
+
+    def get_ordering(self, request, queryset, view):
+        """
+        :return: the `(field, id)` ordering the keyset is built on, views may override it through `keyset_ordering`
+        """
+        return getattr(view, "keyset_ordering", None) or self.ordering
+
+    def get_link_params(self, request, view):
+        """
+        :return: query parameters the pagination links carry on top of the ones of the request, views give them
+            through `link_params`, e.g. the filters read from the request body that the following pages need too
+        """
+        return getattr(view, "link_params", None) or {}
+
+    def get_page_size(self, request):
+        """
+        :param request: the request object being served
+        :return: the client selected page size capped by the server maximum
+        """
+        page_size = self.page_size or settings.ASSETS_PAGE_SIZE
+        max_page_size = self.max_page_size or settings.ASSETS_MAX_PAGE_SIZE
+
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                        request.query_params[self.page_size_query_param], strict=True, cutoff=max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+
+        return min(page_size, max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        for key, value in self.get_link_params(request, view).items():
+            self.base_url = replace_query_param(self.base_url, key, value)
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+        # Whether the first ordering field may be NULL, those rows are then walked last
+        self.nullable = getattr(view, "keyset_nullable", False)
+        self.cursor = self.decode_cursor(request)
+        self.count = queryset.count() if self._wants_count(request) else None
+
+        is_reversed = bool(self.cursor and self.cursor["reverse"])
+        ordering = [self._invert(field) for field in self.ordering] if is_reversed else list(self.ordering)
+        queryset = queryset.order_by(*self._order_by(ordering, is_reversed))
+
+        if self.cursor:
+            try:
+                queryset = queryset.filter(self._seek_filter(ordering, self.cursor["position"], is_reversed))
+            except (TypeError, ValueError, DjangoValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        # Fetch one extra row to know whether there is a following page without counting
+        results = list(queryset[:self.page_size + 1])
+        has_following = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if is_reversed:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_following
+        else:
+            self.has_next, self.has_previous = has_following, self.cursor is not None
+
+        return self.page
+
+    def get_paginated_response(self, data):
+        payload = [("next", self.get_next_link()), ("previous", self.get_previous_link()), ("results", data)]
+        if self.count is not None:
+            payload.insert(0, ("count", self.count))
+
+        return Response(OrderedDict(payload))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "count": {"type": "integer", "example": 123},
+                "next": {"type": "string", "nullable": True},
+                "previous": {"type": "string", "nullable": True},
+                "results": schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self._position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self._position(self.page[0]), reverse=True)
+
+    def decode_cursor(self, request):
+        """
+        :param request: the request object being served
+        :return: the decoded cursor dict or None for the first page
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            tokens = parse.parse_qs(b64decode(encoded.encode("ascii")).decode("ascii"), keep_blank_values=True)
+            position = tokens["p"]
+            reverse = bool(int(tokens.get("r", ["0"])[0]))
+            if int(tokens.get("n", ["0"])[0]):
+                position[0] = None
+        except (TypeError, ValueError, KeyError, IndexError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        return {"position": position, "reverse": reverse}
+
+    def encode_cursor(self, position, reverse):
+        """
+        :param position: the ordering values of the boundary row
+        :param reverse: whether the cursor walks backwards
+        :return: the absolute url of the page addressed by the cursor
+        """
+        tokens = [("p", "" if value is None else value) for value in position]
+        if reverse:
+            tokens.append(("r", "1"))
+        if position[0] is None:
+            tokens.append(("n", "1"))
+
+        encoded = b64encode(parse.urlencode(tokens, doseq=True).encode("ascii")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def _wants_count(self, request):
+        return request.query_params.get(self.count_query_param, "").lower() in ("1", "true", "yes")
+
+    def _position(self, row):
+        """
+        :param row: a model instance or a `.values()` dict of the page
+        :return: the string encoded ordering values of the row
+        """
+        values = []
+        for field in self.ordering:
+            name = field.lstrip("-")
+            if isinstance(row, dict):
+                value = row[name]
+            else:
+                # Follow the related lookups, e.g. `kpi__vacancy`, the relations are expected to be select related
+                value = row
+                for attribute in name.split("__"):
+                    value = getattr(value, attribute)
+            if value is None:
+                values.append(None)
+            else:
+                values.append(value.isoformat() if hasattr(value, "isoformat") else str(value))
+
+        return values
+
+    def _order_by(self, ordering, is_reversed):
+        """
+        :param ordering: the effective ordering of the queryset
+        :param is_reversed: whether the pages are walked backwards
+        :return: the `order_by()` arguments, the NULL values of a nullable first field sorted after the other ones
+        """
+        if not self.nullable:
+            return ordering
+
+        field, *others = ordering
+        expression = F(field.lstrip("-"))
+        # Walked backwards, the NULL values come first so that they still are the last ones once the page is reversed
+        nulls = {"nulls_first": True} if is_reversed else {"nulls_last": True}
+        return [expression.desc(**nulls) if field.startswith("-") else expression.asc(**nulls), *others]
+
+    def _seek_filter(self, ordering, position, is_reversed=False):
+        """
+        Builds the row value comparison `(a, id) < (x, y)` as `a < x OR (a = x AND id < y)`, the NULL values of a
+        nullable first field sorting after all the other ones
+        :param ordering: the effective ordering of the queryset
+        :param position: the boundary values taken from the cursor
+        :param is_reversed: whether the pages are walked backwards
+        :return: Q object that selects the rows after the boundary
+        """
+        (field, tie_breaker), (value, tie_value) = ordering, position
+        name = field.lstrip("-")
+        field_lookup = f"{name}__{'lt' if field.startswith('-') else 'gt'}"
+        tie_lookup = f"{tie_breaker.lstrip('-')}__{'lt' if tie_breaker.startswith('-') else 'gt'}"
+
+        if value is None:
+            after = Q(**{f"{name}__isnull": True, tie_lookup: tie_value})
+            return after | Q(**{f"{name}__isnull": False}) if is_reversed else after
+
+        after = Q(**{field_lookup: value}) | Q(**{name: value, tie_lookup: tie_value})
+        return after | Q(**{f"{name}__isnull": True}) if self.nullable and not is_reversed else after
+
+    def _invert(self, field):
+        return field[1:] if field.startswith("-") else f"-{field}"
+
+
+class AssetCursorPagination(KeysetCursorPagination):
+    """
+    Keyset pagination for the assets listings, backed by the `(updated_at, id)` composite index of the asset table
+    """
+
+    ordering = ("-updated_at", "-id")
+
+
+class PortfolioCursorPagination(KeysetCursorPagination):
+    """
+    Keyset pagination for the portfolios listings, backed by the unique index of the portfolio name
+    """
+
+    ordering = ("name", "id")
+
+
+class LeaseCursorPagination(KeysetCursorPagination):
+    """
+    Keyset pagination for the lease expiry listings, backed by the partial `(lease_end, id)` index on rented units
+    """
+
+    ordering = ("lease_end", "id")
+
+
+class AssetSearchCursorPagination(KeysetCursorPagination):
+    """
+    Keyset pagination for the assets search results, best matches first, walked by their `(rank, id)` annotations
+    """
+
+    ordering = ("-rank", "-id")
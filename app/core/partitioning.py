@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import connection, transaction
+
+from .models import Unit
+
+
+UNIT_TABLE = Unit._meta.db_table
+PARTITIONED_UNIT_TABLE = f"{UNIT_TABLE}_partitioned"
+DEFAULT_UNIT_PARTITIONS = 16
+
+# alias: whether the unit table of the database is partitioned
+_partitioned = {}
+
+
+class PartitioningError(Exception):
+    """Raised when the unit table can't be partitioned"""
+
+
+def is_partitioned(table, using=connection):
+    """
+    :param table: name of the table
+    :param using: connection to the database holding the table
+    :return: whether the table is a PostgreSQL partitioned table
+    """
+    if using.vendor != "postgresql":
+        return False
+
+    with using.cursor() as cursor:
+        cursor.execute("SELECT EXISTS(SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))", [table])
+        return cursor.fetchone()[0]
+
+
+def unit_table_partitioned():
+    """
+    :return: whether the unit table is partitioned, checked once per process as partitioning it is a maintenance
+        operation the processes are restarted after
+    """
+    if connection.alias not in _partitioned:
+        _partitioned[connection.alias] = is_partitioned(UNIT_TABLE)
+    return _partitioned[connection.alias]
+
+
+def partition_unit_statements(partitions):
+    """
+    Builds the statements creating the hash partitioned copy of the unit table, partitioned by asset so all the
+    units of an asset live in the same partition and the queries looking up the units of given assets only scan the
+    partitions holding them
+    :param partitions: number of partitions
+    :return: list of SQL statements
+    """
+    statements = [
+        f"CREATE TABLE {PARTITIONED_UNIT_TABLE} (LIKE {UNIT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+        f"PARTITION BY HASH (asset_id)",
+        # The partition key has to be part of the primary key, `id` alone stays unique through its sequence
+        f"ALTER TABLE {PARTITIONED_UNIT_TABLE} ADD PRIMARY KEY (id, asset_id)",
+    ]
+    statements += [
+        f"CREATE TABLE {UNIT_TABLE}_p{remainder} PARTITION OF {PARTITIONED_UNIT_TABLE} "
+        f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+        for remainder in range(partitions)
+    ]
+    return statements
+
+
+def swap_unit_table_statements(index_definitions):
+    """
+    Builds the statements replacing the unit table by its partitioned copy, once the rows are copied
+    :param index_definitions: the `CREATE INDEX` statements of the current table, recreated on the partitioned one so
+        the migrations keep finding the indexes under their names
+    :return: list of SQL statements
+    """
+    sequence = f"{UNIT_TABLE}_id_seq"
+    return [
+        # The sequence would be dropped along with the table owning it
+        f"ALTER SEQUENCE {sequence} OWNED BY NONE",
+        f"DROP TABLE {UNIT_TABLE}",
+        f"ALTER TABLE {PARTITIONED_UNIT_TABLE} RENAME TO {UNIT_TABLE}",
+        f"ALTER TABLE {UNIT_TABLE} RENAME CONSTRAINT {PARTITIONED_UNIT_TABLE}_pkey TO {UNIT_TABLE}_pkey",
+        f"ALTER SEQUENCE {sequence} OWNED BY {UNIT_TABLE}.id",
+        f"ALTER TABLE {UNIT_TABLE} ADD CONSTRAINT {UNIT_TABLE}_asset_id_fk FOREIGN KEY (asset_id) "
+        f"REFERENCES {Unit._meta.get_field('asset').related_model._meta.db_table} (id) DEFERRABLE INITIALLY DEFERRED",
+        *index_definitions,
+        f"ANALYZE {UNIT_TABLE}",
+    ]
+
+
+def partition_unit_table(partitions=DEFAULT_UNIT_PARTITIONS):
+    """
+    Converts the unit table into a hash partitioned table in a single transaction, the writes to the units are
+    blocked meanwhile, the reads aren't
+    :param partitions: number of partitions
+    :return: number of units moved to the partitioned table
+    """
+    if connection.vendor != "postgresql":
+        raise PartitioningError("Only PostgreSQL tables can be partitioned")
+    if is_partitioned(UNIT_TABLE):
+        raise PartitioningError(f"{UNIT_TABLE} is partitioned already")
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # The deferred foreign key checks of the units written in the same transaction must be over before dropping
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(f"LOCK TABLE {UNIT_TABLE} IN EXCLUSIVE MODE")
+        cursor.execute(
+                "SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s "
+                "AND indexname <> %s ORDER BY indexname",
+                [UNIT_TABLE, f"{UNIT_TABLE}_pkey"]
+        )
+        index_definitions = [row[0] for row in cursor.fetchall()]
+
+        for statement in partition_unit_statements(partitions):
+            cursor.execute(statement)
+        cursor.execute(f"INSERT INTO {PARTITIONED_UNIT_TABLE} SELECT * FROM {UNIT_TABLE}")
+        moved = cursor.rowcount
+        cursor.execute(f"SELECT count(*) FROM {UNIT_TABLE}")
+        if cursor.fetchone()[0] != moved:
+            raise PartitioningError("Units were lost while copying them")
+
+        for statement in swap_unit_table_statements(index_definitions):
+            cursor.execute(statement)
+
+    _partitioned.pop(connection.alias, None)
+    return moved
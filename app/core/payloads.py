@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .caching import versioned_cache_key
+from .columnar import columnar_asset_kpis
+from .kpis import format_latest_update, format_vacancy, format_walt, required_kpis, unit_kpi_aggregates
+from .models import Portfolio
+from .serializers import ASSET_INFO_FIELDS, PortfolioInfoAggregationWriteSerializer
+from .timing import timed
+
+
+ASSET_PAYLOAD_CACHE_PREFIX = "asset_payload"
+PORTFOLIO_PAYLOAD_CACHE_PREFIX = "portfolio_payload"
+
+# The asset columns every field of the assets aggregation response is read from
+ASSET_INFO_COLUMNS = {
+    "address": "address",
+    "zipcode": "zipcode",
+    "city": "city",
+    "year_of_construction": "year_of_construction",
+    "restricted_area": "is_restricted",
+}
+# How every field of the assets aggregation response is built out of the asset row and its raw KPIs, the same
+# formats `AssetInfoAggregationWriteSerializer` exposes
+ASSET_INFO_BUILDERS = {
+    "address": lambda row, kpis: row["address"],
+    "zipcode": lambda row, kpis: row["zipcode"],
+    "city": lambda row, kpis: row["city"],
+    "year_of_construction": lambda row, kpis: row["year_of_construction"],
+    "restricted_area": lambda row, kpis: row["is_restricted"],
+    "number_of_units": lambda row, kpis: kpis["number_of_units"],
+    "total_rent": lambda row, kpis: kpis["total_rent"],
+    "total_area": lambda row, kpis: kpis["total_area"],
+    "area_rented": lambda row, kpis: kpis["area_rented"],
+    "vacancy": lambda row, kpis: format_vacancy(kpis),
+    "walt": lambda row, kpis: format_walt(kpis),
+    "latest_update": lambda row, kpis: format_latest_update(kpis, row["updated_at"]),
+}
+
+
+def annotate_portfolio_kpis(queryset):
+    """
+    :param queryset: the portfolios to aggregate
+    :return: portfolios annotated with their KPIs, computed by a single GROUP BY query
+    """
+    return queryset.annotate(number_of_assets=Count("assets", distinct=True), **unit_kpi_aggregates("assets__units"))
+
+
+def asset_rows(queryset, fields=None, extra=()):
+    """
+    :param queryset: the assets to serialize
+    :param fields: the requested sparse fieldset if any
+    :param extra: other lookups to read along, e.g. the keyset pagination ones
+    :return: `.values()` queryset of the asset columns the requested fields are built from
+    """
+    columns = ASSET_INFO_COLUMNS.values() if not fields else [
+        ASSET_INFO_COLUMNS[field] for field in fields if field in ASSET_INFO_COLUMNS
+    ]
+    return queryset.values(*dict.fromkeys(["id", "reference", "updated_at", *columns, *extra]))
+
+
+def serialize_assets(rows, fields=None):
+    """
+    Builds the aggregation payloads as plain dicts, skipping the serializer fields machinery
+    :param rows: `asset_rows()` dicts of the assets to serialize
+    :param fields: the requested sparse fieldset if any
+    :return: the aggregation payloads of the assets, their KPIs computed in one batch
+    """
+    builders = [(field, ASSET_INFO_BUILDERS[field]) for field in ASSET_INFO_FIELDS if not fields or field in fields]
+    with timed("serialize"):
+        kpis = columnar_asset_kpis((row["id"] for row in rows), kpis=required_kpis(fields))
+        return [{field: build(row, kpis[row["id"]]) for field, build in builders} for row in rows]
+
+
+def serialize_portfolios(portfolios):
+    """
+    :param portfolios: portfolios annotated by `annotate_portfolio_kpis()`
+    :return: the aggregation payloads of the portfolios
+    """
+    with timed("serialize"):
+        return PortfolioInfoAggregationWriteSerializer(portfolios, many=True).data
+
+
+def _cached_payloads(prefix, objects, ids, serialize, parts=(), version=None, refresh=False):
+    """
+    Reads the payloads of many objects from the cache at once and serializes the missing ones in one batch
+    :param prefix: namespace of the cached payloads
+    :param objects: the objects to serialize
+    :param ids: ids of the objects, in the same order
+    :param serialize: callable serializing a list of objects into the list of their payloads
+    :param parts: the request parameters the payloads depend on besides the object
+    :param version: the data version to cache the payloads for, defaults to the current one
+    :param refresh: serialize every object even if its payload is cached already
+    :return: list of the payloads in the objects order
+    """
+    keys = [versioned_cache_key(prefix, object_id, *parts, version=version) for object_id in ids]
+    cached = {} if refresh else cache.get_many(keys)
+    missing = [(key, obj) for key, obj in zip(keys, objects) if key not in cached]
+
+    if missing:
+        built = dict(zip((key for key, __ in missing), serialize([obj for __, obj in missing])))
+        cache.set_many(built, settings.AGGREGATION_CACHE_TIMEOUT)
+        cached.update(built)
+
+    return [cached[key] for key in keys]
+
+
+def asset_payloads(rows, fields=None, version=None, refresh=False):
+    """
+    :param rows: `asset_rows()` dicts of the assets to serialize
+    :param fields: the requested sparse fieldset if any
+    :param version: the data version to cache the payloads for, defaults to the current one
+    :param refresh: serialize every asset even if its payload is cached already
+    :return: list of the aggregation payloads of the assets, read from the cache when it is enabled
+    """
+    rows = list(rows)
+    if not settings.AGGREGATION_CACHE_TIMEOUT:
+        return serialize_assets(rows, fields)
+
+    return _cached_payloads(
+            ASSET_PAYLOAD_CACHE_PREFIX, rows, [row["id"] for row in rows],
+            lambda missing: serialize_assets(missing, fields), parts=[",".join(sorted(fields or []))],
+            version=version, refresh=refresh
+    )
+
+
+def portfolio_payloads(portfolios, version=None, refresh=False):
+    """
+    :param portfolios: the portfolios to serialize, annotated by `annotate_portfolio_kpis()` unless the cache is
+        enabled, only the ones missing from it are aggregated then
+    :param version: the data version to cache the payloads for, defaults to the current one
+    :param refresh: serialize every portfolio even if its payload is cached already
+    :return: list of the aggregation payloads of the portfolios
+    """
+    if not settings.AGGREGATION_CACHE_TIMEOUT:
+        return list(serialize_portfolios(portfolios))
+
+    def serialize(missing):
+        annotated = annotate_portfolio_kpis(Portfolio.objects.filter(id__in=[portfolio.id for portfolio in missing]))
+        annotated = {portfolio.id: portfolio for portfolio in annotated}
+        return serialize_portfolios([annotated[portfolio.id] for portfolio in missing])
+
+    return _cached_payloads(
+            PORTFOLIO_PAYLOAD_CACHE_PREFIX, portfolios, [portfolio.id for portfolio in portfolios], serialize,
+            version=version, refresh=refresh
+    )
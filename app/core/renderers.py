@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .timing import timed
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class PassthroughRenderer(BaseRenderer):
+    """
+    Lets views that build their own (streaming) response body accept any media type the client asks for
+    """
+
+    media_type = "*/*"
+    format = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Renders JSON with orjson when it's installed, producing the same bytes as the compact `JSONRenderer` output.
+
+    orjson already writes compact UTF-8 without escaping, the values it doesn't natively format the way DRF does
+    (decimals, datetimes, lazy strings...) are handed to DRF's own encoder. Indented (browsable) responses and data
+    orjson can't serialize, e.g. non string keys or integers over 64 bits, go through the stdlib renderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed("render"):
+            return self._render(data, accepted_media_type, renderer_context)
+
+    def _render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            rendered = orjson.dumps(
+                    data, default=self.encoder_class().default,
+                    option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+            )
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same as the stdlib renderer, these line terminators are valid JSON but not valid javascript
+        return rendered.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from contextlib import contextmanager
+import contextvars
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+
+DATABASE_ROUTER_LOGGER = logging.getLogger("database_router")
+
+REPLICA_STICKY_CACHE_KEY = "core:replica_sticky"
+# Only the business data is read from the replicas, the sessions and users stay on the primary so a login is never
+# lost to the replication lag
+REPLICA_APP_LABELS = {"core"}
+
+# The replica the current request reads from, None to read from the primary
+_read_alias = contextvars.ContextVar("read_alias", default=None)
+# Last health check of every replica, alias: (checked at, healthy)
+_replica_health = {}
+_replica_health_lock = threading.Lock()
+
+
+def _check_replica(alias):
+    """
+    :param alias: the replica database alias
+    :return: whether the replica answers and, on Postgres, lags behind the primary by at most DATABASE_REPLICA_MAX_LAG
+        seconds
+    """
+    try:
+        with connections[alias].cursor() as cursor:
+            if connections[alias].vendor != "postgresql":
+                cursor.execute("SELECT 1")
+                return True
+
+            cursor.execute(
+                    "SELECT pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn(), "
+                    "EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())"
+            )
+            caught_up, lag = cursor.fetchone()
+    except DatabaseError as err:
+        DATABASE_ROUTER_LOGGER.warning("[REPLICA UNAVAILABLE]\n%s: %s", alias, err)
+        return False
+
+    # The last replay timestamp keeps aging while the primary has nothing to write, a replica that replayed all the
+    # WAL it received is up to date whatever its age
+    if caught_up:
+        lag = 0
+
+    # No replayed transaction at all means the replica is idle, not late
+    if lag is not None and lag > settings.DATABASE_REPLICA_MAX_LAG:
+        DATABASE_ROUTER_LOGGER.warning("[REPLICA LAGGING]\n%s: %s seconds behind the primary", alias, lag)
+        return False
+
+    return True
+
+
+def replica_is_healthy(alias):
+    """
+    :param alias: the replica database alias
+    :return: the outcome of the replica health check, run at most every DATABASE_REPLICA_HEALTH_INTERVAL seconds
+    """
+    checked_at, healthy = _replica_health.get(alias, (None, False))
+    if checked_at is not None and time.monotonic() - checked_at < settings.DATABASE_REPLICA_HEALTH_INTERVAL:
+        return healthy
+
+    with _replica_health_lock:
+        # Another thread may have checked it while this one was waiting
+        checked_at, healthy = _replica_health.get(alias, (None, False))
+        if checked_at is None or time.monotonic() - checked_at >= settings.DATABASE_REPLICA_HEALTH_INTERVAL:
+            healthy = _check_replica(alias)
+            _replica_health[alias] = (time.monotonic(), healthy)
+
+    return healthy
+
+
+def stick_to_primary(seconds=None):
+    """
+    Sends every read to the primary for a while, so data that was just written is read back whatever the replicas
+    replication lag is. Called from the celery workers, the flag reaches the app through the shared cache (see the
+    `core.E001` system check).
+    :param seconds: how long to stick to the primary, defaults to DATABASE_REPLICA_STICKY_SECONDS
+    """
+    seconds = settings.DATABASE_REPLICA_STICKY_SECONDS if seconds is None else seconds
+    if settings.DATABASE_REPLICAS and seconds:
+        cache.set(REPLICA_STICKY_CACHE_KEY, True, seconds)
+
+
+def pick_replica():
+    """
+    :return: alias of a healthy replica picked at random, None when reads should go to the primary
+    """
+    if not settings.DATABASE_REPLICAS or cache.get(REPLICA_STICKY_CACHE_KEY):
+        return None
+
+    replicas = [alias for alias in settings.DATABASE_REPLICAS if replica_is_healthy(alias)]
+    return random.choice(replicas) if replicas else None
+
+
+@contextmanager
+def _reads_from(alias):
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def replica_reads(alias=None):
+    """
+    :param alias: the replica to read from, a healthy one is picked when not given
+    :return: context manager routing the reads made within the block to the replica, or to the primary when there
+        isn't any healthy one
+    """
+    return _reads_from(alias or pick_replica())
+
+
+def routed_iterator(iterable):
+    """
+    :param iterable: lazily evaluated content, e.g. the body of a streaming response consumed after the view returned
+    :return: generator reading the content from the database the current block reads from
+    """
+    alias = _read_alias.get()
+
+    def iterate():
+        iterator = iter(iterable)
+        while True:
+            with _reads_from(alias):
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+            yield chunk
+
+    return iterate()
+
+
+class ReadReplicaRouter:
+    """
+    Sends the reads of the read only blocks (see `replica_reads()`) to a replica, everything else, writes and reads
+    made inside a transaction of the primary included, goes to the primary
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is None or model._meta.app_label not in REPLICA_APP_LABELS:
+            return DEFAULT_DB_ALIAS
+        return DEFAULT_DB_ALIAS if connections[DEFAULT_DB_ALIAS].in_atomic_block else alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same data as the primary
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        return obj1._state.db in databases and obj2._state.db in databases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replicas get their schema through the replication
+        return db not in settings.DATABASE_REPLICAS
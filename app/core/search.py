@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
+from django.db.models import Case, F, FloatField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Cast, Coalesce, Greatest
+
+from .models import Asset, Unit
+
+
+# The asset columns and the unit column searched, each of them backed on PostgreSQL by a trigram GIN index over its
+# upper cased value, the expression the `icontains` lookups are compiled to, see migration 0008
+ASSET_SEARCH_COLUMNS = ["reference", "address", "city"]
+UNIT_SEARCH_COLUMNS = ["tenant"]
+# Shorter queries hold no trigram, they would scan the whole tables
+SEARCH_MIN_LENGTH = 3
+
+
+def _matching_tenants(query):
+    """
+    :param query: the searched text
+    :return: the units of the current asset whose tenant contains the searched text
+    """
+    return Unit.objects.filter(asset=OuterRef("pk"), tenant__icontains=query)
+
+
+def _trigram_rank(query):
+    """
+    :param query: the searched text
+    :return: the best trigram similarity between the searched text and the asset columns or its tenants
+    """
+    tenant_similarity = _matching_tenants(query).annotate(
+            similarity=TrigramSimilarity("tenant", query)
+    ).order_by("-similarity").values("similarity")[:1]
+
+    # `similarity()` is a float4, cast to float8 so the keyset cursor round trips it exactly
+    return Cast(Greatest(
+            *(TrigramSimilarity(column, query) for column in ASSET_SEARCH_COLUMNS),
+            Coalesce(Subquery(tenant_similarity), Value(0.0)),
+    ), FloatField())
+
+
+def _contains_rank(query):
+    """
+    :param query: the searched text
+    :return: a coarse rank of the match on databases lacking trigrams, exact reference first, then prefixes of the
+        asset columns, then anything containing the searched text
+    """
+    return Case(
+            When(reference__iexact=query, then=Value(1.0)),
+            When(Q(reference__istartswith=query) | Q(address__istartswith=query) | Q(city__istartswith=query),
+                 then=Value(0.75)),
+            When(Q(reference__icontains=query) | Q(address__icontains=query) | Q(city__icontains=query),
+                 then=Value(0.5)),
+            default=Value(0.25),
+            output_field=FloatField(),
+    )
+
+
+def search_assets(query, queryset=None):
+    """
+    Looks the assets up by partial reference, address, city or tenant name
+    :param query: the searched text, at least SEARCH_MIN_LENGTH characters long
+    :param queryset: the assets to search, all of them by default
+    :return: the matching assets annotated with their `rank`, between 0 and 1, the best matches having the highest
+    """
+    queryset = Asset.objects.all() if queryset is None else queryset
+
+    # The union of the assets and of the tenants matches, each side served by its own trigram indexes and the result
+    # joined on the assets primary key; an OR of both would leave the tenants subquery unindexable, checked per asset
+    asset_matches = Q()
+    for column in ASSET_SEARCH_COLUMNS:
+        asset_matches |= Q(**{f"{column}__icontains": query})
+    matches = Q(id__in=Asset.objects.filter(asset_matches).order_by().values("id").union(
+            Unit.objects.filter(tenant__icontains=query).order_by().values("asset_id")
+    ))
+
+    rank = _trigram_rank(query) if connection.vendor == "postgresql" else _contains_rank(query)
+    return queryset.filter(matches).annotate(rank=rank).order_by(F("rank").desc(), "-id")
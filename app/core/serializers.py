@@ -5,13 +5,19 @@ import csv
 import logging
 import pandas as pd
 
+from django.conf import settings
 from django.utils import timezone
 from django.utils.translation import gettext as _
 
 from rest_framework import serializers
 
-from .models import Asset, Document
-from .utils import logging_message
+from .columnar import columnar_asset_kpis
+from .exports import CSV_FORMAT, EXPORT_CONTENT_TYPES
+from .forecast import default_forecast_months
+from .kpis import format_latest_update, format_vacancy, format_walt, kpis_from_instance, normalize_kpis, required_kpis
+from .models import Asset, AssetKPISnapshot, Document, Portfolio, Unit
+from .search import SEARCH_MIN_LENGTH
+from .utils import add_months, logging_message
 
 
 UNICODE = set(';:></*%$.\\')
@@ -31,6 +37,31 @@ TASK_UPLOAD_FILE_TYPES = [
 
 FILE_UPLOAD_LOGGER = logging.getLogger("file_upload")
 
+KPI_FILTER_FIELDS = ["number_of_units", "total_rent", "total_area", "area_rented", "vacancy", "walt"]
+
+# The assets list parameters also read from the query string, so that the pagination links carry them along
+ASSETS_QUERY_PARAMS = [
+    *(f"{field}_{bound}" for field in KPI_FILTER_FIELDS for bound in ("min", "max")), "ordering", "fields"
+]
+
+ASSET_INFO_FIELDS = [
+    "address", "zipcode", "city", "year_of_construction", "restricted_area", "number_of_units", "total_rent",
+    "total_area", "area_rented", "vacancy", "walt", "latest_update"
+]
+
+
+class CommaSeparatedListField(serializers.ListField):
+    """
+    List field that also accepts the `a,b,c` notation used in query strings
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = [data]
+        if isinstance(data, list):
+            data = [item.strip() for value in data for item in str(value).split(",") if item.strip()]
+        return super().to_internal_value(data)
+
 
 class AssetInfoAggregationReadSerializer(serializers.Serializer):
     """
@@ -38,13 +69,103 @@ class AssetInfoAggregationReadSerializer(serializers.Serializer):
     """
 
     asset_ref = serializers.CharField(max_length=254, required=False, allow_null=True, allow_blank=True)
+    asset_refs = serializers.ListField(
+            child=serializers.CharField(max_length=254), required=False, allow_empty=False
+    )
+
+    # Numeric KPI filters, evaluated against the precomputed asset KPIs
+    number_of_units_min = serializers.IntegerField(required=False, min_value=0)
+    number_of_units_max = serializers.IntegerField(required=False, min_value=0)
+    total_rent_min = serializers.DecimalField(required=False, max_digits=16, decimal_places=2)
+    total_rent_max = serializers.DecimalField(required=False, max_digits=16, decimal_places=2)
+    total_area_min = serializers.IntegerField(required=False, min_value=0)
+    total_area_max = serializers.IntegerField(required=False, min_value=0)
+    area_rented_min = serializers.IntegerField(required=False, min_value=0)
+    area_rented_max = serializers.IntegerField(required=False, min_value=0)
+    vacancy_min = serializers.FloatField(required=False, min_value=0, max_value=100)
+    vacancy_max = serializers.FloatField(required=False, min_value=0, max_value=100)
+    walt_min = serializers.FloatField(required=False)
+    walt_max = serializers.FloatField(required=False)
+    ordering = serializers.ChoiceField(
+            choices=KPI_FILTER_FIELDS + [f"-{field}" for field in KPI_FILTER_FIELDS], required=False
+    )
+
+    # Sparse fieldset, only the requested fields are computed and returned
+    fields = CommaSeparatedListField(
+            child=serializers.ChoiceField(choices=ASSET_INFO_FIELDS), required=False, allow_empty=False
+    )
+
+    def get_kpi_filters(self):
+        """
+        :return: the lookups of the requested KPI ranges on the precomputed asset KPIs
+        """
+        lookups = {}
+        for field in KPI_FILTER_FIELDS:
+            if self.validated_data.get(f"{field}_min") is not None:
+                lookups[f"kpi__{field}__gte"] = self.validated_data[f"{field}_min"]
+            if self.validated_data.get(f"{field}_max") is not None:
+                lookups[f"kpi__{field}__lte"] = self.validated_data[f"{field}_max"]
+
+        return lookups
+
+    def get_link_params(self):
+        """
+        :return: the query parameters of the requested KPI ranges, ordering and fieldset, for the pagination links
+        """
+        params = {
+            name: value for name, value in self.validated_data.items()
+            if name in ASSETS_QUERY_PARAMS and value is not None
+        }
+        if params.get("fields"):
+            params["fields"] = ",".join(params["fields"])
+
+        return params
+
+    def validate_asset_refs(self, asset_refs):
+        """
+        :param asset_refs: list of the requested asset references
+        :return: the references without duplicates, keeping the requested order
+        """
+        asset_refs = list(dict.fromkeys(asset_refs))
+        if len(asset_refs) > settings.ASSETS_BULK_LOOKUP_LIMIT:
+            raise serializers.ValidationError(
+                    _(f"Up to {settings.ASSETS_BULK_LOOKUP_LIMIT} asset references can be looked up at once")
+            )
+
+        return asset_refs
+
+    def validate(self, attrs):
+        if attrs.get("asset_ref") and attrs.get("asset_refs"):
+            raise serializers.ValidationError(_("Use either asset_ref or asset_refs, not both"))
+
+        return attrs
+
+
+class AssetInfoExportReadSerializer(serializers.Serializer):
+    """
+    Serializes asset info export request
+    """
+
+    export_format = serializers.ChoiceField(choices=list(EXPORT_CONTENT_TYPES), default=CSV_FORMAT)
 
 
 class AssetInfoAggregationWriteSerializer(serializers.ModelSerializer):
     """
     Serializes asset info aggregation response
+
+    The KPIs are read from the raw KPIs batch computed for the whole page and passed through the `kpis` context
+    entry, assets missing from it have their KPIs computed on their own. A `fields` context entry restricts the
+    output to a sparse fieldset.
     """
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested_fields = self.context.get("fields")
+
+        if requested_fields:
+            for field_name in set(self.fields) - set(requested_fields):
+                self.fields.pop(field_name)
+
     restricted_area = serializers.SerializerMethodField()
     number_of_units = serializers.SerializerMethodField()
     total_rent = serializers.SerializerMethodField()
@@ -54,25 +175,36 @@ class AssetInfoAggregationWriteSerializer(serializers.ModelSerializer):
     walt = serializers.SerializerMethodField()
     latest_update = serializers.SerializerMethodField()
 
+    def _kpis(self, asset_object):
+        """
+        :param asset_object: the asset being serialized
+        :return: raw KPIs of the asset
+        """
+        kpis = self.context.setdefault("kpis", {})
+        if asset_object.id not in kpis:
+            kpis.update(columnar_asset_kpis([asset_object.id], kpis=required_kpis(self.fields)))
+
+        return kpis[asset_object.id]
+
     def get_restricted_area(self, asset_object):
         """Retrieves asset restriction status"""
         return asset_object.is_restricted
 
     def get_number_of_units(self, asset_object):
         """Retrieves asset's total number of units"""
-        return asset_object.units.count()
+        return self._kpis(asset_object)["number_of_units"]
 
     def get_total_rent(self, asset_object):
         """Retrieves asset's total amount of rent for the rented units"""
-        return sum([unit.rent for unit in asset_object.units.all() if unit.is_rented])
+        return self._kpis(asset_object)["total_rent"]
 
     def get_total_area(self, asset_object):
         """Retrieves asset's total units sizes"""
-        return sum([unit.size for unit in asset_object.units.all()])
+        return self._kpis(asset_object)["total_area"]
 
     def get_area_rented(self, asset_object):
         """Retrieves asset's total rented units sizes"""
-        return sum([unit.size for unit in asset_object.units.all() if unit.is_rented])
+        return self._kpis(asset_object)["area_rented"]
 
     def get_vacancy(self, asset_object):
         """
@@ -81,11 +213,7 @@ class AssetInfoAggregationWriteSerializer(serializers.ModelSerializer):
             1. Multiply the number of vacant units by 100.
             2. Divide the result by the total number of units in the property.
         """
-        if asset_object.units.count() > 0:
-            vacancy = (asset_object.units.filter(is_rented=False).count() * 100) / asset_object.units.count()
-            return f"{round(vacancy, 2)} %"
-
-        return "0.0 %"
+        return format_vacancy(self._kpis(asset_object))
 
     def get_walt(self, asset_object):
         """
@@ -94,37 +222,260 @@ class AssetInfoAggregationWriteSerializer(serializers.ModelSerializer):
         How it is being calculated:
             * Calculate the tenanted area per property and multiply by the years of the occupancy
         """
-        all_tenanted_units = asset_object.units.filter(is_rented=True)
-        walt = 0.0
+        return format_walt(self._kpis(asset_object))
+
+    def get_latest_update(self, asset_object):
+        """Retrieves asset's last update date"""
+        return format_latest_update(self._kpis(asset_object), asset_object.updated_at)
+
+    class Meta:
+        model = Asset
+        fields = ASSET_INFO_FIELDS
 
-        if all_tenanted_units.count() > 0:
-            total_rentable_area = sum([unit.size for unit in asset_object.units.all()])
-            tenants_values_list = []
-            for unit in all_tenanted_units:
-                lease_end_date = unit.lease_end.year if unit.lease_end else timezone.now().year
-                remaining_years = lease_end_date - timezone.now().year
-                tenant_occupation_ratio = unit.size/total_rentable_area
-                tenants_values_list.append((round((tenant_occupation_ratio * remaining_years), 3)))
 
-            walt = sum(tenants_values_list)
+class PortfolioInfoAggregationReadSerializer(serializers.Serializer):
+    """
+    Serializes portfolio info aggregation request
+    """
 
-        return f"{round(walt, 1)} years"
+    portfolio_name = serializers.CharField(max_length=254, required=False, allow_null=True, allow_blank=True)
 
-    def get_latest_update(self, asset_object):
-        """Retrieves asset's last update date"""
-        if asset_object.units.count() > 0:
-            return asset_object.units.all().first().updated_at.strftime("%d.%m.%Y")
 
-        return asset_object.updated_at.strftime("%d.%m.%Y")
+class PortfolioInfoAggregationWriteSerializer(serializers.ModelSerializer):
+    """
+    Serializes portfolio info aggregation response, the same KPIs as the assets ones rolled up per portfolio
+
+    The portfolios are expected to be annotated with the `unit_kpi_aggregates("assets__units")` expressions.
+    """
+
+    number_of_assets = serializers.IntegerField(read_only=True)
+    number_of_units = serializers.SerializerMethodField()
+    total_rent = serializers.SerializerMethodField()
+    total_area = serializers.SerializerMethodField()
+    area_rented = serializers.SerializerMethodField()
+    vacancy = serializers.SerializerMethodField()
+    walt = serializers.SerializerMethodField()
+    latest_update = serializers.SerializerMethodField()
+
+    def get_number_of_units(self, portfolio_object):
+        """Retrieves portfolio's total number of units"""
+        return kpis_from_instance(portfolio_object)["number_of_units"]
+
+    def get_total_rent(self, portfolio_object):
+        """Retrieves portfolio's total amount of rent for the rented units"""
+        return kpis_from_instance(portfolio_object)["total_rent"]
+
+    def get_total_area(self, portfolio_object):
+        """Retrieves portfolio's total units sizes"""
+        return kpis_from_instance(portfolio_object)["total_area"]
+
+    def get_area_rented(self, portfolio_object):
+        """Retrieves portfolio's total rented units sizes"""
+        return kpis_from_instance(portfolio_object)["area_rented"]
+
+    def get_vacancy(self, portfolio_object):
+        """Retrieves portfolio's vacancy rate out of all its units"""
+        return format_vacancy(kpis_from_instance(portfolio_object))
+
+    def get_walt(self, portfolio_object):
+        """Retrieves portfolio's WALT weighted by the area of all its units"""
+        return format_walt(kpis_from_instance(portfolio_object))
+
+    def get_latest_update(self, portfolio_object):
+        """Retrieves portfolio's last update date"""
+        return format_latest_update(kpis_from_instance(portfolio_object), portfolio_object.updated_at)
 
     class Meta:
-        model = Asset
+        model = Portfolio
         fields = [
-            "address", "zipcode", "city", "year_of_construction", "restricted_area", "number_of_units", "total_rent",
-            "total_area", "area_rented", "vacancy", "walt", "latest_update"
+            "name", "number_of_assets", "number_of_units", "total_rent", "total_area", "area_rented", "vacancy",
+            "walt", "latest_update"
         ]
 
 
+class GeoInfoAggregationReadSerializer(serializers.Serializer):
+    """
+    Serializes geographic info aggregation request
+    """
+
+    GROUP_BY_FIELDS = ["city", "zipcode"]
+
+    group_by = serializers.MultipleChoiceField(choices=GROUP_BY_FIELDS, required=False, allow_empty=False)
+    portfolio_name = serializers.CharField(max_length=254, required=False, allow_null=True, allow_blank=True)
+
+    def validate_group_by(self, group_by):
+        """
+        :param group_by: the requested grouping fields
+        :return: the grouping fields in a stable order, city before zipcode
+        """
+        return [field for field in self.GROUP_BY_FIELDS if field in group_by]
+
+
+class GeoInfoAggregationWriteSerializer(serializers.Serializer):
+    """
+    Serializes geographic info aggregation response, one row per city and/or zipcode
+
+    The rows are expected to be `.values()` dicts annotated with the `unit_kpi_aggregates("units")` expressions.
+    """
+
+    city = serializers.CharField(required=False)
+    zipcode = serializers.IntegerField(required=False)
+    number_of_assets = serializers.IntegerField()
+    number_of_units = serializers.IntegerField()
+    total_area = serializers.SerializerMethodField()
+    area_rented = serializers.SerializerMethodField()
+    total_rent = serializers.SerializerMethodField()
+    vacancy = serializers.SerializerMethodField()
+
+    def get_total_area(self, row):
+        """Retrieves the total units sizes of the group"""
+        return normalize_kpis(row)["total_area"]
+
+    def get_area_rented(self, row):
+        """Retrieves the total rented units sizes of the group"""
+        return normalize_kpis(row)["area_rented"]
+
+    def get_total_rent(self, row):
+        """Retrieves the total amount of rent for the rented units of the group"""
+        return normalize_kpis(row)["total_rent"]
+
+    def get_vacancy(self, row):
+        """Retrieves the vacancy rate out of all the units of the group"""
+        return format_vacancy(normalize_kpis(row))
+
+
+class ExpiringLeasesReadSerializer(serializers.Serializer):
+    """
+    Serializes expiring leases request
+    """
+
+    months = serializers.IntegerField(required=False, min_value=1, max_value=120, default=12)
+    lease_end_from = serializers.DateField(required=False)
+    lease_end_to = serializers.DateField(required=False)
+    group_by = serializers.ChoiceField(choices=["asset", "portfolio"], required=False)
+    portfolio_name = serializers.CharField(max_length=254, required=False, allow_null=True, allow_blank=True)
+
+    def validate(self, attrs):
+        """
+        :param attrs: the requested window attributes
+        :return: attrs completed with the `[lease_end_from, lease_end_to)` window, `months` from today by default
+        """
+        attrs.setdefault("lease_end_from", timezone.localdate())
+        attrs.setdefault("lease_end_to", add_months(attrs["lease_end_from"], attrs["months"]))
+
+        if attrs["lease_end_to"] <= attrs["lease_end_from"]:
+            raise serializers.ValidationError(_("lease_end_to should be after lease_end_from"))
+
+        return attrs
+
+    def get_link_params(self):
+        """
+        :return: the query parameters of the resolved window and portfolio, for the pagination links
+        """
+        params = {
+            "lease_end_from": self.validated_data["lease_end_from"].isoformat(),
+            "lease_end_to": self.validated_data["lease_end_to"].isoformat(),
+        }
+        if self.validated_data.get("portfolio_name"):
+            params["portfolio_name"] = self.validated_data["portfolio_name"]
+
+        return params
+
+
+class ExpiringLeaseWriteSerializer(serializers.ModelSerializer):
+    """
+    Serializes expiring leases response, the units are expected to have their asset and portfolio select related
+    """
+
+    asset = serializers.CharField(source="asset.reference", read_only=True)
+    portfolio = serializers.CharField(source="asset.portfolio.name", read_only=True)
+
+    class Meta:
+        model = Unit
+        fields = ["reference", "unit_type", "asset", "portfolio", "tenant", "size", "rent", "lease_start", "lease_end"]
+
+
+class AssetSearchReadSerializer(serializers.Serializer):
+    """
+    Serializes assets search request
+    """
+
+    q = serializers.CharField(min_length=SEARCH_MIN_LENGTH, max_length=254, trim_whitespace=True)
+    portfolio_name = serializers.CharField(max_length=254, required=False, allow_null=True, allow_blank=True)
+
+
+class AssetSearchWriteSerializer(serializers.ModelSerializer):
+    """
+    Serializes assets search response, the assets are expected to be annotated with their search rank and to have
+    their portfolio select related
+    """
+
+    portfolio = serializers.CharField(source="portfolio.name", read_only=True)
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = Asset
+        fields = ["reference", "portfolio", "address", "zipcode", "city", "rank"]
+
+
+class ForecastReadSerializer(serializers.Serializer):
+    """
+    Serializes occupancy and rent roll forecast request
+    """
+
+    months = serializers.IntegerField(required=False, min_value=1)
+    portfolio_name = serializers.CharField(max_length=254, required=False, allow_null=True, allow_blank=True)
+    asset_ref = serializers.CharField(max_length=254, required=False, allow_null=True, allow_blank=True)
+    include_assets = serializers.BooleanField(required=False, default=False)
+
+    def validate_months(self, months):
+        if months > settings.FORECAST_MAX_MONTHS:
+            raise serializers.ValidationError(
+                    _(f"The forecast horizon can't exceed {settings.FORECAST_MAX_MONTHS} months")
+            )
+
+        return months
+
+    def validate(self, attrs):
+        attrs.setdefault("months", default_forecast_months())
+        return attrs
+
+
+class AssetKPITrendReadSerializer(serializers.Serializer):
+    """
+    Serializes asset KPIs trend request
+    """
+
+    asset_ref = serializers.CharField(max_length=254)
+    months = serializers.IntegerField(required=False, min_value=1, max_value=120, default=12)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        """
+        :param attrs: the requested window attributes
+        :return: attrs completed with the `[date_from, date_to]` window, the last `months` up to today by default
+        """
+        attrs.setdefault("date_to", timezone.localdate())
+        attrs.setdefault("date_from", add_months(attrs["date_to"], -attrs["months"]))
+
+        if attrs["date_to"] < attrs["date_from"]:
+            raise serializers.ValidationError(_("date_to should not be before date_from"))
+
+        return attrs
+
+
+class AssetKPISnapshotWriteSerializer(serializers.ModelSerializer):
+    """
+    Serializes the snapshots of asset KPIs trend response
+    """
+
+    class Meta:
+        model = AssetKPISnapshot
+        fields = ["snapshot_date", "document", "number_of_units", "vacant_units", "total_rent", "total_area",
+                  "area_rented", "vacancy", "walt"]
+
+
 class DocumentSerializer(serializers.ModelSerializer):
     """
     Serializes document files
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from contextlib import contextmanager
+import contextvars
+
+from django.db import transaction
+
+from .caching import bump_data_version
+from .kpis import refresh_asset_kpis
+from .models import Asset, Unit
+
+
+# Set while the units are written by a job refreshing the KPIs of all the assets it touched at once, e.g. the importer
+_batched_unit_changes = contextvars.ContextVar("batched_unit_changes", default=False)
+
+
+@contextmanager
+def batched_unit_changes():
+    """
+    :return: context manager skipping the per unit refresh of the assets KPIs within the block, the job running it
+        refreshes them by itself
+    """
+    token = _batched_unit_changes.set(True)
+    try:
+        yield
+    finally:
+        _batched_unit_changes.reset(token)
+
+
+def remember_unit_asset(sender, instance, **kwargs):
+    """
+    `pre_save` receiver keeping the asset the unit belonged to, the unit may be moved to another one
+    """
+    if _batched_unit_changes.get() or instance.pk is None:
+        return
+
+    instance._previous_asset_id = Unit.objects.filter(pk=instance.pk).values_list("asset_id", flat=True).first()
+
+
+def refresh_unit_asset_kpis(sender, instance, **kwargs):
+    """
+    `post_save` and `post_delete` receiver refreshing the KPIs of the assets the unit belongs and belonged to, once
+    the change is committed, and moving the data version forward so the cached results and columnar snapshots of
+    every process are rebuilt
+    """
+    if _batched_unit_changes.get():
+        return
+
+    asset_ids = {instance.asset_id, getattr(instance, "_previous_asset_id", None)} - {None}
+
+    def refresh():
+        # The assets may be gone along with their units
+        refresh_asset_kpis(Asset.objects.filter(id__in=asset_ids).values_list("id", flat=True))
+        bump_data_version()
+
+    transaction.on_commit(refresh)
@@ -0,0 +1,13 @@
+'use strict';
+{
+    const $ = django.jQuery;
+
+    // Reload the changelist filtered by the object picked in an `AutocompleteFilter`
+    $(document).on('change', 'select.admin-autocomplete-filter', function() {
+        const params = new URLSearchParams(this.dataset.queryString);
+        if (this.value) {
+            params.set(this.dataset.lookup, this.value);
+        }
+        window.location.search = params.toString();
+    });
+}
@@ -2,21 +2,38 @@
 import csv
 
 from celery import Task
+from celery.signals import task_postrun, task_prerun, worker_process_init, worker_process_shutdown
+from collections import Counter
+from datetime import timedelta
 from decimal import Decimal
 import logging
+import random
+import time
+import uuid
 
 from decouple import config
 import pandas as pd
 
+from app.log import bind_task_job_id, flush_logs, unbind_task_job_id
 from app.settings.celery import app
 
+from django.conf import settings
 from django.core.mail import send_mail
 from django.utils import timezone
 
-from .models import AbstractUnitType, Document, Portfolio, Asset, Unit
+from .caching import bump_data_version
+from .chunking import AdaptiveChunkSize
+from .connections import checkout_connections, keep_worker_connections, log_connection_metrics, release_connections
+from .kpis import asset_id_ranges, recompute_asset_walt, refresh_asset_kpis, snapshot_asset_kpis
+from .metrics import METRICS, PeakMemory, StageTimer, retire_process_metrics, write_process_metrics
+from .models import AbstractUnitType, Document, KPIRecomputeRun, Portfolio, Asset, Unit
+from .routers import stick_to_primary
+from .signals import batched_unit_changes
 from .utils import logging_message
+from .warming import refresh_caches
 
 QUEUE_TASKS_LOGGER = logging.getLogger("queue_tasks")
+CSV_SNIFF_SAMPLE_SIZE = 64 * 1024
 
 
 class PortfolioDataProcessorTask(Task):
@@ -30,8 +47,10 @@ class PortfolioDataProcessorTask(Task):
         :return: the delimiter used at the csv sheet or False if there is any problem
         """
         try:
-            as_string = doc_obj.file.read().decode("utf-8")
-            dialect = csv.Sniffer().sniff(as_string)
+            # Sniffed on the first whole lines, the sheet may not fit in the memory budget of the import
+            sample = doc_obj.file.read(CSV_SNIFF_SAMPLE_SIZE)
+            sample = sample[:sample.rfind(b"\n") + 1] or sample
+            dialect = csv.Sniffer().sniff(sample.decode("utf-8"))
             doc_obj.file.seek(0)
             return dialect.delimiter
         except:
@@ -51,19 +70,36 @@ class PortfolioDataProcessorTask(Task):
         else:
             return AbstractUnitType.COMMERCIAL
 
-    def accumulate_df(self, doc_obj):
+    def read_chunks(self, doc_obj, chunk_size, stages=None):
         """
         :param doc_obj: document to be processed
-        :return: data frame using pandas package
+        :param chunk_size: `AdaptiveChunkSize` picking the number of rows of every chunk of the csv sheets, the excel
+            sheets are read at once
+        :param stages: `StageTimer` timing the sniffing and parsing of the document, if any
+        :return: generator of data frames using pandas package
         """
+        stages = stages or StageTimer()
         doc_type = "csv" if doc_obj.file.name.endswith(".csv") else "excel"
 
         if doc_type == "excel":
-            df = pd.read_excel(doc_obj.file)
-        else:
-            df = pd.read_csv(doc_obj.file, delimiter=self.determine_csv_delimiter(doc_obj))
+            with stages.stage("parse"):
+                df = pd.read_excel(doc_obj.file)
+            yield df
+            return
 
-        return df
+        with stages.stage("sniff"):
+            delimiter = self.determine_csv_delimiter(doc_obj)
+        reader = pd.read_csv(doc_obj.file, delimiter=delimiter, chunksize=chunk_size.size)
+        try:
+            while True:
+                with stages.stage("parse"):
+                    try:
+                        df = reader.get_chunk(chunk_size.size)
+                    except StopIteration:
+                        return
+                yield df
+        finally:
+            reader.close()
 
     def reformat_lease_start_date(self, lease_date):
         """
@@ -109,60 +145,259 @@ class PortfolioDataProcessorTask(Task):
 
         mail_receiver = config("MAIL_RECEIVER")
         passed = True
+        touched_asset_ids, touched_portfolio_ids = set(), set()
+        stages, rows_written = StageTimer(), Counter()
+        chunk_size = AdaptiveChunkSize(
+                settings.INGESTION_MEMORY_BUDGET * 1024 * 1024, settings.INGESTION_CHUNK_SIZE,
+                settings.INGESTION_MIN_CHUNK_SIZE, settings.INGESTION_MAX_CHUNK_SIZE
+        )
+        started = time.monotonic()
 
-        try:
-            doc_obj = Document.objects.get(id=int(doc_id))
-            df = self.accumulate_df(doc_obj)
-            rows_count = max(df.count())
-
-            for index in range(rows_count):
-                portfolio, __ = Portfolio.objects.update_or_create(name=df.portfolio[index])
-                asset, asset_created = Asset.objects.get_or_create(
-                        portfolio=portfolio, reference=df.asset_ref[index], city=df.asset_city[index],
-                        address=df.asset_address[index], zipcode=df.asset_zipcode[index],
-                        is_restricted=df.asset_is_restricted[index], year_of_construction=df.asset_yoc[index]
-                )
+        # The KPIs of the touched assets are refreshed once all the rows are written, not after every unit
+        with PeakMemory() as memory, batched_unit_changes():
+            try:
+                with stages.stage("read"):
+                    doc_obj = Document.objects.get(id=int(doc_id))
+                    doc_obj.file.open("rb")
+                for df in self.read_chunks(doc_obj, chunk_size, stages):
+                    for index in df.index:
+                        with stages.stage("db_lookup"):
+                            portfolio, __ = Portfolio.objects.update_or_create(name=df.portfolio[index])
+                            asset, asset_created = Asset.objects.get_or_create(
+                                    portfolio=portfolio, reference=df.asset_ref[index], city=df.asset_city[index],
+                                    address=df.asset_address[index], zipcode=df.asset_zipcode[index],
+                                    is_restricted=df.asset_is_restricted[index],
+                                    year_of_construction=df.asset_yoc[index]
+                            )
+                        touched_asset_ids.add(asset.id)
+                        touched_portfolio_ids.add(portfolio.id)
+
+                        with stages.stage("normalize"):
+                            unit_dict = {
+                                "asset": asset,
+                                "reference": df.unit_ref[index],
+                                "is_rented": str(df.unit_is_rented[index]).capitalize(),
+                                "size": int(df.unit_size[index]),
+                                "unit_type": self._unit_type(df.unit_type[index])
+                            }
+                            if not pd.isnull(df.unit_tenant[index]):
+                                unit_dict.update({"tenant": df.unit_tenant[index]})
+                                # Read as integers by the chunks whose every unit has a rent
+                                unit_dict.update({"rent": Decimal(float(df.unit_rent[index]))})
+                                unit_dict.update({
+                                    "lease_start": self.reformat_lease_start_date(df.unit_lease_start[index])
+                                })
+                            if not pd.isnull(df.unit_lease_end[index]):
+                                unit_dict.update({
+                                    "lease_end": self.reformat_lease_end_date(df.unit_lease_end[index])
+                                })
+
+                        with stages.stage("db_lookup"):
+                            unit = Unit.objects.filter(
+                                    reference=df.unit_ref[index], unit_type=self._unit_type(df.unit_type[index])
+                            )
+                            previous_assets = set(unit.values_list("asset_id", "asset__portfolio_id"))
+                            outcome = "created"
+                            if previous_assets:
+                                outcome = "unchanged" if unit.filter(**unit_dict).exists() else "updated"
+
+                        with stages.stage("db_write"):
+                            if outcome == "updated":
+                                current_time = timezone.now()
+                                unit_dict.update({"updated_at": current_time})
+                                unit.update(**unit_dict)
+                                asset.updated_at = current_time
+                                asset.save()
+                                # The KPIs of the assets the units were moved away from change too
+                                touched_asset_ids.update(asset_id for asset_id, __ in previous_assets)
+                                touched_portfolio_ids.update(portfolio_id for __, portfolio_id in previous_assets)
+                            elif outcome == "created":
+                                Unit.objects.create(**unit_dict)
+                        rows_written[outcome] += 1
+                    # Sampled once the chunk is written, what reading and writing it took
+                    chunk_size.update(memory.growth())
 
-                unit_dict = {
-                    "asset": asset,
-                    "reference": df.unit_ref[index],
-                    "is_rented": str(df.unit_is_rented[index]).capitalize(),
-                    "size": int(df.unit_size[index]),
-                    "unit_type": self._unit_type(df.unit_type[index])
-                }
-                if not pd.isnull(df.unit_tenant[index]):
-                    unit_dict.update({"tenant": df.unit_tenant[index]})
-                    unit_dict.update({"rent": Decimal(df.unit_rent[index])})
-                    unit_dict.update({"lease_start": self.reformat_lease_start_date(df.unit_lease_start[index])})
-                if not pd.isnull(df.unit_lease_end[index]):
-                    unit_dict.update({"lease_end": self.reformat_lease_end_date(df.unit_lease_end[index])})
-
-                unit = Unit.objects.filter(
-                        reference=df.unit_ref[index], unit_type=self._unit_type(df.unit_type[index])
+                with stages.stage("db_write"):
+                    # Keep the precomputed KPIs the assets are filtered and sorted by in sync with the imported units
+                    refresh_asset_kpis(touched_asset_ids)
+                    # Keep their history so trends don't have to replay the older documents
+                    snapshot_asset_kpis(touched_asset_ids, document=doc_obj)
+
+                QUEUE_TASKS_LOGGER.debug(
+                        "[PortfolioDataProcessorTask - PASSED]\nProcessed successfully and mail sent to %s",
+                        mail_receiver
+                )
+            except (Document.DoesNotExist, Exception) as err:
+                QUEUE_TASKS_LOGGER.debug(
+                        "[PortfolioDataProcessorTask - FAILED]\nProcessing failure and mail sent to %s\nError%s",
+                        mail_receiver, err.args[0]
                 )
+                passed = False
+
+            # Rows may have been written even when the import failed midway, so the caches are refreshed either way,
+            # and the reads stay on the primary until the replicas caught up with them
+            with stages.stage("notify"):
+                stick_to_primary()
+                try:
+                    WarmImportCachesTask.delay(sorted(touched_asset_ids), sorted(touched_portfolio_ids), passed)
+                except Exception as err:
+                    # The broker can't be reached, the new data is published cold and the email sent from here
+                    QUEUE_TASKS_LOGGER.debug(
+                            "[PortfolioDataProcessorTask - UNQUEUED]\nWarming not queued\nError%s", err.args
+                    )
+                    bump_data_version()
+                    self.follow_up_email(passed)
+
+        self.record_metrics(stages, rows_written, time.monotonic() - started, memory.peak, chunk_size.sizes, passed)
+        # Kept along with the document, to tell how close the imports get to their memory budget
+        Document.objects.filter(id=doc_id).update(peak_memory=memory.peak, chunk_sizes=chunk_size.sizes)
+        return None
+
+    def record_metrics(self, stages, rows_written, elapsed, peak_memory, chunk_sizes, passed):
+        """
+        Records the metrics of one import, exposed by `MetricsAPIView`
+        :param stages: `StageTimer` of the import
+        :param rows_written: number of rows per outcome, `created`, `updated` or `unchanged`
+        :param elapsed: duration of the import, in seconds
+        :param peak_memory: highest memory allocated by the import, in bytes
+        :param chunk_sizes: number of rows of the chunks picked in turn by the import
+        :param passed: is the file passed processing successfully or not
+        """
+        stages.observe("ingestion_stage_seconds")
+        for outcome, count in rows_written.items():
+            METRICS.increment("ingestion_rows_written_total", count, outcome=outcome)
+        METRICS.increment("ingestion_tasks_total", outcome="passed" if passed else "failed")
+        METRICS.gauge("ingestion_rows_per_second", sum(rows_written.values()) / elapsed if elapsed else 0)
+        METRICS.gauge("ingestion_peak_memory_bytes", peak_memory)
+        METRICS.gauge("ingestion_chunk_size", chunk_sizes[-1])
+
+        QUEUE_TASKS_LOGGER.debug(
+                "[PortfolioDataProcessorTask - METRICS]\n%s rows in %.3f seconds, peak memory %s bytes",
+                sum(rows_written.values()), elapsed, peak_memory, extra={"data": {
+                    "stages": dict(stages.durations), "rows_written": dict(rows_written), "peak_memory": peak_memory,
+                    "chunk_sizes": chunk_sizes
+                }}
+        )
+
 
-                if unit.exists():
-                    if not unit.filter(**unit_dict).exists():
-                        current_time = timezone.now()
-                        unit_dict.update({"updated_at": current_time})
-                        unit.update(**unit_dict)
-                        asset.updated_at = current_time
-                        asset.save()
-                else:
-                    Unit.objects.create(**unit_dict)
+PortfolioDataProcessorTask = app.register_task(PortfolioDataProcessorTask())
+
+
+class WarmImportCachesTask(Task):
+    """
+    Warms the cached results of the assets and portfolios an import touched, then sends its follow up email
+    """
+
+    def run(self, asset_ids, portfolio_ids, passed, *args, **kwargs):
+        """
+        :param asset_ids: ids of the assets touched by the import
+        :param portfolio_ids: ids of the portfolios touched by the import
+        :param passed: is the file passed processing successfully or not
+        :return Send email after warming the caches
+        """
+        stages = StageTimer()
+        try:
+            with stages.stage("warm"):
+                refresh_caches(asset_ids, portfolio_ids)
+        except Exception as err:
+            # The new data is published cold rather than held back
+            bump_data_version()
+            QUEUE_TASKS_LOGGER.debug("[WarmImportCachesTask - FAILED]\nWarming failure\nError%s", err.args)
+
+        with stages.stage("notify"):
+            PortfolioDataProcessorTask.follow_up_email(passed)
+        stages.observe("ingestion_stage_seconds")
+        return None
 
+
+WarmImportCachesTask = app.register_task(WarmImportCachesTask())
+
+
+class RecomputeAssetKPIsBatchTask(Task):
+    """
+    Recomputes the time dependent KPIs of a range of assets, the last batch of a run refreshes the caches
+    """
+
+    def run(self, first_asset_id, last_asset_id, current_year, run_id, *args, **kwargs):
+        """
+        :param first_asset_id: first asset id of the batch
+        :param last_asset_id: last asset id of the batch, included
+        :param current_year: the year the remaining lease terms are measured against, the same for the whole run
+        :param run_id: identifies the recomputation run the batch belongs to
+        :return: number of recomputed assets
+        """
+        recomputed = recompute_asset_walt(first_asset_id, last_asset_id, current_year=current_year)
+
+        remaining = KPIRecomputeRun.count_down(run_id)
+        if remaining is None:
             QUEUE_TASKS_LOGGER.debug(
-                    f"[PortfolioDataProcessorTask - PASSED]\nProcessed successfully and mail sent to {mail_receiver}"
+                    "[RecomputeAssetKPIsBatchTask - UNTRACKED]\nRun %s counter is gone, caches left as is", run_id
             )
-        except (Document.DoesNotExist, Exception) as err:
-            QUEUE_TASKS_LOGGER.debug(
-                    f"[PortfolioDataProcessorTask - FAILED]\n"
-                    f"Processing failure and mail sent to {mail_receiver}\nError{err.args[0]}"
+            return recomputed
+
+        if remaining == 0:
+            KPIRecomputeRun.objects.filter(run_id=run_id).delete()
+            refresh_caches()
+            QUEUE_TASKS_LOGGER.debug("[RecomputeTimeDependentKPIsTask - PASSED]\nRun %s recomputed", run_id)
+
+        return recomputed
+
+
+RecomputeAssetKPIsBatchTask = app.register_task(RecomputeAssetKPIsBatchTask())
+
+
+class RecomputeTimeDependentKPIsTask(Task):
+    """
+    Periodically recomputes the KPIs that go stale with time alone, e.g. the WALT at the year boundary
+    """
+
+    def run(self, current_year=None, *args, **kwargs):
+        """
+        Splits the assets into batches spread over the workers at random delays within KPI_RECOMPUTE_SPREAD, so the
+        recomputation neither floods the database at once nor waits for the first dashboard hit. Readers keep being
+        served the previous results until the last batch publishes the warmed ones.
+        :param current_year: the year the remaining lease terms are measured against, defaults to the current year
+        :return: number of dispatched batches
+        """
+        current_year = current_year or timezone.now().year
+        run_id = uuid.uuid4().hex
+        ranges = list(asset_id_ranges())
+        if not ranges:
+            refresh_caches()
+            return 0
+
+        # The runs whose batches got lost never count down to zero
+        KPIRecomputeRun.objects.filter(
+                created_at__lt=timezone.now() - timedelta(seconds=settings.KPI_RECOMPUTE_SPREAD + 3600)
+        ).delete()
+        KPIRecomputeRun.objects.create(run_id=run_id, remaining=len(ranges))
+        for first_asset_id, last_asset_id in ranges:
+            RecomputeAssetKPIsBatchTask.apply_async(
+                    args=(first_asset_id, last_asset_id, current_year, run_id),
+                    countdown=random.uniform(0, settings.KPI_RECOMPUTE_SPREAD)
             )
-            passed = False
 
-        self.follow_up_email(passed)
-        return None
+        QUEUE_TASKS_LOGGER.debug(
+                "[RecomputeTimeDependentKPIsTask - DISPATCHED]\nRun %s: %s batch(es) for %s",
+                run_id, len(ranges), current_year
+        )
+        return len(ranges)
 
 
-PortfolioDataProcessorTask = app.register_task(PortfolioDataProcessorTask())
+RecomputeTimeDependentKPIsTask = app.register_task(RecomputeTimeDependentKPIsTask())
+
+
+# Persistent and health checked database connections in the workers children
+worker_process_init.connect(keep_worker_connections)
+task_prerun.connect(checkout_connections)
+task_postrun.connect(release_connections)
+worker_process_shutdown.connect(log_connection_metrics)
+
+# The records of every task carry its id, the ones still queued are written before the workers children exit
+task_prerun.connect(bind_task_job_id)
+task_postrun.connect(unbind_task_job_id)
+worker_process_shutdown.connect(flush_logs)
+
+# The metrics of the workers children are written to METRICS_DIR, so they can be served by the app
+task_postrun.connect(write_process_metrics)
+worker_process_shutdown.connect(retire_process_metrics)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..admin.performance import ApproximateCountPaginator
+from ..models import Asset, Portfolio, Unit
+
+
+UNITS_CHANGELIST_URL = reverse("admin:core_unit_changelist")
+ASSETS_CHANGELIST_URL = reverse("admin:core_asset_changelist")
+AUTOCOMPLETE_URL = reverse("admin:autocomplete")
+
+
+class LargeTableAdminTests(TestCase):
+    """
+    Tests for the admin changelists of the assets and units
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.portfolio = Portfolio.objects.create(name="Test Portfolio")
+        self.assets = [
+            Asset.objects.create(
+                    portfolio=self.portfolio, reference=f"A_{number}", city="Berlin", address="Am Kupfergraben 6",
+                    zipcode=10117, year_of_construction=2000
+            )
+            for number in range(1, 3)
+        ]
+        self.create_units(2)
+        self.client.force_login(get_user_model().objects.create_superuser("admin", "admin@example.com", "password"))
+
+    def create_units(self, count):
+        """Create `count` units spread over the assets"""
+        for number in range(count):
+            Unit.objects.create(
+                    asset=self.assets[number % 2], reference=f"U_{Unit.objects.count()}", is_rented=True, size=100,
+                    rent=Decimal(1000), tenant="Mohamed Mamdouh"
+            )
+
+    def changelist_queries(self, url):
+        """Return the number of queries run to serve a changelist"""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_changelist_queries_do_not_grow_with_the_rows(self):
+        """Test the assets of the listed units are joined instead of being loaded one by one"""
+        queries = self.changelist_queries(UNITS_CHANGELIST_URL)
+        self.create_units(6)
+
+        self.assertEqual(self.changelist_queries(UNITS_CHANGELIST_URL), queries)
+
+    def test_filtering_units_by_autocompleted_asset(self):
+        """Test filtering the units on the asset picked through the autocomplete filter"""
+        response = self.client.get(UNITS_CHANGELIST_URL, {"asset__id__exact": self.assets[0].id})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["cl"].result_count, 1)
+        self.assertContains(response, 'class="admin-autocomplete-filter admin-autocomplete"')
+        self.assertContains(response, f'<option value="{self.assets[0].id}" selected>A_1</option>', html=True)
+        self.assertNotContains(response, f'<option value="{self.assets[1].id}"')
+
+    def test_autocompleting_the_assets_filter(self):
+        """Test the assets offered by the units filter are searched by reference"""
+        response = self.client.get(AUTOCOMPLETE_URL, {
+            "app_label": "core", "model_name": "unit", "field_name": "asset", "term": "A_2",
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result["text"] for result in response.json()["results"]], ["A_2"])
+
+    @override_settings(ADMIN_SLOW_PAGE_SECONDS=0)
+    def test_slow_changelist_is_logged(self):
+        """Test the changelists slower than the threshold are logged along with their number of queries"""
+        with self.assertLogs("admin_performance", level="WARNING") as logs:
+            self.client.get(ASSETS_CHANGELIST_URL)
+
+        self.assertIn("[SLOW ADMIN PAGE]", logs.output[0])
+        self.assertIn(ASSETS_CHANGELIST_URL, logs.output[0])
+
+    @override_settings(ADMIN_EXACT_COUNT_THRESHOLD=1000)
+    def test_large_tables_are_counted_from_the_planner_estimate(self):
+        """Test the paginator only counts the rows exactly while the planner expects few of them"""
+        with patch("core.admin.performance.estimated_count", return_value=2500000):
+            self.assertEqual(ApproximateCountPaginator(Unit.objects.all(), 100).count, 2500000)
+        with patch("core.admin.performance.estimated_count", return_value=10):
+            self.assertEqual(ApproximateCountPaginator(Unit.objects.all(), 100).count, 2)
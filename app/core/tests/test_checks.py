@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.test import SimpleTestCase, override_settings
+
+from ..checks import check_shared_cache
+
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+MEMCACHED_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache", "LOCATION": "memcached:11211"}
+}
+
+
+class CheckTests(SimpleTestCase):
+    """
+    Tests for the core app system checks
+    """
+
+    @override_settings(CACHES=LOCMEM_CACHES, AGGREGATION_CACHE_TIMEOUT=0, FORECAST_CACHE_TIMEOUT=3600)
+    def test_version_keyed_caches_need_a_shared_cache(self):
+        """Test the version keyed caches are refused on a cache private to every process"""
+        errors = check_shared_cache(None)
+
+        self.assertEqual([error.id for error in errors], ["core.E001"])
+        self.assertIn("FORECAST_CACHE_TIMEOUT", errors[0].msg)
+
+    @override_settings(CACHES=MEMCACHED_CACHES, AGGREGATION_CACHE_TIMEOUT=60, FORECAST_CACHE_TIMEOUT=3600)
+    def test_version_keyed_caches_on_a_shared_cache(self):
+        """Test the version keyed caches are accepted on a shared cache, and on any cache when they're off"""
+        self.assertEqual(check_shared_cache(None), [])
+        with self.settings(CACHES=LOCMEM_CACHES, AGGREGATION_CACHE_TIMEOUT=0, FORECAST_CACHE_TIMEOUT=0):
+            self.assertEqual(check_shared_cache(None), [])
+
+    @override_settings(CACHES=LOCMEM_CACHES, AGGREGATION_CACHE_TIMEOUT=0, FORECAST_CACHE_TIMEOUT=0,
+                       DATABASE_REPLICAS=["replica"])
+    def test_read_replicas_need_a_shared_cache(self):
+        """Test the read replicas are refused on a cache private to every process, the app would miss the imports"""
+        errors = check_shared_cache(None)
+
+        self.assertEqual([error.id for error in errors], ["core.E001"])
+        self.assertIn("DATABASE_REPLICAS", errors[0].msg)
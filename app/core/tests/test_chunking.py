@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.test import SimpleTestCase
+
+from ..chunking import AdaptiveChunkSize
+
+
+class AdaptiveChunkSizeTests(SimpleTestCase):
+    """
+    Tests for the chunk sizes adapted to the memory budget of the imports
+    """
+
+    def test_chunks_shrink_under_memory_pressure(self):
+        """Test the chunks shrink as soon as one goes over the high watermark of the budget"""
+        chunk_size = AdaptiveChunkSize(budget=1000, size=1000, minimum=10, maximum=10000)
+
+        self.assertEqual(chunk_size.update(memory=1300), 500)
+        self.assertEqual(chunk_size.update(memory=700), 500)
+        self.assertEqual(chunk_size.sizes, [1000, 500])
+
+    def test_chunks_grow_with_headroom(self):
+        """Test the chunks grow at most twice as big at once while they stay under the low watermark"""
+        chunk_size = AdaptiveChunkSize(budget=1000, size=1000, minimum=10, maximum=3000)
+
+        self.assertEqual(chunk_size.update(memory=325), 2000)
+        self.assertEqual(chunk_size.update(memory=10), 3000)
+        self.assertEqual(chunk_size.update(memory=0), 3000)
+        self.assertEqual(chunk_size.sizes, [1000, 2000, 3000])
+
+    def test_chunks_stay_within_bounds(self):
+        """Test the chunks never get smaller than the minimum, even over budget"""
+        chunk_size = AdaptiveChunkSize(budget=1000, size=5, minimum=10, maximum=100)
+
+        self.assertEqual(chunk_size.size, 10)
+        self.assertEqual(chunk_size.update(memory=100000), 10)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from ..caching import bump_data_version
+from ..columnar import ColumnarUnits, columnar_asset_kpis, get_columnar_units
+from ..kpis import compute_asset_kpis
+from ..models import Asset, Portfolio, Unit
+
+
+class ColumnarKPIEngineTests(TestCase):
+    """
+    Tests for the in memory columnar KPI engine
+    """
+
+    def create_assets_with_units(self):
+        """Create three assets, one of them without any units"""
+        portfolio = Portfolio.objects.create(name="Test Portfolio")
+        self.assets = [
+            Asset.objects.create(
+                    portfolio=portfolio, reference=f"A_{index}", city="Berlin", address=f"Am Kupfergraben {index}",
+                    zipcode=10117, is_restricted=False, year_of_construction=2000
+            )
+            for index in range(3)
+        ]
+        Unit.objects.create(
+                asset=self.assets[0], reference="A_0_1", is_rented=True, size=900, rent=Decimal("5000.50"),
+                tenant="Tenant", lease_start="2020-08-01", lease_end="2030-07-31"
+        )
+        Unit.objects.create(
+                asset=self.assets[0], reference="A_0_2", is_rented=True, size=100, rent=Decimal(1000), tenant="Tenant"
+        )
+        Unit.objects.create(asset=self.assets[0], reference="A_0_3", is_rented=False, size=50)
+        Unit.objects.create(asset=self.assets[1], reference="A_1_1", is_rented=False, size=400)
+
+    def setUp(self):
+        cache.clear()
+        self.create_assets_with_units()
+
+    def test_columnar_kpis_match_the_database_ones(self):
+        """Test the vectorized KPIs are the same values the database computes"""
+        asset_ids = [asset.id for asset in self.assets]
+        snapshot = ColumnarUnits.load(version=1, memory_budget=1024 * 1024)
+        columnar_kpis, missing = snapshot.compute(asset_ids, current_year=2020)
+
+        self.assertEqual(missing, [])
+        self.assertEqual(columnar_kpis, compute_asset_kpis(asset_ids, current_year=2020))
+
+    def test_columnar_snapshot_over_the_memory_budget(self):
+        """Test the engine falls back to the database when the units don't fit the memory budget"""
+        with override_settings(COLUMNAR_KPI_ENGINE=True, COLUMNAR_KPI_MEMORY_BUDGET=0):
+            bump_data_version()
+
+            self.assertIsNone(get_columnar_units())
+            self.assertEqual(columnar_asset_kpis([self.assets[0].id])[self.assets[0].id]["number_of_units"], 3)
+
+    @override_settings(COLUMNAR_KPI_ENGINE=True)
+    def test_columnar_snapshot_is_rebuilt_on_new_data_version(self):
+        """Test the snapshot is reused until the data version moves forward, assets created since are read by SQL"""
+        bump_data_version()
+        snapshot = get_columnar_units()
+        new_asset = Asset.objects.create(
+                portfolio=self.assets[0].portfolio, reference="A_3", city="Berlin", address="Am Kupfergraben 3",
+                zipcode=10117, is_restricted=False, year_of_construction=2000
+        )
+        Unit.objects.create(asset=new_asset, reference="A_3_1", is_rented=False, size=10)
+
+        self.assertIs(get_columnar_units(), snapshot)
+        self.assertEqual(columnar_asset_kpis([new_asset.id])[new_asset.id]["total_area"], 10)
+        bump_data_version()
+        self.assertIsNot(get_columnar_units(), snapshot)
+        self.assertIn(new_asset.id, get_columnar_units().asset_ids)
+
+    @override_settings(COLUMNAR_KPI_ENGINE=True)
+    def test_columnar_snapshot_is_rebuilt_on_unit_edits(self):
+        """Test editing a unit moves the data version forward, so the snapshot of every process is rebuilt"""
+        bump_data_version()
+        snapshot = get_columnar_units()
+        unit = Unit.objects.get(reference="A_1_1")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            unit.size = 500
+            unit.save()
+
+        self.assertIsNot(get_columnar_units(), snapshot)
+        self.assertEqual(columnar_asset_kpis([self.assets[1].id])[self.assets[1].id]["total_area"], 500)
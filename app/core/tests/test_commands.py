@@ -1,12 +1,18 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from unittest.mock import patch
+from io import StringIO
+from unittest.mock import MagicMock, call, patch
 
+from django.core.cache import cache
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
 from django.test import TestCase
 
+from ..caching import get_data_version
+from ..models import Asset, AssetKPI, Portfolio
+
 
 class CommandTests(TestCase):
     """
@@ -16,16 +22,42 @@ class CommandTests(TestCase):
     def test_wait_for_db_ready(self):
         """Test waiting for db when db is available"""
         with patch("django.db.utils.ConnectionHandler.__getitem__") as gi:
-            gi.return_value = True
+            gi.return_value = MagicMock()
             call_command("wait_for_db")
 
             self.assertEqual(gi.call_count, 1)
+            gi.return_value.cursor.return_value.__enter__.return_value.execute.assert_called_once_with("SELECT 1")
 
     @patch('time.sleep', return_value=True)
     def test_wait_for_db(self, ts):
         """Test waiting for db"""
         with patch("django.db.utils.ConnectionHandler.__getitem__") as gi:
-            gi.side_effect = [OperationalError]*5 + [True]
+            gi.side_effect = [OperationalError]*5 + [MagicMock()]
             call_command("wait_for_db")
 
             self.assertEqual(gi.call_count, 6)
+            self.assertEqual(ts.call_args_list, [call(0.5), call(1), call(2), call(4), call(5)])
+
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_db_timeout(self, ts):
+        """Test waiting for db gives up once the timeout is over"""
+        with patch("django.db.utils.ConnectionHandler.__getitem__") as gi:
+            gi.side_effect = OperationalError
+
+            with self.assertRaises(CommandError):
+                call_command("wait_for_db", timeout=0)
+
+    def test_refresh_asset_kpis(self):
+        """Test refreshing the KPIs of the assets moves the data version forward"""
+        cache.clear()
+        portfolio = Portfolio.objects.create(name="Test Portfolio")
+        asset = Asset.objects.create(
+                portfolio=portfolio, reference="A_1", city="Berlin", address="Am Kupfergraben 6", zipcode=10117,
+                year_of_construction=2000
+        )
+        version = get_data_version()
+
+        call_command("refresh_asset_kpis", "A_1", stdout=StringIO())
+
+        self.assertTrue(AssetKPI.objects.filter(asset=asset).exists())
+        self.assertGreater(get_data_version(), version)
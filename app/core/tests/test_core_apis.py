@@ -1,17 +1,37 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import csv
 from decimal import Decimal
+import gzip
+import io
+import json
 
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 
+from ..caching import bump_data_version
+from ..kpis import refresh_asset_kpis, snapshot_asset_kpis
 from ..models import Portfolio, Asset, Unit
+from ..serializers import AssetInfoAggregationWriteSerializer
+from ..utils import add_months
+from ..views import async_assets_aggregation_view
 
 
 ASSETS_INFO_AGGREGATION_API_URL = reverse("core:aggregate_assets")
+ASSETS_INFO_EXPORT_API_URL = reverse("core:export_assets")
+ASSETS_KPI_TREND_API_URL = reverse("core:assets_kpi_trend")
+PORTFOLIOS_INFO_AGGREGATION_API_URL = reverse("core:aggregate_portfolios")
+GEO_INFO_AGGREGATION_API_URL = reverse("core:aggregate_assets_geo")
+EXPIRING_LEASES_API_URL = reverse("core:expiring_leases")
+ASSETS_SEARCH_API_URL = reverse("core:search_assets")
+FORECAST_API_URL = reverse("core:forecast")
 UPLOAD_FILE_API_URL = reverse("core:upload_file-list")
 
 
@@ -64,6 +84,8 @@ class PublicCoreAPIsTests(TestCase):
         )
 
     def setUp(self):
+        # Throttling history lives in the cache, start every test with a fresh budget
+        cache.clear()
         self.create_new_portfolio()
         self.create_new_assets()
         self.create_new_units()
@@ -71,12 +93,94 @@ class PublicCoreAPIsTests(TestCase):
 
     def test_retrieving_all_assets_aggregated_info(self):
         """Test retrieving all assets aggregated info API endpoint"""
-        response = self.client.get(ASSETS_INFO_AGGREGATION_API_URL)
+        response = self.client.get(ASSETS_INFO_AGGREGATION_API_URL, {"with_count": "true"})
         all_assets = Asset.objects.all().order_by("-updated_at")
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["count"], all_assets.count())
 
+    def test_assets_listing_skips_count_by_default(self):
+        """Test the assets listing doesn't count the whole table unless asked to"""
+        response = self.client.get(ASSETS_INFO_AGGREGATION_API_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("count", response.data)
+        self.assertEqual(len(response.data["results"]), 2)
+
+    def test_walking_assets_with_keyset_cursor(self):
+        """Test walking the assets listing page by page through the next and previous cursors"""
+        first_page = self.client.get(ASSETS_INFO_AGGREGATION_API_URL, {"page_size": 1})
+        second_page = self.client.get(first_page.data["next"])
+        previous_page = self.client.get(second_page.data["previous"])
+
+        self.assertEqual(first_page.data["results"][0]["address"], self.address_2)
+        self.assertIsNone(first_page.data["previous"])
+        self.assertEqual(second_page.data["results"][0]["address"], self.address_1)
+        self.assertIsNone(second_page.data["next"])
+        self.assertEqual(previous_page.data["results"], first_page.data["results"])
+
+    @override_settings(ASSETS_MAX_PAGE_SIZE=1)
+    def test_assets_page_size_is_capped_by_server_maximum(self):
+        """Test the client selected page size can't exceed the configured maximum"""
+        response = self.client.get(ASSETS_INFO_AGGREGATION_API_URL, {"page_size": 100})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertIsNotNone(response.data["next"])
+
+    def test_assets_listing_with_invalid_cursor(self):
+        """Test a tampered cursor is rejected"""
+        response = self.client.get(ASSETS_INFO_AGGREGATION_API_URL, {"cursor": "bm90LWEtY3Vyc29y"})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_retrieving_assets_aggregated_info_from_columnar_engine(self):
+        """Test the columnar KPI engine renders exactly the same payload as the database aggregation"""
+        database_response = self.client.get(ASSETS_INFO_AGGREGATION_API_URL)
+        with override_settings(COLUMNAR_KPI_ENGINE=True):
+            bump_data_version()
+            columnar_response = self.client.get(ASSETS_INFO_AGGREGATION_API_URL)
+
+        self.assertEqual(columnar_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(columnar_response.content, database_response.content)
+
+    def test_assets_aggregated_info_fast_rendering_matches_serializer(self):
+        """Test the lean payloads rendered by the fast JSON renderer are the exact bytes of the serializer ones"""
+        Asset.objects.create(
+                portfolio=self.portfolio_obj, reference="A_3", city="Düsseldorf", address="Königsallee\u2028 1",
+                zipcode=40212, is_restricted=True, year_of_construction=1990
+        )
+        assets = Asset.objects.order_by("-updated_at", "-id")
+        for fields in (None, ["city", "total_rent", "latest_update"]):
+            response = self.client.get(ASSETS_INFO_AGGREGATION_API_URL, {"fields": ",".join(fields)} if fields else {})
+            serialized = AssetInfoAggregationWriteSerializer(assets, many=True, context={"fields": fields}).data
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(
+                    response.content, JSONRenderer().render({"next": None, "previous": None, "results": serialized})
+            )
+
+    @override_settings(AGGREGATION_CACHE_TIMEOUT=60)
+    def test_retrieving_cached_assets_aggregated_info(self):
+        """Test the assets payloads are cached, only the page itself is queried once they are"""
+        cold_response = self.client.get(ASSETS_INFO_AGGREGATION_API_URL)
+        with self.assertNumQueries(1):
+            cached_response = self.client.get(ASSETS_INFO_AGGREGATION_API_URL)
+
+        self.assertEqual(cached_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(cached_response.content, cold_response.content)
+
+    @override_settings(AGGREGATION_CACHE_TIMEOUT=60)
+    def test_retrieving_cached_portfolios_aggregated_info(self):
+        """Test the portfolios payloads are cached and match the ones aggregated on the fly"""
+        with override_settings(AGGREGATION_CACHE_TIMEOUT=0):
+            uncached_response = self.client.get(PORTFOLIOS_INFO_AGGREGATION_API_URL)
+        self.client.get(PORTFOLIOS_INFO_AGGREGATION_API_URL)
+        with self.assertNumQueries(1):
+            cached_response = self.client.get(PORTFOLIOS_INFO_AGGREGATION_API_URL)
+
+        self.assertEqual(cached_response.content, uncached_response.content)
+
     def test_retrieving_specific_asset_aggregated_info(self):
         """Test retrieving specific asset aggregated info API endpoint"""
         asset_obj = Asset.objects.get(reference="A_2")
@@ -85,6 +189,388 @@ class PublicCoreAPIsTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["results"][0]["address"], asset_obj.address)
 
+    def test_bulk_looking_up_assets_aggregated_info(self):
+        """Test looking up many assets aggregated info in one request"""
+        Unit.objects.create(asset=self.asset_obj_1, reference="A_1_2", is_rented=False, size=100)
+        payload = json.dumps({"asset_refs": [self.asset_1_reference, "A_404", self.asset_2_reference]})
+
+        with self.assertNumQueries(2):
+            response = self.client.generic(
+                    "GET", ASSETS_INFO_AGGREGATION_API_URL, payload, content_type="application/json"
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data["results"]), [self.asset_1_reference, self.asset_2_reference])
+        self.assertEqual(response.data["not_found"], ["A_404"])
+        self.assertEqual(response.data["results"][self.asset_1_reference]["number_of_units"], 2)
+        self.assertEqual(response.data["results"][self.asset_1_reference]["total_area"], 1000)
+        self.assertEqual(response.data["results"][self.asset_1_reference]["area_rented"], self.size)
+        self.assertEqual(response.data["results"][self.asset_1_reference]["vacancy"], "50.0 %")
+
+    @override_settings(ASSETS_BULK_LOOKUP_LIMIT=1)
+    def test_bulk_looking_up_assets_over_the_limit(self):
+        """Test bulk lookups are capped by the configured limit"""
+        payload = json.dumps({"asset_refs": [self.asset_1_reference, self.asset_2_reference]})
+        response = self.client.generic("GET", ASSETS_INFO_AGGREGATION_API_URL, payload, content_type="application/json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_exporting_assets_aggregated_info_as_csv(self):
+        """Test streaming all assets aggregated info as a CSV sheet"""
+        response = self.client.get(ASSETS_INFO_EXPORT_API_URL)
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode("utf-8"))))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual([row["reference"] for row in rows], [self.asset_1_reference, self.asset_2_reference])
+        self.assertEqual(rows[0]["total_area"], str(self.size))
+
+    @override_settings(ASSETS_EXPORT_CHUNK_SIZE=1)
+    def test_exporting_assets_aggregated_info_as_gzipped_ndjson(self):
+        """Test streaming all assets aggregated info as gzipped NDJSON in chunks"""
+        response = self.client.get(
+                ASSETS_INFO_EXPORT_API_URL, {"export_format": "ndjson"}, HTTP_ACCEPT_ENCODING="gzip"
+        )
+        lines = gzip.decompress(b"".join(response.streaming_content)).decode("utf-8").splitlines()
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[1])["reference"], self.asset_2_reference)
+        self.assertEqual(json.loads(lines[1])["vacancy"], 0.0)
+
+    def test_exporting_assets_with_unknown_format(self):
+        """Test exporting assets in an unsupported format"""
+        response = self.client.get(ASSETS_INFO_EXPORT_API_URL, {"export_format": "xml"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_retrieving_portfolios_aggregated_info(self):
+        """Test retrieving the KPIs rolled up per portfolio with a single query"""
+        Unit.objects.create(asset=self.asset_obj_1, reference="A_1_2", is_rented=False, size=200)
+        Portfolio.objects.create(name="Empty Portfolio")
+
+        with self.assertNumQueries(1):
+            response = self.client.get(PORTFOLIOS_INFO_AGGREGATION_API_URL)
+
+        results = {portfolio["name"]: portfolio for portfolio in response.data["results"]}
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(results[self.portfolio_name]["number_of_assets"], 2)
+        self.assertEqual(results[self.portfolio_name]["number_of_units"], 3)
+        self.assertEqual(results[self.portfolio_name]["total_area"], 2000)
+        self.assertEqual(results[self.portfolio_name]["total_rent"], 2 * self.rent)
+        self.assertEqual(results[self.portfolio_name]["vacancy"], "33.33 %")
+        self.assertEqual(results["Empty Portfolio"]["number_of_units"], 0)
+
+    def test_retrieving_specific_portfolio_aggregated_info(self):
+        """Test retrieving the KPIs of one portfolio filtered by its name"""
+        Portfolio.objects.create(name="Another Portfolio")
+        payload = json.dumps({"portfolio_name": self.portfolio_name})
+        response = self.client.generic(
+                "GET", PORTFOLIOS_INFO_AGGREGATION_API_URL, payload, content_type="application/json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([portfolio["name"] for portfolio in response.data["results"]], [self.portfolio_name])
+
+    def test_retrieving_assets_aggregated_info_by_city_and_zipcode(self):
+        """Test rolling up the assets KPIs by city and zipcode"""
+        other_portfolio = Portfolio.objects.create(name="Other Portfolio")
+        Asset.objects.create(
+                portfolio=other_portfolio, reference="A_3", city="Hamburg", address="Jungfernstieg 1", zipcode=20354,
+                year_of_construction=self.year_of_construction
+        )
+        payload = json.dumps({"group_by": ["zipcode", "city"]})
+
+        with self.assertNumQueries(1):
+            response = self.client.generic(
+                    "GET", GEO_INFO_AGGREGATION_API_URL, payload, content_type="application/json"
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(row["city"], row["zipcode"]) for row in response.data], [
+            ("Berlin", self.zipcode), ("Hamburg", 20354)
+        ])
+        self.assertEqual(response.data[0]["number_of_assets"], 2)
+        self.assertEqual(response.data[0]["total_area"], 2 * self.size)
+        self.assertEqual(response.data[1]["number_of_units"], 0)
+
+    def test_retrieving_assets_aggregated_info_by_zipcode_within_portfolio(self):
+        """Test rolling up the KPIs of one portfolio's assets by zipcode"""
+        payload = json.dumps({"group_by": ["zipcode"], "portfolio_name": "Missing Portfolio"})
+        response = self.client.generic("GET", GEO_INFO_AGGREGATION_API_URL, payload, content_type="application/json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [])
+
+    def test_filtering_and_sorting_assets_by_kpis(self):
+        """Test filtering and sorting the assets by their precomputed numeric KPIs"""
+        Unit.objects.create(asset=self.asset_obj_1, reference="A_1_2", is_rented=False, size=100)
+        Unit.objects.create(
+                asset=self.asset_obj_2, reference="A_2_2", is_rented=True, size=100, rent=Decimal(1000),
+                lease_end=f"{timezone.now().year + 3}-01-01"
+        )
+        refresh_asset_kpis(Asset.objects.values_list("id", flat=True))
+
+        vacant = self.client.generic(
+                "GET", ASSETS_INFO_AGGREGATION_API_URL, json.dumps({"vacancy_min": 40}), content_type="application/json"
+        )
+        by_rent = self.client.generic(
+                "GET", ASSETS_INFO_AGGREGATION_API_URL + "?page_size=1", json.dumps({"ordering": "-total_rent"}),
+                content_type="application/json"
+        )
+        next_by_rent = self.client.generic(
+                "GET", by_rent.data["next"], json.dumps({"ordering": "-total_rent"}), content_type="application/json"
+        )
+
+        self.assertEqual([asset["address"] for asset in vacant.data["results"]], [self.address_1])
+        self.assertEqual(by_rent.data["results"][0]["address"], self.address_2)
+        self.assertEqual(by_rent.data["results"][0]["walt"], "0.3 years")
+        self.assertEqual(next_by_rent.data["results"][0]["address"], self.address_1)
+        self.assertIsNone(next_by_rent.data["next"])
+
+    def create_assets_with_and_without_kpis(self):
+        """Create a cheap asset along with an asset without units, hence without KPIs"""
+        self.asset_obj_3 = Asset.objects.create(
+                portfolio=self.portfolio_obj, reference="A_3", city=self.city, address="Am Kupfergraben 3",
+                zipcode=self.zipcode, is_restricted=self.is_restricted, year_of_construction=self.year_of_construction
+        )
+        Unit.objects.create(asset=self.asset_obj_3, reference="A_3_1", is_rented=True, size=100, rent=Decimal(500))
+        Unit.objects.create(asset=self.asset_obj_2, reference="A_2_2", is_rented=True, size=100, rent=Decimal(1000))
+        refresh_asset_kpis(Asset.objects.values_list("id", flat=True))
+        Asset.objects.create(
+                portfolio=self.portfolio_obj, reference="A_4", city=self.city, address="Am Kupfergraben 4",
+                zipcode=self.zipcode, is_restricted=self.is_restricted, year_of_construction=self.year_of_construction
+        )
+
+    def test_walking_filtered_and_sorted_assets_through_next_links(self):
+        """Test the next links carry the KPI filters and ordering given in the request body"""
+        self.create_assets_with_and_without_kpis()
+        payload = json.dumps({"ordering": "-total_rent", "total_rent_min": 1000})
+        first_page = self.client.generic(
+                "GET", ASSETS_INFO_AGGREGATION_API_URL + "?page_size=1", payload, content_type="application/json"
+        )
+        second_page = self.client.get(first_page.data["next"])
+
+        self.assertEqual(second_page.status_code, status.HTTP_200_OK)
+        self.assertEqual(first_page.data["results"][0]["address"], self.address_2)
+        self.assertEqual(second_page.data["results"][0]["address"], self.address_1)
+        self.assertIsNone(second_page.data["next"])
+
+    def test_sorting_assets_by_kpis_lists_the_ones_without_kpis_last(self):
+        """Test the assets without KPIs are walked last, forwards and backwards"""
+        self.create_assets_with_and_without_kpis()
+        pages = [self.client.get(ASSETS_INFO_AGGREGATION_API_URL, {"ordering": "total_rent", "page_size": 1})]
+        while pages[-1].data["next"]:
+            pages.append(self.client.get(pages[-1].data["next"]))
+        previous_page = self.client.get(pages[-1].data["previous"])
+
+        self.assertEqual([page.data["results"][0]["address"] for page in pages], [
+            "Am Kupfergraben 3", self.address_1, self.address_2, "Am Kupfergraben 4"
+        ])
+        self.assertEqual(previous_page.data["results"], pages[-2].data["results"])
+
+    def test_filtering_assets_by_kpis_without_matches(self):
+        """Test filtering the assets by KPI ranges that match no asset"""
+        refresh_asset_kpis(Asset.objects.values_list("id", flat=True))
+        payload = json.dumps({"walt_min": 10})
+        response = self.client.generic("GET", ASSETS_INFO_AGGREGATION_API_URL, payload, content_type="application/json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"], [])
+
+    def test_retrieving_sparse_fieldset_of_assets_aggregated_info(self):
+        """Test only the requested fields are computed and returned"""
+        with self.assertNumQueries(2):
+            response = self.client.get(ASSETS_INFO_AGGREGATION_API_URL + "?fields=city,total_rent,total_area")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data["results"][0]), {"city", "total_rent", "total_area"})
+        self.assertEqual(response.data["results"][0]["total_area"], self.size)
+
+    def test_retrieving_sparse_fieldset_without_kpis(self):
+        """Test no aggregation query runs when no KPI is requested"""
+        payload = json.dumps({"fields": ["address", "restricted_area"]})
+
+        with self.assertNumQueries(1):
+            response = self.client.generic(
+                    "GET", ASSETS_INFO_AGGREGATION_API_URL, payload, content_type="application/json"
+            )
+
+        self.assertEqual(set(response.data["results"][0]), {"address", "restricted_area"})
+
+    def test_retrieving_sparse_fieldset_with_unknown_field(self):
+        """Test requesting fields the aggregation doesn't expose"""
+        response = self.client.get(ASSETS_INFO_AGGREGATION_API_URL + "?fields=city,password")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def create_expiring_leases(self):
+        """Create units whose leases end in one month, in two years and a vacant one"""
+        today = timezone.localdate()
+        Unit.objects.create(
+                asset=self.asset_obj_1, reference="A_1_2", is_rented=True, size=100, rent=Decimal(1000),
+                lease_end=add_months(today, 1)
+        )
+        Unit.objects.create(
+                asset=self.asset_obj_2, reference="A_2_2", is_rented=True, size=200, rent=Decimal(2000),
+                lease_end=add_months(today, 2)
+        )
+        Unit.objects.create(
+                asset=self.asset_obj_2, reference="A_2_3", is_rented=True, size=300, rent=Decimal(3000),
+                lease_end=add_months(today, 24)
+        )
+        Unit.objects.create(
+                asset=self.asset_obj_2, reference="A_2_4", is_rented=False, size=400, lease_end=add_months(today, 1)
+        )
+
+    def test_listing_expiring_leases(self):
+        """Test listing the rented units whose lease ends within the next months, soonest first"""
+        self.create_expiring_leases()
+        payload = json.dumps({"months": 6})
+        first_page = self.client.generic(
+                "GET", EXPIRING_LEASES_API_URL + "?page_size=1", payload, content_type="application/json"
+        )
+        second_page = self.client.generic("GET", first_page.data["next"], payload, content_type="application/json")
+
+        self.assertEqual(first_page.status_code, status.HTTP_200_OK)
+        self.assertEqual(first_page.data["results"][0]["reference"], "A_1_2")
+        self.assertEqual(first_page.data["results"][0]["portfolio"], self.portfolio_name)
+        self.assertEqual(second_page.data["results"][0]["reference"], "A_2_2")
+        self.assertIsNone(second_page.data["next"])
+
+    def test_walking_expiring_leases_through_next_links(self):
+        """Test the next links carry the window and portfolio of the first page"""
+        self.create_expiring_leases()
+        payload = json.dumps({"months": 36, "portfolio_name": self.portfolio_name})
+        pages = [self.client.generic(
+                "GET", EXPIRING_LEASES_API_URL + "?page_size=1", payload, content_type="application/json"
+        )]
+        while pages[-1].data["next"]:
+            pages.append(self.client.get(pages[-1].data["next"]))
+
+        self.assertEqual([page.data["results"][0]["reference"] for page in pages], ["A_1_2", "A_2_2", "A_2_3"])
+
+    def test_listing_expiring_leases_from_the_query_string(self):
+        """Test the window and portfolio can be given in the query string"""
+        self.create_expiring_leases()
+        response = self.client.get(EXPIRING_LEASES_API_URL, {"months": 36, "portfolio_name": "Other Portfolio"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"], [])
+
+    def test_counting_expiring_leases_per_asset(self):
+        """Test counting the expiring leases grouped by asset"""
+        self.create_expiring_leases()
+        payload = json.dumps({"months": 36, "group_by": "asset"})
+        response = self.client.generic("GET", EXPIRING_LEASES_API_URL, payload, content_type="application/json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(row["asset"], row["expiring_units"], row["expiring_area"]) for row in response.data], [
+            (self.asset_1_reference, 1, 100), (self.asset_2_reference, 2, 500)
+        ])
+
+    def test_retrieving_asset_kpis_trend(self):
+        """Test retrieving the KPIs snapshots of an asset within a window, oldest first"""
+        today = timezone.localdate()
+        refresh_asset_kpis([self.asset_obj_1.id])
+        snapshot_asset_kpis([self.asset_obj_1.id], snapshot_date=add_months(today, -13))
+        snapshot_asset_kpis([self.asset_obj_1.id], snapshot_date=add_months(today, -1))
+        Unit.objects.create(asset=self.asset_obj_1, reference="A_1_2", is_rented=False, size=100)
+        refresh_asset_kpis([self.asset_obj_1.id])
+        snapshot_asset_kpis([self.asset_obj_1.id])
+
+        payload = json.dumps({"asset_ref": self.asset_1_reference})
+        response = self.client.generic("GET", ASSETS_KPI_TREND_API_URL, payload, content_type="application/json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["asset"], self.asset_1_reference)
+        self.assertEqual([(row["snapshot_date"], row["vacancy"]) for row in response.data["snapshots"]], [
+            (add_months(today, -1).isoformat(), 0.0), (today.isoformat(), 50.0)
+        ])
+
+    def test_retrieving_unknown_asset_kpis_trend(self):
+        """Test retrieving the KPIs trend of an asset that doesn't exist"""
+        payload = json.dumps({"asset_ref": "unknown"})
+        response = self.client.generic("GET", ASSETS_KPI_TREND_API_URL, payload, content_type="application/json")
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_searching_assets_by_partial_address(self):
+        """Test searching the assets by a part of their address, walking the results page by page"""
+        first_page = self.client.get(ASSETS_SEARCH_API_URL, {"q": "kupfergraben", "page_size": 1})
+        second_page = self.client.get(first_page.data["next"])
+
+        self.assertEqual(first_page.status_code, status.HTTP_200_OK)
+        self.assertEqual(first_page.data["results"][0]["reference"], self.asset_2_reference)
+        self.assertEqual(first_page.data["results"][0]["portfolio"], self.portfolio_name)
+        self.assertEqual(second_page.data["results"][0]["reference"], self.asset_1_reference)
+        self.assertIsNone(second_page.data["next"])
+
+    def test_searching_assets_by_tenant(self):
+        """Test searching the assets by a part of the name of one of their tenants"""
+        Unit.objects.create(asset=self.asset_obj_1, reference="A_1_2", is_rented=True, size=100, tenant="Acme GmbH")
+        response = self.client.get(ASSETS_SEARCH_API_URL, {"q": "acme"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row["reference"] for row in response.data["results"]], [self.asset_1_reference])
+
+    def test_searching_assets_ranks_best_matches_first(self):
+        """Test an asset whose reference is the searched text comes before the ones merely matching it"""
+        Asset.objects.create(
+                portfolio=self.portfolio_obj, reference="BER", city="Hamburg", address="Jungfernstieg 1",
+                zipcode=20354, year_of_construction=self.year_of_construction
+        )
+        response = self.client.get(ASSETS_SEARCH_API_URL, {"q": "BER"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row["reference"] for row in response.data["results"]], [
+            "BER", self.asset_2_reference, self.asset_1_reference
+        ])
+        self.assertGreater(response.data["results"][0]["rank"], response.data["results"][1]["rank"])
+
+    def test_searching_assets_with_too_short_query(self):
+        """Test a search too short to be served by the trigram indexes is rejected"""
+        response = self.client.get(ASSETS_SEARCH_API_URL, {"q": "Am"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_forecasting_occupancy_and_rent_roll(self):
+        """Test projecting the occupied area and contracted rent month by month as leases expire"""
+        self.create_expiring_leases()
+        payload = json.dumps({"months": 4, "include_assets": True})
+        response = self.client.generic("GET", FORECAST_API_URL, payload, content_type="application/json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["months"]), 4)
+        portfolio = response.data["portfolios"][0]
+        self.assertEqual(portfolio["portfolio"], self.portfolio_name)
+        self.assertEqual(portfolio["total_area"], 2800)
+        self.assertEqual(portfolio["occupied_area"], [2400, 2400, 2300, 2100])
+        self.assertEqual(portfolio["contracted_rent"], [16000, 16000, 15000, 13000])
+        self.assertEqual([(asset["asset"], asset["occupied_area"]) for asset in portfolio["assets"]], [
+            (self.asset_1_reference, [1000, 1000, 900, 900]), (self.asset_2_reference, [1400, 1400, 1400, 1200])
+        ])
+
+    @override_settings(FORECAST_CACHE_TIMEOUT=3600)
+    def test_forecast_is_cached_until_data_changes(self):
+        """Test the forecast is served from the cache until the data version moves forward"""
+        payload = json.dumps({"months": 1})
+        self.client.generic("GET", FORECAST_API_URL, payload, content_type="application/json")
+        self.unit_obj_1.delete()
+        cached = self.client.generic("GET", FORECAST_API_URL, payload, content_type="application/json")
+        bump_data_version()
+        refreshed = self.client.generic("GET", FORECAST_API_URL, payload, content_type="application/json")
+
+        self.assertEqual(cached.data["portfolios"][0]["occupied_area"], [1800])
+        self.assertEqual(refreshed.data["portfolios"][0]["occupied_area"], [900])
+
+    def test_forecast_over_the_maximum_horizon(self):
+        """Test the forecast horizon is capped by the server maximum"""
+        payload = json.dumps({"months": 121})
+        response = self.client.generic("GET", FORECAST_API_URL, payload, content_type="application/json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_uploading_portfolio_data_sheet_via_api(self):
         """Test uploading portfolio data in a sheet using upload API endpoint"""
         with open("media/portfolio_data_sheet.csv") as fp:
@@ -92,3 +578,31 @@ class PublicCoreAPIsTests(TestCase):
             self.assertEqual(response.status_code, status.HTTP_201_CREATED)
             self.assertTrue(response.data["File Uploaded"])
             self.assertTrue(response.data["Status"])
+
+
+class AsyncAssetsAggregationTests(TransactionTestCase):
+    """
+    Tests for the async variant of the assets aggregation endpoint, the rows are committed so the database thread
+    pool can read them
+    """
+
+    def setUp(self):
+        cache.clear()
+        portfolio = Portfolio.objects.create(name="Test Portfolio")
+        asset = Asset.objects.create(
+                portfolio=portfolio, reference="A_1", city="Berlin", address="Am Kupfergraben 6", zipcode=10117,
+                is_restricted=False, year_of_construction=2000
+        )
+        Unit.objects.create(
+                asset=asset, reference="A_1_1", is_rented=True, size=900, rent=Decimal(5000), tenant="Tenant",
+                lease_start="2020-08-01"
+        )
+
+    def test_async_assets_aggregation_matches_sync_view(self):
+        """Test the async view serves exactly the same response as the sync one"""
+        sync_response = self.client.get(ASSETS_INFO_AGGREGATION_API_URL)
+        request = RequestFactory().get(ASSETS_INFO_AGGREGATION_API_URL)
+        async_response = async_to_sync(async_assets_aggregation_view)(request)
+
+        self.assertEqual(async_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(async_response.content, sync_response.content)
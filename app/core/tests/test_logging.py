@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import logging
+import sys
+from unittest.mock import MagicMock, patch
+
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from app.log import JSONFormatter, JobIDFilter, QueueListenerHandler, SamplingFilter, set_job_id
+
+from ..utils import logging_message
+
+
+class CollectingHandler(logging.Handler):
+    """Keep the handled records in memory"""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class LoggingTests(SimpleTestCase):
+    """
+    Tests for the queued, sampled and JSON formatted logging
+    """
+
+    def make_record(self, name="assets_info_aggregation", level=logging.DEBUG, msg="Asset %s", args=("A_1",)):
+        """Build a log record"""
+        return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+    def test_queue_handler_writes_from_a_background_thread(self):
+        """Test the records reach the target handlers once the listener drained the queue"""
+        target = CollectingHandler()
+        handler = QueueListenerHandler([target])
+        handler.handle(self.make_record())
+        handler.close()
+
+        self.assertEqual([record.getMessage() for record in target.records], ["Asset A_1"])
+
+    def test_queue_handler_keeps_the_exception(self):
+        """Test the exception of a record reaches the target handlers, formatted once by them"""
+        target = CollectingHandler()
+        handler = QueueListenerHandler([target])
+        try:
+            raise ValueError("broken sheet")
+        except ValueError:
+            record = logging.LogRecord("queue_tasks", logging.ERROR, __file__, 1, "Import %s", ("1",), sys.exc_info())
+        handler.handle(record)
+        handler.close()
+
+        self.assertIs(target.records[0].exc_info[0], ValueError)
+        payload = json.loads(JSONFormatter().format(target.records[0]))
+        self.assertEqual(payload["message"], "Import 1")
+        self.assertIn("ValueError: broken sheet", payload["exception"])
+
+    def test_queue_handler_drops_records_when_full(self):
+        """Test logging never waits on a full queue"""
+        handler = QueueListenerHandler([CollectingHandler()], queue_size=1)
+        with patch.object(handler, "start_listener"):
+            handler.handle(self.make_record())
+            handler.handle(self.make_record())
+
+        self.assertEqual(handler.dropped, 1)
+
+    def test_json_formatter_carries_the_request_and_job_ids(self):
+        """Test the JSON records hold the message along with the ids of the job that logged it"""
+        record = self.make_record()
+        record.request_id = "none"
+        set_job_id("job-1")
+        try:
+            JobIDFilter().filter(record)
+        finally:
+            set_job_id(None)
+
+        payload = json.loads(JSONFormatter().format(record))
+
+        self.assertEqual(payload["message"], "Asset A_1")
+        self.assertEqual(payload["logger"], "assets_info_aggregation")
+        self.assertEqual((payload["request_id"], payload["job_id"]), ("none", "job-1"))
+
+    @override_settings(LOG_DEBUG_SAMPLING=["assets_info_aggregation=0.25"])
+    def test_sampling_keeps_a_share_of_the_debug_records(self):
+        """Test only the DEBUG records of the sampled loggers and their children are sampled"""
+        sampling = SamplingFilter()
+
+        with patch("app.log.random.random", return_value=0.5):
+            self.assertFalse(sampling.filter(self.make_record()))
+            self.assertFalse(sampling.filter(self.make_record(name="assets_info_aggregation.export")))
+            self.assertTrue(sampling.filter(self.make_record(level=logging.WARNING)))
+            self.assertTrue(sampling.filter(self.make_record(name="queue_tasks")))
+        with patch("app.log.random.random", return_value=0.1):
+            self.assertTrue(sampling.filter(self.make_record()))
+
+    def test_logging_message_is_formatted_lazily(self):
+        """Test the message isn't built when the logger drops the level"""
+        logger = logging.getLogger("lazy_logging_test")
+        logger.setLevel(logging.INFO)
+        message = MagicMock()
+
+        logging_message(logger, "[REQUEST PAYLOAD]", RequestFactory().get("/"), message)
+
+        message.__str__.assert_not_called()
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from ..metrics import (
+    HOSTNAME, METRICS, MetricsRegistry, PeakMemory, collect_metrics, process_metrics_file, write_metrics_file,
+    write_request_metrics
+)
+from ..models import Document, Unit
+from ..tasks import PortfolioDataProcessorTask, WarmImportCachesTask
+
+
+PORTFOLIO_DATA_SHEET = (
+    "portfolio,asset_ref,asset_city,asset_address,asset_zipcode,asset_is_restricted,asset_yoc,unit_ref,"
+    "unit_is_rented,unit_size,unit_type,unit_tenant,unit_rent,unit_lease_start,unit_lease_end\n"
+    "Test Portfolio,A_1,Berlin,Am Kupfergraben 6,10117,False,2000,A_1_1,True,600,OFFICE,Tenant,5000,01.08.20,\n"
+    "Test Portfolio,A_1,Berlin,Am Kupfergraben 6,10117,False,2000,A_1_2,False,400,RETAIL,,,,\n"
+)
+
+
+class MetricsRegistryTests(SimpleTestCase):
+    """
+    Tests for the Prometheus exposition of the process and workers metrics
+    """
+
+    def test_rendering_prometheus_text_format(self):
+        """Test the counters, gauges and labelled timings histograms are rendered in the Prometheus text format"""
+        registry = MetricsRegistry()
+        registry.increment("ingestion_rows_written_total", 2, outcome="created")
+        registry.gauge("ingestion_rows_per_second", 12.5)
+        registry.observe("ingestion_stage_seconds", 0.02, stage="parse")
+        registry.observe("ingestion_stage_seconds", 400, stage="parse")
+
+        lines = registry.render_prometheus().splitlines()
+
+        self.assertIn("# TYPE ingestion_rows_written_total counter", lines)
+        self.assertIn('ingestion_rows_written_total{outcome="created"} 2.0', lines)
+        self.assertIn("ingestion_rows_per_second 12.5", lines)
+        self.assertIn("# TYPE ingestion_stage_seconds histogram", lines)
+        self.assertIn('ingestion_stage_seconds_bucket{stage="parse",le="0.01"} 0', lines)
+        self.assertIn('ingestion_stage_seconds_bucket{stage="parse",le="0.025"} 1', lines)
+        self.assertIn('ingestion_stage_seconds_bucket{stage="parse",le="300.0"} 1', lines)
+        self.assertIn('ingestion_stage_seconds_bucket{stage="parse",le="+Inf"} 2', lines)
+        self.assertIn('ingestion_stage_seconds_count{stage="parse"} 2', lines)
+        self.assertIn('ingestion_stage_seconds_max{stage="parse"} 400.0', lines)
+
+    def test_collecting_the_workers_metrics(self):
+        """Test the metrics written by the other processes are added up, their gauges kept per process"""
+        worker = MetricsRegistry()
+        worker.increment("ingestion_tasks_total", outcome="passed")
+        worker.gauge("ingestion_peak_memory_bytes", 1024)
+        worker.observe("ingestion_stage_seconds", 0.5, stage="db_write")
+        METRICS.reset()
+        METRICS.increment("ingestion_tasks_total", outcome="passed")
+
+        with tempfile.TemporaryDirectory() as directory:
+            worker.write(os.path.join(directory, "worker-4242-0a1b.json"), host="worker", pid=4242)
+            # The file of the current process is already counted through its live metrics
+            write_metrics_file(directory)
+            snapshot = collect_metrics(directory).snapshot()
+        METRICS.reset()
+
+        self.assertEqual(snapshot['ingestion_tasks_total{outcome="passed"}'], 2)
+        self.assertEqual(snapshot['ingestion_peak_memory_bytes{host="worker",pid="4242"}'], 1024)
+        self.assertEqual(snapshot['ingestion_stage_seconds_count{stage="db_write"}'], 1)
+
+    def test_retiring_the_metrics_of_the_processes_gone(self):
+        """Test the files of the host processes gone are folded into its retired file, their gauges left out"""
+        child = subprocess.Popen([sys.executable, "-c", ""])
+        child.wait()
+        dead = MetricsRegistry()
+        dead.increment("ingestion_tasks_total", outcome="passed")
+        dead.gauge("ingestion_peak_memory_bytes", 1024)
+        METRICS.reset()
+
+        with tempfile.TemporaryDirectory() as directory:
+            for token in ("0a1b", "2c3d"):
+                path = os.path.join(directory, f"{HOSTNAME}-{child.pid}-{token}.json")
+                dead.write(path, host=HOSTNAME, pid=child.pid)
+            snapshot = collect_metrics(directory).snapshot()
+            files = sorted(name for name in os.listdir(directory) if name.endswith(".json"))
+            # Counted once whatever the number of collections
+            self.assertEqual(collect_metrics(directory).snapshot(), snapshot)
+
+        self.assertEqual(files, [f"{HOSTNAME}-retired.json"])
+        self.assertEqual(snapshot['ingestion_tasks_total{outcome="passed"}'], 2)
+        self.assertNotIn(f'ingestion_peak_memory_bytes{{host="{HOSTNAME}",pid="{child.pid}"}}', snapshot)
+
+    def test_web_processes_write_their_metrics(self):
+        """Test the web processes write their metrics at most every METRICS_WRITE_INTERVAL seconds"""
+        METRICS.reset()
+        METRICS.increment("ingestion_tasks_total", outcome="failed")
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            with self.settings(METRICS_WRITE_INTERVAL=0):
+                write_request_metrics()
+            METRICS.increment("ingestion_tasks_total", outcome="failed")
+            with self.settings(METRICS_WRITE_INTERVAL=3600):
+                write_request_metrics()
+
+            with open(os.path.join(directory, process_metrics_file())) as fp:
+                state = json.load(fp)
+        METRICS.reset()
+
+        self.assertEqual((state["host"], state["pid"]), (HOSTNAME, os.getpid()))
+        self.assertEqual(state["counters"], [["ingestion_tasks_total", [["outcome", "failed"]], 1]])
+
+
+class PeakMemoryTests(SimpleTestCase):
+    """
+    Tests for the memory taken by a block
+    """
+
+    def test_peak_memory_is_sampled_from_the_resident_memory(self):
+        """Test the resident memory sampled within the block is kept over what was taken when entering"""
+        with PeakMemory(trace=False) as memory:
+            allocated = b"\x01" * (64 * 1024 * 1024)
+            sampled = memory.sample()
+            del allocated
+
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertGreaterEqual(sampled, 48 * 1024 * 1024)
+        self.assertGreaterEqual(memory.peak, sampled)
+
+    def test_peak_memory_is_traced_when_asked_for(self):
+        """Test the allocations are traced within the block only"""
+        with PeakMemory(trace=True) as memory:
+            self.assertTrue(tracemalloc.is_tracing())
+            allocated = bytearray(8 * 1024 * 1024)
+            del allocated
+
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertGreaterEqual(memory.peak, 8 * 1024 * 1024)
+
+
+class IngestionMetricsTests(TestCase):
+    """
+    Tests for the metrics of the portfolio data sheets imports
+    """
+
+    def setUp(self):
+        cache.clear()
+        METRICS.reset()
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+
+    def test_import_records_its_stages_and_rows(self):
+        """Test an import observes the time spent per stage and counts the rows written per outcome"""
+        with override_settings(MEDIA_ROOT=self.media_root.name):
+            document = Document.objects.create(
+                    file=SimpleUploadedFile("portfolio_data_sheet.csv", PORTFOLIO_DATA_SHEET.encode())
+            )
+            with patch.object(WarmImportCachesTask, "delay"):
+                PortfolioDataProcessorTask.run(document.id)
+                Unit.objects.filter(reference="A_1_2").update(size=500)
+                PortfolioDataProcessorTask.run(document.id)
+
+        snapshot = METRICS.snapshot()
+        for stage in ("read", "sniff", "parse", "normalize", "db_lookup", "db_write", "notify"):
+            self.assertEqual(snapshot[f'ingestion_stage_seconds_count{{stage="{stage}"}}'], 2)
+        self.assertEqual(snapshot['ingestion_rows_written_total{outcome="created"}'], 2)
+        self.assertEqual(snapshot['ingestion_rows_written_total{outcome="updated"}'], 1)
+        self.assertEqual(snapshot['ingestion_rows_written_total{outcome="unchanged"}'], 1)
+        self.assertEqual(snapshot['ingestion_tasks_total{outcome="passed"}'], 2)
+        # Sampled from the resident memory, which such a small import may not move
+        self.assertGreaterEqual(snapshot["ingestion_peak_memory_bytes"], 0)
+        self.assertGreater(snapshot["ingestion_rows_per_second"], 0)
+
+    @override_settings(INGESTION_CHUNK_SIZE=1, INGESTION_MIN_CHUNK_SIZE=1, INGESTION_MEMORY_BUDGET=1024)
+    def test_import_records_its_memory_on_the_document(self):
+        """Test an import read in chunks imports every row and keeps its peak memory and chunk sizes"""
+        with override_settings(MEDIA_ROOT=self.media_root.name):
+            document = Document.objects.create(
+                    file=SimpleUploadedFile("portfolio_data_sheet.csv", PORTFOLIO_DATA_SHEET.encode())
+            )
+            with patch.object(WarmImportCachesTask, "delay"):
+                PortfolioDataProcessorTask.run(document.id)
+
+        document.refresh_from_db()
+        self.assertEqual(Unit.objects.count(), 2)
+        self.assertGreaterEqual(document.peak_memory, 0)
+        # Far under the budget, the second chunk is twice as big as the first one
+        self.assertEqual(document.chunk_sizes[:2], [1, 2])
+        self.assertEqual(METRICS.snapshot()["ingestion_stage_seconds_count{stage=\"parse\"}"], 1)
+
+    @override_settings(INGESTION_CHUNK_SIZE=2, INGESTION_MIN_CHUNK_SIZE=1, INGESTION_MEMORY_BUDGET=1024)
+    def test_import_shrinks_its_chunks_over_the_budget(self):
+        """Test the chunks shrink once the resident memory grows over the high watermark across a chunk"""
+        resident = itertools.chain([0], itertools.repeat(900 * 1024 * 1024))
+        with override_settings(MEDIA_ROOT=self.media_root.name):
+            document = Document.objects.create(
+                    file=SimpleUploadedFile("portfolio_data_sheet.csv", PORTFOLIO_DATA_SHEET.encode())
+            )
+            with patch.object(WarmImportCachesTask, "delay"):
+                with patch("core.metrics.resident_memory", side_effect=lambda: next(resident)):
+                    PortfolioDataProcessorTask.run(document.id)
+
+        document.refresh_from_db()
+        self.assertEqual(Unit.objects.count(), 2)
+        self.assertEqual(document.chunk_sizes, [2, 1])
+        self.assertGreaterEqual(document.peak_memory, 900 * 1024 * 1024)
+
+    @override_settings(
+            INGESTION_CHUNK_SIZE=2, INGESTION_MIN_CHUNK_SIZE=1, INGESTION_MAX_CHUNK_SIZE=4, INGESTION_MEMORY_BUDGET=1024
+    )
+    def test_import_grows_its_chunks_back_after_a_large_one(self):
+        """Test the chunks grow back once the resident memory taken by a large chunk stops growing"""
+        rows = "".join(
+                f"Test Portfolio,A_1,Berlin,Am Kupfergraben 6,10117,False,2000,A_2_{unit},False,400,RETAIL,,,,\n"
+                for unit in range(6)
+        )
+        # Reserved by the first chunk and kept by the process, the next chunks reuse it
+        resident = itertools.chain([0], itertools.repeat(900 * 1024 * 1024))
+        with override_settings(MEDIA_ROOT=self.media_root.name):
+            document = Document.objects.create(
+                    file=SimpleUploadedFile("portfolio_data_sheet.csv", (PORTFOLIO_DATA_SHEET + rows).encode())
+            )
+            with patch.object(WarmImportCachesTask, "delay"):
+                with patch("core.metrics.resident_memory", side_effect=lambda: next(resident)):
+                    PortfolioDataProcessorTask.run(document.id)
+
+        document.refresh_from_db()
+        self.assertEqual(Unit.objects.count(), 8)
+        self.assertEqual(document.chunk_sizes, [2, 1, 2, 4])
+
+    @override_settings(METRICS_ENDPOINT=True)
+    def test_scraping_the_metrics(self):
+        """Test the metrics endpoint serves the Prometheus text format"""
+        METRICS.increment("ingestion_tasks_total", outcome="failed")
+        response = self.client.get(reverse("core:metrics"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn('ingestion_tasks_total{outcome="failed"} 1.0', response.content.decode())
+
+    def test_metrics_are_not_exposed_by_default(self):
+        """Test the metrics endpoint is off unless asked for"""
+        self.assertEqual(self.client.get(reverse("core:metrics")).status_code, 404)
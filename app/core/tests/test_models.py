@@ -1,12 +1,18 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from datetime import date
 from decimal import Decimal
 
+from unittest import skipUnless
+
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import TestCase
 
-from ..models import Portfolio, Asset, Unit, Document
+from ..kpis import compute_asset_kpis, refresh_asset_kpis, snapshot_asset_kpis
+from ..models import Portfolio, Asset, AssetKPI, AssetKPISnapshot, Unit, Document
+from ..search import ASSET_SEARCH_COLUMNS, search_assets
 
 
 class ModelTests(TestCase):
@@ -68,9 +74,121 @@ class ModelTests(TestCase):
         self.assertEqual(self.unit_obj.reference, self.unit_reference)
         self.assertEqual(str(self.unit_obj), self.unit_reference)
 
+    def test_successful_refreshing_asset_kpis(self):
+        """Test successfully precomputing the asset KPIs from its units"""
+        Unit.objects.create(asset=self.asset_obj, reference="A_1_2", is_rented=False, size=100)
+        refresh_asset_kpis([self.asset_obj.id])
+        refresh_asset_kpis([self.asset_obj.id])
+
+        self.assertEqual(AssetKPI.objects.count(), 1)
+        self.assertEqual(self.asset_obj.kpi.number_of_units, 2)
+        self.assertEqual(self.asset_obj.kpi.total_area, 1000)
+        self.assertEqual(self.asset_obj.kpi.area_rented, self.size)
+        self.assertEqual(self.asset_obj.kpi.total_rent, self.rent)
+        self.assertEqual(self.asset_obj.kpi.vacancy, 50.0)
+
+    def test_successful_snapshotting_asset_kpis(self):
+        """Test successfully keeping one KPIs snapshot per asset and day, the latest one of the day winning"""
+        refresh_asset_kpis([self.asset_obj.id])
+        snapshot_asset_kpis([self.asset_obj.id], snapshot_date=date(2020, 8, 1))
+        Unit.objects.create(asset=self.asset_obj, reference="A_1_2", is_rented=False, size=100)
+        refresh_asset_kpis([self.asset_obj.id])
+        snapshot_asset_kpis([self.asset_obj.id], snapshot_date=date(2020, 8, 1))
+        snapshot_asset_kpis([self.asset_obj.id], snapshot_date=date(2020, 9, 1))
+
+        snapshots = self.asset_obj.kpi_snapshots.order_by("snapshot_date")
+        self.assertEqual(AssetKPISnapshot.objects.count(), 2)
+        self.assertEqual([snapshot.vacancy for snapshot in snapshots], [50.0, 50.0])
+        self.assertEqual(str(snapshots[0]), f"{self.asset_obj.id} @ 2020-08-01")
+
+    def test_unit_changes_refresh_asset_kpis(self):
+        """Test editing, moving and deleting a unit refresh the KPIs of the assets it belongs and belonged to"""
+        other_asset = Asset.objects.create(
+                portfolio=self.portfolio_obj, reference="A_2", city=self.city, address=self.address,
+                zipcode=self.zipcode, year_of_construction=self.year_of_construction
+        )
+        refresh_asset_kpis([self.asset_obj.id, other_asset.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.unit_obj.size = 1000
+            self.unit_obj.save()
+        self.assertEqual(AssetKPI.objects.get(asset=self.asset_obj).total_area, 1000)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.unit_obj.asset = other_asset
+            self.unit_obj.save()
+        self.assertEqual(AssetKPI.objects.get(asset=self.asset_obj).number_of_units, 0)
+        self.assertEqual(AssetKPI.objects.get(asset=other_asset).number_of_units, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.unit_obj.delete()
+        self.assertEqual(AssetKPI.objects.get(asset=other_asset).number_of_units, 0)
+
+    def test_unit_indexes_are_not_redundant(self):
+        """Test no single column index duplicates the leading column of the units composite indexes"""
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Unit._meta.db_table)
+        single_column_indexes = [
+            constraint["columns"] for constraint in constraints.values()
+            if constraint["index"] and not constraint["unique"] and not constraint["primary_key"]
+            and len(constraint["columns"]) == 1
+        ]
+
+        self.assertNotIn(["reference"], single_column_indexes)
+        self.assertNotIn(["asset_id"], single_column_indexes)
+
     def test_successful_creating_document(self):
         """Test successfully creating new document"""
         test_file = SimpleUploadedFile("portfolio_data.csv", b"file_content")
         document_obj = Document.objects.create(file=test_file)
 
         self.assertTrue(document_obj.file)
+
+
+@skipUnless(connection.vendor == "postgresql", "Covering and trigram indexes need PostgreSQL")
+class IndexUsageTests(TestCase):
+    """
+    Tests the importer and KPI queries are served by their indexes, whatever the size of the tables
+    """
+
+    def setUp(self):
+        portfolio = Portfolio.objects.create(name="Test Portfolio")
+        self.asset = Asset.objects.create(
+                portfolio=portfolio, reference="A_1", city="Berlin", address="Am Kupfergraben 6", zipcode=10117,
+                is_restricted=False, year_of_construction=2000
+        )
+        Unit.objects.create(
+                asset=self.asset, reference="A_1_1", is_rented=True, size=100, rent=Decimal(1000), unit_type="rs"
+        )
+        # The test tables are tiny, make sequential scans look as expensive as they are on real estates
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("SET LOCAL enable_bitmapscan = off")
+
+    def test_importer_unit_lookup_uses_reference_and_type_index(self):
+        """Test the importer looks the existing units up through the composite index"""
+        plan = Unit.objects.filter(reference="A_1_1", unit_type="rs").explain()
+
+        self.assertIn("core_unit_ref_type_idx", plan)
+
+    def test_kpi_aggregation_is_index_only(self):
+        """Test the KPIs of given assets are aggregated from the covering index alone"""
+        with self.assertNumQueries(1) as context:
+            compute_asset_kpis([self.asset.id], current_year=2020)
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN {context.captured_queries[0]['sql']}")
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+
+        self.assertIn("Index Only Scan using core_unit_asset_kpi_idx", plan)
+
+    def test_search_uses_trigram_indexes(self):
+        """Test searching the assets and their tenants is served by the trigram indexes"""
+        # GIN indexes are only ever read through bitmap scans
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_bitmapscan = on")
+
+        plan = search_assets("kupfergraben").explain()
+
+        for column in ASSET_SEARCH_COLUMNS:
+            self.assertIn(f"core_asset_{column}_trgm_idx", plan)
+        self.assertIn("core_unit_tenant_trgm_idx", plan)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from io import StringIO
+from unittest import skipIf, skipUnless
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+
+from ..models import Asset, Portfolio, Unit
+from ..partitioning import UNIT_TABLE, is_partitioned
+
+
+class UnitPartitioningTests(TestCase):
+    """
+    Tests for the opt-in hash partitioning of the units table
+    """
+
+    def create_assets_with_units(self):
+        """Create two assets with a unit each"""
+        portfolio = Portfolio.objects.create(name="Test Portfolio")
+        self.assets = [
+            Asset.objects.create(
+                    portfolio=portfolio, reference=f"A_{index}", city="Berlin", address=f"Am Kupfergraben {index}",
+                    zipcode=10117, is_restricted=False, year_of_construction=2000
+            )
+            for index in range(2)
+        ]
+        for asset in self.assets:
+            Unit.objects.create(asset=asset, reference=f"{asset.reference}_1", is_rented=True, size=100)
+
+    def setUp(self):
+        self.create_assets_with_units()
+
+    def test_partitioning_dry_run(self):
+        """Test the dry run prints the partitioned table definition"""
+        out = StringIO()
+        call_command("partition_units", partitions=4, dry_run=True, stdout=out)
+
+        self.assertIn("PARTITION BY HASH (asset_id)", out.getvalue())
+        self.assertIn("MODULUS 4, REMAINDER 3", out.getvalue())
+
+    @skipIf(connection.vendor == "postgresql", "SQLite keeps the plain table")
+    def test_partitioning_requires_postgresql(self):
+        """Test the units table stays a plain table on other databases"""
+        with self.assertRaises(CommandError):
+            call_command("partition_units", stdout=StringIO())
+
+    @skipUnless(connection.vendor == "postgresql", "Partitioning needs PostgreSQL")
+    def test_partitioned_units_queries_are_pruned(self):
+        """Test the units keep working once partitioned and the queries of one asset only scan its partition"""
+        call_command("partition_units", partitions=4, stdout=StringIO())
+        Unit.objects.create(asset=self.assets[0], reference="A_0_2", is_rented=False, size=50)
+        plan = Unit.objects.filter(asset_id=self.assets[0].id, is_rented=True).explain()
+
+        self.assertTrue(is_partitioned(UNIT_TABLE))
+        self.assertEqual(Unit.objects.filter(asset=self.assets[0]).count(), 2)
+        self.assertEqual(plan.count(f"{UNIT_TABLE}_p"), 1)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from unittest.mock import MagicMock, patch
+
+from django.core.cache import cache
+from django.db import connections, router, transaction
+from django.db.utils import OperationalError
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TransactionTestCase, override_settings
+
+from ..middleware import ReplicaReadsMiddleware
+from ..models import Asset, Portfolio
+from ..routers import _check_replica, replica_reads, stick_to_primary
+
+
+@override_settings(DATABASE_REPLICAS=["replica"], DATABASE_REPLICA_HEALTH_INTERVAL=0)
+class ReadReplicaRouterTests(TransactionTestCase):
+    """
+    Tests for the read replica database router, the `replica` alias mirrors the default database
+    """
+
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        cache.clear()
+        self.portfolio = Portfolio.objects.create(name="Test Portfolio")
+
+    def read_database(self, path, method="get"):
+        """Serve a request through the middleware and return the database the view reads the assets from"""
+        middleware = ReplicaReadsMiddleware(lambda request: HttpResponse(router.db_for_read(Asset)))
+        return middleware(getattr(RequestFactory(), method)(path)).content.decode()
+
+    def test_read_only_paths_are_served_by_the_replica(self):
+        """Test the safe requests of the aggregation paths read from the replica and the rest from the primary"""
+        self.assertEqual(self.read_database("/api/secure/v2/assets/"), "replica")
+        self.assertEqual(self.read_database("/api/secure/v2/upload/"), "default")
+        self.assertEqual(self.read_database("/api/secure/v2/assets/", method="post"), "default")
+
+    def test_replica_reads_the_mirrored_data(self):
+        """Test the reads of a read only block are actually run against the replica"""
+        with replica_reads():
+            portfolio = Portfolio.objects.get(id=self.portfolio.id)
+
+        self.assertEqual(portfolio._state.db, "replica")
+
+    def test_writes_and_transactions_stay_on_the_primary(self):
+        """Test writing and reading within a transaction always use the primary"""
+        with replica_reads():
+            self.assertEqual(router.db_for_write(Asset), "default")
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Asset), "default")
+            self.assertEqual(router.db_for_read(Asset), "replica")
+
+    def test_reads_stick_to_the_primary_after_an_import(self):
+        """Test the reads go back to the replica only once the stickiness window is over"""
+        stick_to_primary()
+        self.assertEqual(self.read_database("/api/secure/v2/assets/"), "default")
+
+        cache.clear()
+        self.assertEqual(self.read_database("/api/secure/v2/assets/"), "replica")
+
+    def test_unhealthy_replica_falls_back_to_the_primary(self):
+        """Test the reads go to the primary while the replica can't be reached"""
+        with patch.object(connections["replica"], "cursor", side_effect=OperationalError):
+            self.assertEqual(self.read_database("/api/secure/v2/assets/"), "default")
+
+    @override_settings(DATABASE_REPLICA_MAX_LAG=30)
+    def test_replica_lag_on_postgres(self):
+        """Test a Postgres replica is lagging only while it has WAL left to replay"""
+        cursor = MagicMock()
+        with patch.object(connections["replica"], "vendor", "postgresql"):
+            with patch.object(connections["replica"], "cursor", return_value=cursor):
+                # Write idle primary: the last replay is old but all the received WAL was replayed
+                cursor.__enter__.return_value.fetchone.return_value = (True, 120.0)
+                self.assertTrue(_check_replica("replica"))
+
+                cursor.__enter__.return_value.fetchone.return_value = (False, 120.0)
+                self.assertFalse(_check_replica("replica"))
+
+                cursor.__enter__.return_value.fetchone.return_value = (False, 5.0)
+                self.assertTrue(_check_replica("replica"))
+
+    def test_streaming_content_is_read_from_the_replica(self):
+        """Test a streaming response keeps reading from the replica after the view returned"""
+        middleware = ReplicaReadsMiddleware(
+                lambda request: StreamingHttpResponse(router.db_for_read(Asset) for __ in range(2))
+        )
+        response = middleware(RequestFactory().get("/api/secure/v2/assets/export/"))
+
+        self.assertEqual(router.db_for_read(Asset), "default")
+        self.assertEqual(b"".join(response.streaming_content), b"replicareplica")
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from decimal import Decimal
+import tempfile
+from unittest.mock import patch
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ..caching import get_data_version, versioned_cache_key
+from ..connections import checkout_connections, release_connections
+from ..forecast import default_forecast_months
+from ..kpis import refresh_asset_kpis
+from ..metrics import METRICS
+from ..models import AbstractUnitType, Asset, AssetKPI, Document, KPIRecomputeRun, Portfolio, Unit
+from ..payloads import ASSET_PAYLOAD_CACHE_PREFIX, PORTFOLIO_PAYLOAD_CACHE_PREFIX
+from ..tasks import (
+    PortfolioDataProcessorTask, RecomputeAssetKPIsBatchTask, RecomputeTimeDependentKPIsTask, WarmImportCachesTask
+)
+
+
+class TaskTests(TestCase):
+    """
+    Tests for the core app queue tasks
+    """
+
+    def create_asset_with_leases(self):
+        """Create an asset with a lease ending in 2025 and a lease without end"""
+        portfolio = Portfolio.objects.create(name="Test Portfolio")
+        self.asset_obj = Asset.objects.create(
+                portfolio=portfolio, reference="A_1", city="Berlin", address="Am Kupfergraben 6", zipcode=10117,
+                is_restricted=False, year_of_construction=2000
+        )
+        Unit.objects.create(
+                asset=self.asset_obj, reference="A_1_1", is_rented=True, size=600, rent=Decimal(5000),
+                tenant="Tenant", lease_end="2025-12-31"
+        )
+        Unit.objects.create(
+                asset=self.asset_obj, reference="A_1_2", is_rented=True, size=400, rent=Decimal(1000), tenant="Tenant"
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.create_asset_with_leases()
+
+    def recompute(self, current_year):
+        """Run a recomputation with its batches executed right away instead of being queued"""
+        with patch.object(RecomputeAssetKPIsBatchTask, "apply_async") as apply_async:
+            apply_async.side_effect = lambda args, countdown: RecomputeAssetKPIsBatchTask.run(*args)
+            return RecomputeTimeDependentKPIsTask.run(current_year=current_year)
+
+    @override_settings(FORECAST_CACHE_TIMEOUT=3600)
+    def test_recomputing_time_dependent_kpis(self):
+        """Test the WALT is recomputed in bulk for the new year, then the warmed caches get published"""
+        refresh_asset_kpis([self.asset_obj.id], current_year=2020)
+        version = get_data_version()
+        forecast_key = versioned_cache_key(
+                "forecast", timezone.localdate().replace(day=1), default_forecast_months(), None, None, False,
+                version=version + 1
+        )
+
+        self.assertEqual(AssetKPI.objects.get(asset=self.asset_obj).walt, 600 * 5 / 1000)
+        self.assertEqual(self.recompute(current_year=2021), 1)
+        self.assertEqual(AssetKPI.objects.get(asset=self.asset_obj).walt, 600 * 4 / 1000)
+        self.assertEqual(get_data_version(), version + 1)
+        self.assertIsNotNone(cache.get(forecast_key))
+
+    def test_recomputing_batch_of_lost_run(self):
+        """Test a batch whose run counter is gone still recomputes its assets but leaves the caches as they are"""
+        refresh_asset_kpis([self.asset_obj.id], current_year=2020)
+        version = get_data_version()
+
+        self.assertEqual(RecomputeAssetKPIsBatchTask.run(self.asset_obj.id, self.asset_obj.id, 2021, "lost"), 1)
+        self.assertEqual(AssetKPI.objects.get(asset=self.asset_obj).walt, 600 * 4 / 1000)
+        self.assertEqual(get_data_version(), version)
+
+    def test_recomputing_counts_down_the_run_in_the_database(self):
+        """Test the batches count their run down in the database, the last one refreshes the caches"""
+        KPIRecomputeRun.objects.create(run_id="run", remaining=2)
+        version = get_data_version()
+
+        RecomputeAssetKPIsBatchTask.run(self.asset_obj.id, self.asset_obj.id, 2021, "run")
+        self.assertEqual(KPIRecomputeRun.objects.get(run_id="run").remaining, 1)
+        self.assertEqual(get_data_version(), version)
+
+        # Whatever the cache, e.g. one private to every worker
+        cache.clear()
+        version = get_data_version()
+        RecomputeAssetKPIsBatchTask.run(self.asset_obj.id, self.asset_obj.id, 2021, "run")
+        self.assertFalse(KPIRecomputeRun.objects.filter(run_id="run").exists())
+        self.assertEqual(get_data_version(), version + 1)
+
+    @override_settings(AGGREGATION_CACHE_TIMEOUT=60, CACHE_WARMING_CONCURRENCY=1)
+    def test_warming_caches_after_import(self):
+        """Test the touched assets and portfolios payloads are warmed before the new version and the email go out"""
+        version = get_data_version()
+        WarmImportCachesTask.run([self.asset_obj.id], [self.asset_obj.portfolio_id], True)
+
+        self.assertEqual(get_data_version(), version + 1)
+        asset_key = versioned_cache_key(ASSET_PAYLOAD_CACHE_PREFIX, self.asset_obj.id, "")
+        portfolio_key = versioned_cache_key(PORTFOLIO_PAYLOAD_CACHE_PREFIX, self.asset_obj.portfolio_id)
+        self.assertIsNotNone(cache.get(asset_key))
+        self.assertIsNotNone(cache.get(portfolio_key))
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(WORKER_CONN_HEALTH_CHECK_INTERVAL=0)
+    def test_stale_worker_connection_is_replaced_on_checkout(self):
+        """Test a worker connection that went away while idle is closed before the next task uses it"""
+        METRICS.reset()
+        release_connections()
+        connection = connections["default"]
+        with patch.object(connection, "is_usable", return_value=False), patch.object(connection, "close") as close:
+            checkout_connections(sender=RecomputeAssetKPIsBatchTask)
+
+        close.assert_called_once_with()
+        self.assertEqual(METRICS.snapshot()["db_connection_failed_checks_total"], 1)
+        self.assertEqual(METRICS.snapshot()["db_connection_checkout_seconds_count"], 1)
+
+    def test_import_moving_a_unit_refreshes_both_assets(self):
+        """Test an import moving a unit to another asset refreshes the KPIs of the asset it was moved away from"""
+        Unit.objects.filter(reference="A_1_1").update(unit_type=AbstractUnitType.COMMERCIAL)
+        refresh_asset_kpis([self.asset_obj.id])
+        sheet = (
+            "portfolio,asset_ref,asset_city,asset_address,asset_zipcode,asset_is_restricted,asset_yoc,unit_ref,"
+            "unit_is_rented,unit_size,unit_type,unit_tenant,unit_rent,unit_lease_start,unit_lease_end\n"
+            "Test Portfolio,A_2,Berlin,Am Kupfergraben 7,10117,False,2000,A_1_1,True,600,COMMERCIAL,Tenant,5000,"
+            "01.08.20,31.12.25\n"
+        )
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            document = Document.objects.create(file=SimpleUploadedFile("portfolio_data_sheet.csv", sheet.encode()))
+            with patch.object(WarmImportCachesTask, "delay") as delay:
+                PortfolioDataProcessorTask.run(document.id)
+
+        new_asset = Asset.objects.get(reference="A_2")
+        self.assertEqual(AssetKPI.objects.get(asset=self.asset_obj).number_of_units, 1)
+        self.assertEqual(AssetKPI.objects.get(asset=new_asset).number_of_units, 1)
+        self.assertEqual(delay.call_args[0][0], sorted([self.asset_obj.id, new_asset.id]))
+
+    def test_import_sends_email_when_warming_cannot_be_queued(self):
+        """Test the follow up email still goes out, and the new data is published, when the broker can't be reached"""
+        sheet = (
+            "portfolio,asset_ref,asset_city,asset_address,asset_zipcode,asset_is_restricted,asset_yoc,unit_ref,"
+            "unit_is_rented,unit_size,unit_type,unit_tenant,unit_rent,unit_lease_start,unit_lease_end\n"
+            "Test Portfolio,A_2,Berlin,Am Kupfergraben 7,10117,False,2000,A_2_1,False,400,RETAIL,,,,\n"
+        )
+        version = get_data_version()
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            document = Document.objects.create(file=SimpleUploadedFile("portfolio_data_sheet.csv", sheet.encode()))
+            with patch.object(WarmImportCachesTask, "delay", side_effect=ConnectionRefusedError):
+                PortfolioDataProcessorTask.run(document.id)
+
+        self.assertTrue(Unit.objects.filter(reference="A_2_1").exists())
+        self.assertEqual(get_data_version(), version + 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn("Your file processed successfully.", mail.outbox[0].body)
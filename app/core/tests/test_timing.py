@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from ..middleware import RequestTimingMiddleware
+from ..models import Asset, Portfolio
+
+
+@override_settings(REQUEST_TIMING=True, REQUEST_TIMING_QUERY_BUDGET=5, REQUEST_TIMING_TIME_BUDGET=60000)
+class RequestTimingMiddlewareTests(TestCase):
+    """
+    Tests for the per request queries and timings instrumentation
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.portfolio = Portfolio.objects.create(name="Test Portfolio")
+
+    def serve(self, queries):
+        """Serve a request running `queries` queries through the middleware and return the request and response"""
+        def view(request):
+            for __ in range(queries):
+                Portfolio.objects.count()
+            return HttpResponse()
+
+        request = RequestFactory().get("/api/secure/v2/portfolios/")
+        request.id = "4f2a"
+        return request, RequestTimingMiddleware(view)(request)
+
+    def test_timings_are_sent_back_and_logged(self):
+        """Test the queries and durations are sent in the Server-Timing header and logged with the request id"""
+        with self.assertLogs("request_timing", level="DEBUG") as logs:
+            __, response = self.serve(queries=3)
+
+        self.assertRegex(response["Server-Timing"], r'^db;dur=[\d.]+;desc="3 queries", total;dur=[\d.]+$')
+        self.assertEqual(logs.records[0].levelname, "DEBUG")
+        self.assertEqual(logs.records[0].data["request_id"], "4f2a")
+        self.assertEqual(logs.records[0].data["queries"], 3)
+        self.assertFalse(logs.records[0].data["over_budget"])
+
+    def test_requests_over_budget_are_flagged(self):
+        """Test the requests running more queries than the budget are logged as warnings"""
+        with self.assertLogs("request_timing", level="WARNING") as logs:
+            self.serve(queries=6)
+
+        self.assertIn("[REQUEST OVER BUDGET]", logs.output[0])
+        self.assertTrue(logs.records[0].data["over_budget"])
+
+    def test_assets_request_reports_its_stages(self):
+        """Test the assets aggregation reports the time spent serializing and rendering the payloads"""
+        Asset.objects.create(
+                portfolio=self.portfolio, reference="A_1", city="Berlin", address="Am Kupfergraben 6", zipcode=10117,
+                year_of_construction=2000
+        )
+        response = self.client.get(reverse("core:aggregate_assets"))
+
+        self.assertEqual(response.status_code, 200)
+        for stage in ("db", "serialize", "render", "total"):
+            self.assertIn(f"{stage};dur=", response["Server-Timing"])
+
+    @override_settings(REQUEST_TIMING=False)
+    def test_middleware_is_skipped_when_disabled(self):
+        """Test the requests aren't timed unless asked to"""
+        with self.assertRaises(MiddlewareNotUsed):
+            RequestTimingMiddleware(lambda request: HttpResponse())
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import defaultdict
+from contextlib import contextmanager
+import contextvars
+import threading
+import time
+
+
+# Timings of the request being served, None outside of the timed requests
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """
+    Number of queries and time spent per stage (`db`, `serialize`, `render`...) of one request, collected from every
+    thread working for it. The stages may overlap, e.g. the queries run while serializing count in both.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.spans = defaultdict(float)
+
+    def add(self, name, seconds, queries=0):
+        """
+        :param name: name of the stage
+        :param seconds: time spent in the stage
+        :param queries: number of queries run in the meantime
+        """
+        with self._lock:
+            self.spans[name] += seconds
+            self.queries += queries
+
+
+@contextmanager
+def timed_request():
+    """
+    :return: context manager collecting the timings of the request served within the block, as a `RequestTimings`
+    """
+    timings = RequestTimings()
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+@contextmanager
+def timed(name):
+    """
+    :param name: name of the stage
+    :return: context manager adding the time spent within the block to the stage of the current request, if timed
+    """
+    timings = _request_timings.get()
+    if timings is None:
+        yield
+        return
+
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        timings.add(name, time.monotonic() - started)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper adding the queries of the timed requests to their `db` stage
+    """
+    timings = _request_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+
+    started = time.monotonic()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add("db", time.monotonic() - started, queries=1)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    `connection_created` receiver, the connections are per thread so the ones of the async views pool are covered too
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
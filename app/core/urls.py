@@ -1,16 +1,33 @@
 # -*- coding: utf-8 -*-
+from django.conf import settings
 from django.urls import include, path
 
 from rest_framework.routers import DefaultRouter
 
-from .views import AssetInfoAggregationAPIView, UploadDocumentViewSet
+from .views import (
+    AssetInfoExportAPIView, AssetKPITrendAPIView, AssetSearchAPIView, ExpiringLeasesAPIView, ForecastAPIView,
+    GeoInfoAggregationAPIView, MetricsAPIView, PortfolioInfoAggregationAPIView, UploadDocumentViewSet,
+    async_assets_aggregation_view, sync_assets_aggregation_view
+)
 
 
 app_name = 'core'
 router = DefaultRouter()
 router.register('', UploadDocumentViewSet, basename='upload_file')
 
+assets_aggregation_view = (
+    async_assets_aggregation_view if settings.ASYNC_AGGREGATION_VIEWS else sync_assets_aggregation_view
+)
+
 urlpatterns = [
     path('upload/', include(router.urls)),
-    path('assets/', AssetInfoAggregationAPIView.as_view(), name="aggregate_assets"),
+    path('assets/', assets_aggregation_view, name="aggregate_assets"),
+    path('assets/export/', AssetInfoExportAPIView.as_view(), name="export_assets"),
+    path('assets/trend/', AssetKPITrendAPIView.as_view(), name="assets_kpi_trend"),
+    path('assets/search/', AssetSearchAPIView.as_view(), name="search_assets"),
+    path('assets/geo/', GeoInfoAggregationAPIView.as_view(), name="aggregate_assets_geo"),
+    path('portfolios/', PortfolioInfoAggregationAPIView.as_view(), name="aggregate_portfolios"),
+    path('leases/expiring/', ExpiringLeasesAPIView.as_view(), name="expiring_leases"),
+    path('forecast/', ForecastAPIView.as_view(), name="forecast"),
+    path('metrics/', MetricsAPIView.as_view(), name="metrics"),
 ]
@@ -1,13 +1,13 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import calendar
 from datetime import datetime
+import logging
 import os
 import random
 import string
 
-from django.utils.translation import gettext_lazy as _
-
 
 def get_client_ip(request):
     """
@@ -26,14 +26,28 @@ def get_client_ip(request):
 
 def logging_message(logger, head, request, message):
     """
-    Simple function that will take the logger and the message and log them in an template format
+    Simple function that will take the logger and the message and log them in an template format, the message is only
+    formatted once the record is kept by the logger
     :param logger: the logger itself that will handle the log message
     :param head: the head/title of the log message
     :param request: the pure http request object
     :param message: the message that will be logged
     :return: The message will be logged into the specified logger
     """
-    return logger.debug(_(f"{head}\nUser: {request.user} -- IP Address: {get_client_ip(request)}\n{message}"))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s\nUser: %s -- IP Address: %s\n%s", head, request.user, get_client_ip(request), message)
+
+
+def add_months(date, months):
+    """
+    Shift a date by a number of months, clamping the day to the length of the target month
+    :param date: the date to shift
+    :param months: number of months to add, may be negative
+    :return: the shifted date
+    """
+    month_index = date.month - 1 + months
+    year, month = date.year + month_index // 12, month_index % 12 + 1
+    return date.replace(year=year, month=month, day=min(date.day, calendar.monthrange(year, month)[1]))
 
 
 def update_filename(instance, filename):
@@ -4,16 +4,38 @@ from __future__ import unicode_literals
 import logging
 
 from rest_framework import status, viewsets
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
 from rest_framework.response import Response
 from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
 from rest_framework.views import APIView
 
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from django.utils.translation import gettext as _
 
+from .executors import run_in_db_executor
+from .exports import EXPORT_CONTENT_TYPES, stream_asset_kpis
+from .forecast import cached_forecast
+from .kpis import unit_kpi_aggregates
+from .metrics import PROMETHEUS_CONTENT_TYPE, collect_metrics
 from .mixins import APIViewPaginatorMixin
-from .models import Asset, Document
-from .serializers import AssetInfoAggregationReadSerializer, AssetInfoAggregationWriteSerializer, DocumentSerializer
+from .models import Asset, AssetKPISnapshot, Document, Portfolio, Unit
+from .pagination import (
+    AssetCursorPagination, AssetSearchCursorPagination, LeaseCursorPagination, PortfolioCursorPagination
+)
+from .partitioning import unit_table_partitioned
+from .payloads import annotate_portfolio_kpis, asset_payloads, asset_rows, portfolio_payloads
+from .renderers import FastJSONRenderer, PassthroughRenderer
+from .search import search_assets
+from .serializers import (
+    ASSETS_QUERY_PARAMS, AssetInfoAggregationReadSerializer, AssetInfoExportReadSerializer,
+    AssetKPISnapshotWriteSerializer, AssetKPITrendReadSerializer, AssetSearchReadSerializer, AssetSearchWriteSerializer,
+    DocumentSerializer, ExpiringLeaseWriteSerializer, ExpiringLeasesReadSerializer, ForecastReadSerializer,
+    GeoInfoAggregationReadSerializer, GeoInfoAggregationWriteSerializer, PortfolioInfoAggregationReadSerializer
+)
 from .tasks import PortfolioDataProcessorTask
 from .utils import logging_message
 
@@ -25,60 +47,530 @@ EXTERNAL_ERROR_MSG = _("Process stopped during an internal error, please try aga
 
 class AssetInfoAggregationAPIView(APIViewPaginatorMixin, APIView):
     """
-    Retrieves one/list of aggregated info about existed assets.
+    Retrieves one/list of aggregated info about existed assets, or a batch of them looked up by `asset_refs`.
+
+    The payloads are built as plain dicts straight from the asset rows and rendered by orjson when it's installed.
     """
 
     read_serializer = AssetInfoAggregationReadSerializer
-    write_serializer = AssetInfoAggregationWriteSerializer
     throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    pagination_class = AssetCursorPagination
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
 
     def list(self, request, *args, **kwargs):
         """Serializes response of asset(s) aggregated info"""
         asset_ref = self.kwargs["ref"]
+        kpi_filters = self.kwargs.get("kpi_filters")
+        queryset = Asset.objects.filter(reference=asset_ref) if asset_ref else Asset.objects.all()
+        queryset = self.filter_and_sort_by_kpis(queryset, kpi_filters, self.kwargs.get("ordering"))
+        keyset_lookups = [field.lstrip("-") for field in getattr(self, "keyset_ordering", ())]
+        queryset = asset_rows(queryset, self.kwargs.get("fields"), extra=keyset_lookups)
+        page = self.paginate_queryset(queryset)
 
-        if asset_ref:
-            queryset = Asset.objects.filter(reference=asset_ref)
-            if queryset.count() == 0:
-                return Response({
-                    "Error": _(f"No asset found with reference {asset_ref}")
-                }, status=status.HTTP_404_NOT_FOUND)
-        else:
-            queryset = Asset.objects.all()
+        if page is not None:
+            if not page and not kpi_filters and not getattr(self.paginator, "cursor", None):
+                return self._not_found_response(asset_ref)
+            return self.get_paginated_response(asset_payloads(page, self.kwargs.get("fields")))
+
+        rows = list(queryset.order_by("-updated_at", "-id"))
+        if not rows:
+            return self._not_found_response(asset_ref)
+        return Response(asset_payloads(rows, self.kwargs.get("fields")))
+
+    def filter_and_sort_by_kpis(self, queryset, kpi_filters, ordering):
+        """
+        Filters and sorts the assets in the database by their precomputed numeric KPIs
+        :param queryset: the assets to filter
+        :param kpi_filters: lookups on the precomputed KPIs
+        :param ordering: KPI name to sort by, prefixed with `-` for descending order
+        :return: the filtered queryset, the keyset pagination follows the requested ordering
+        """
+        if kpi_filters:
+            queryset = queryset.filter(**kpi_filters)
+
+        if ordering:
+            direction = "-" if ordering.startswith("-") else ""
+            self.keyset_ordering = (f"{direction}kpi__{ordering.lstrip('-')}", f"{direction}id")
+            # The assets without KPIs yet are listed after the other ones
+            self.keyset_nullable = True
 
-        if queryset.count() > 0:
-            queryset = queryset.prefetch_related("units").order_by("-updated_at")
-            page = self.paginate_queryset(queryset)
+        return queryset
+
+    def bulk_lookup(self, asset_refs):
+        """
+        Serializes the aggregated info of many assets resolved at once
+        :param asset_refs: the requested asset references
+        :return: response keyed by asset reference along with the references that weren't found
+        """
+        rows = list(asset_rows(Asset.objects.filter(reference__in=asset_refs), self.kwargs.get("fields")))
+        payloads = asset_payloads(rows, self.kwargs.get("fields"))
+        results = {row["reference"]: payload for row, payload in zip(rows, payloads)}
+
+        return Response({
+            "results": {asset_ref: results[asset_ref] for asset_ref in asset_refs if asset_ref in results},
+            "not_found": [asset_ref for asset_ref in asset_refs if asset_ref not in results],
+        })
+
+    def _request_payload(self, request):
+        """
+        :param request: the request object being served
+        :return: the request body, completed by the KPI ranges, ordering and sparse fieldset given in the query string
+        """
+        payload = request.data.copy() if request.data else {}
+        for name in ASSETS_QUERY_PARAMS:
+            if name in request.query_params and name not in payload:
+                payload[name] = request.query_params[name]
 
-            if page is not None:
-                serializer = self.write_serializer(page, many=True)
-                return self.get_paginated_response(serializer.data)
+        return payload
 
-            serializer = self.write_serializer(queryset, many=True)
-            return Response(serializer.data)
+    def _not_found_response(self, asset_ref):
+        """
+        :param asset_ref: the requested asset reference if any
+        :return: 404 response for an empty first page
+        """
+        if asset_ref:
+            return Response({
+                "Error": _(f"No asset found with reference {asset_ref}")
+            }, status=status.HTTP_404_NOT_FOUND)
 
         return Response({"Error": _("No Assets found at the system")}, status=status.HTTP_404_NOT_FOUND)
 
     def get(self, request, *args, **kwargs):
         """Handles GET requests to retrieve one/list of aggregated info about existed assets."""
 
-        serializer = self.read_serializer(data=request.data)
+        serializer = self.read_serializer(data=self._request_payload(request))
 
         try:
             serializer.is_valid(raise_exception=True)
-            self.kwargs["ref"] = serializer.validated_data["asset_ref"] if len(serializer.validated_data) > 0 \
-                else False
+            self.kwargs["ref"] = serializer.validated_data.get("asset_ref") or False
+            self.kwargs["kpi_filters"] = serializer.get_kpi_filters()
+            self.kwargs["ordering"] = serializer.validated_data.get("ordering")
+            self.kwargs["fields"] = serializer.validated_data.get("fields")
+            # The following pages are requested through the links alone, without the body
+            self.link_params = serializer.get_link_params()
             logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[REQUEST PAYLOAD]", request, serializer.validated_data)
+            if serializer.validated_data.get("asset_refs"):
+                return self.bulk_lookup(serializer.validated_data["asset_refs"])
             return self.list(request, *args, **kwargs)
 
         except ValidationError as err:
             logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[VALIDATION ERROR]", request, serializer.errors)
             return Response({"Validation Error": _(f"{err.args[0]}")}, status=status.HTTP_400_BAD_REQUEST)
 
+        except NotFound as err:
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[INVALID CURSOR]", request, err.detail)
+            return Response({"Error": err.detail}, status=status.HTTP_404_NOT_FOUND)
+
+        except Exception as err:
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[INTERNAL ERROR]", request, err.args)
+            return Response({"Internal Error": EXTERNAL_ERROR_MSG}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+sync_assets_aggregation_view = AssetInfoAggregationAPIView.as_view()
+
+
+async def async_assets_aggregation_view(request, *args, **kwargs):
+    """
+    Async variant of `AssetInfoAggregationAPIView` for ASGI deployments: the validation, throttling, queries and
+    rendering of the sync view all happen in the bounded database thread pool, so the event loop keeps serving the
+    other requests while this one waits on the database.
+    """
+    return await run_in_db_executor(lambda: sync_assets_aggregation_view(request, *args, **kwargs).render())
+
+
+async_assets_aggregation_view.csrf_exempt = True
+
+
+class PortfolioInfoAggregationAPIView(APIViewPaginatorMixin, APIView):
+    """
+    Retrieves one/list of aggregated info about existed portfolios, rolled up from all their assets' units.
+    """
+
+    read_serializer = PortfolioInfoAggregationReadSerializer
+    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    pagination_class = PortfolioCursorPagination
+
+    def get_queryset(self, portfolio_name):
+        """
+        :param portfolio_name: the requested portfolio name if any
+        :return: portfolios annotated with their KPIs, computed by a single GROUP BY query
+        """
+        queryset = Portfolio.objects.filter(name=portfolio_name) if portfolio_name else Portfolio.objects.all()
+        # With the payloads cache enabled, only the portfolios missing from it get aggregated
+        return queryset if settings.AGGREGATION_CACHE_TIMEOUT else annotate_portfolio_kpis(queryset)
+
+    def list(self, request, *args, **kwargs):
+        """Serializes response of portfolio(s) aggregated info"""
+        portfolio_name = self.kwargs["name"]
+        page = self.paginate_queryset(self.get_queryset(portfolio_name))
+
+        if not page and not getattr(self.paginator, "cursor", None):
+            message = _(f"No portfolio found with name {portfolio_name}") if portfolio_name \
+                else _("No Portfolios found at the system")
+            return Response({"Error": message}, status=status.HTTP_404_NOT_FOUND)
+
+        return self.get_paginated_response(portfolio_payloads(page))
+
+    def get(self, request, *args, **kwargs):
+        """Handles GET requests to retrieve one/list of aggregated info about existed portfolios."""
+
+        serializer = self.read_serializer(data=request.data)
+
+        try:
+            serializer.is_valid(raise_exception=True)
+            self.kwargs["name"] = serializer.validated_data.get("portfolio_name") or False
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[PORTFOLIOS REQUEST PAYLOAD]", request,
+                            serializer.validated_data)
+            return self.list(request, *args, **kwargs)
+
+        except ValidationError as err:
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[VALIDATION ERROR]", request, serializer.errors)
+            return Response({"Validation Error": _(f"{err.args[0]}")}, status=status.HTTP_400_BAD_REQUEST)
+
+        except NotFound as err:
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[INVALID CURSOR]", request, err.detail)
+            return Response({"Error": err.detail}, status=status.HTTP_404_NOT_FOUND)
+
+        except Exception as err:
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[INTERNAL ERROR]", request, err.args)
+            return Response({"Internal Error": EXTERNAL_ERROR_MSG}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class GeoInfoAggregationAPIView(APIView):
+    """
+    Retrieves aggregated info about existed assets grouped by city and/or zipcode.
+    """
+
+    read_serializer = GeoInfoAggregationReadSerializer
+    write_serializer = GeoInfoAggregationWriteSerializer
+    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+
+    def get_queryset(self, group_by, portfolio_name):
+        """
+        :param group_by: the fields the assets are grouped by
+        :param portfolio_name: restricts the rollup to one portfolio if given
+        :return: one row per group along with its KPIs, computed by a single GROUP BY query
+        """
+        queryset = Asset.objects.filter(portfolio__name=portfolio_name) if portfolio_name else Asset.objects.all()
+        return queryset.order_by().values(*group_by).annotate(
+                number_of_assets=Count("id", distinct=True), **unit_kpi_aggregates("units")
+        ).order_by(*group_by)
+
+    def get(self, request, *args, **kwargs):
+        """Handles GET requests to retrieve aggregated info about existed assets grouped geographically."""
+
+        serializer = self.read_serializer(data=request.data)
+
+        try:
+            serializer.is_valid(raise_exception=True)
+            group_by = serializer.validated_data.get("group_by") or ["city"]
+            portfolio_name = serializer.validated_data.get("portfolio_name")
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[GEO REQUEST PAYLOAD]", request, serializer.validated_data)
+
+            rows = self.get_queryset(group_by, portfolio_name)
+            return Response(self.write_serializer(rows, many=True).data)
+
+        except ValidationError as err:
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[VALIDATION ERROR]", request, serializer.errors)
+            return Response({"Validation Error": _(f"{err.args[0]}")}, status=status.HTTP_400_BAD_REQUEST)
+
+        except Exception as err:
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[INTERNAL ERROR]", request, err.args)
+            return Response({"Internal Error": EXTERNAL_ERROR_MSG}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ExpiringLeasesAPIView(APIViewPaginatorMixin, APIView):
+    """
+    Retrieves the rented units whose lease ends within a window, or their counts grouped by asset or portfolio.
+    """
+
+    read_serializer = ExpiringLeasesReadSerializer
+    write_serializer = ExpiringLeaseWriteSerializer
+    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    pagination_class = LeaseCursorPagination
+
+    GROUP_BY_FIELDS = {
+        "asset": ["asset__reference", "asset__portfolio__name"],
+        "portfolio": ["asset__portfolio__name"],
+    }
+
+    def get_queryset(self, lease_end_from, lease_end_to, portfolio_name):
+        """
+        :param lease_end_from: first day of the window
+        :param lease_end_to: first day after the window
+        :param portfolio_name: restricts the units to one portfolio if given
+        :return: the rented units expiring within the window, matching the partial lease end index predicate
+        """
+        queryset = Unit.objects.filter(is_rented=True, lease_end__gte=lease_end_from, lease_end__lt=lease_end_to)
+        if portfolio_name and unit_table_partitioned():
+            # Constant asset ids let the planner skip the unit partitions holding none of the portfolio's assets
+            asset_ids = Asset.objects.filter(portfolio__name=portfolio_name).values_list("id", flat=True)
+            queryset = queryset.filter(asset_id__in=list(asset_ids))
+        elif portfolio_name:
+            queryset = queryset.filter(asset__portfolio__name=portfolio_name)
+
+        return queryset
+
+    def count_by_group(self, queryset, group_by):
+        """
+        :param queryset: the expiring units
+        :param group_by: either asset or portfolio
+        :return: response of the expiring units counts, area and rent per group
+        """
+        group_fields = self.GROUP_BY_FIELDS[group_by]
+        rows = queryset.order_by().values(*group_fields).annotate(
+                expiring_units=Count("id"), expiring_area=Sum("size"), expiring_rent=Sum("rent")
+        ).order_by(*group_fields)
+
+        results = []
+        for row in rows:
+            result = {"asset": row["asset__reference"]} if group_by == "asset" else {}
+            result.update({
+                "portfolio": row["asset__portfolio__name"],
+                "expiring_units": row["expiring_units"],
+                "expiring_area": row["expiring_area"] or 0,
+                "expiring_rent": row["expiring_rent"] or 0,
+            })
+            results.append(result)
+
+        return Response(results)
+
+    def list(self, queryset):
+        """
+        :param queryset: the expiring units
+        :return: keyset paginated response of the expiring units, soonest expiring first
+        """
+        page = self.paginate_queryset(queryset.select_related("asset__portfolio"))
+        serializer = self.write_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def _request_payload(self, request):
+        """
+        :param request: the request object being served
+        :return: the request body, completed by the window and portfolio given in the query string
+        """
+        payload = request.data.copy() if request.data else {}
+        for name in self.read_serializer().fields:
+            if name in request.query_params and name not in payload:
+                payload[name] = request.query_params[name]
+
+        return payload
+
+    def get(self, request, *args, **kwargs):
+        """Handles GET requests to retrieve the leases expiring within a window."""
+
+        serializer = self.read_serializer(data=self._request_payload(request))
+
+        try:
+            serializer.is_valid(raise_exception=True)
+            # The following pages are requested through the links alone, they keep the window of the first one
+            self.link_params = serializer.get_link_params()
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[LEASES REQUEST PAYLOAD]", request,
+                            serializer.validated_data)
+            queryset = self.get_queryset(
+                    serializer.validated_data["lease_end_from"], serializer.validated_data["lease_end_to"],
+                    serializer.validated_data.get("portfolio_name")
+            )
+
+            if serializer.validated_data.get("group_by"):
+                return self.count_by_group(queryset, serializer.validated_data["group_by"])
+            return self.list(queryset)
+
+        except ValidationError as err:
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[VALIDATION ERROR]", request, serializer.errors)
+            return Response({"Validation Error": _(f"{err.args[0]}")}, status=status.HTTP_400_BAD_REQUEST)
+
+        except NotFound as err:
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[INVALID CURSOR]", request, err.detail)
+            return Response({"Error": err.detail}, status=status.HTTP_404_NOT_FOUND)
+
+        except Exception as err:
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[INTERNAL ERROR]", request, err.args)
+            return Response({"Internal Error": EXTERNAL_ERROR_MSG}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ForecastAPIView(APIView):
+    """
+    Retrieves the month by month occupied area and contracted rent projected from the current leases, per portfolio
+    and optionally per asset.
+    """
+
+    read_serializer = ForecastReadSerializer
+    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+
+    def get(self, request, *args, **kwargs):
+        """Handles GET requests to retrieve the occupancy and rent roll forecast."""
+
+        serializer = self.read_serializer(data=request.data)
+
+        try:
+            serializer.is_valid(raise_exception=True)
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[FORECAST REQUEST PAYLOAD]", request,
+                            serializer.validated_data)
+            payload = cached_forecast(**serializer.validated_data)
+
+            if not payload["portfolios"]:
+                logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[NOT FOUND]", request, serializer.validated_data)
+                return Response({"Error": _("No units found to forecast")}, status=status.HTTP_404_NOT_FOUND)
+            return Response(payload)
+
+        except ValidationError as err:
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[VALIDATION ERROR]", request, serializer.errors)
+            return Response({"Validation Error": _(f"{err.args[0]}")}, status=status.HTTP_400_BAD_REQUEST)
+
         except Exception as err:
             logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[INTERNAL ERROR]", request, err.args)
             return Response({"Internal Error": EXTERNAL_ERROR_MSG}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class AssetSearchAPIView(APIViewPaginatorMixin, APIView):
+    """
+    Searches the assets by partial reference, address, city or tenant name, best matches first.
+    """
+
+    read_serializer = AssetSearchReadSerializer
+    write_serializer = AssetSearchWriteSerializer
+    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    pagination_class = AssetSearchCursorPagination
+
+    def get_queryset(self, query, portfolio_name):
+        """
+        :param query: the searched text
+        :param portfolio_name: restricts the search to one portfolio if given
+        :return: the matching assets annotated with their search rank
+        """
+        queryset = Asset.objects.filter(portfolio__name=portfolio_name) if portfolio_name else Asset.objects.all()
+        return search_assets(query, queryset.select_related("portfolio"))
+
+    def get(self, request, *args, **kwargs):
+        """Handles GET requests to search the assets."""
+
+        # Read from the query string, so the pagination links carry the search along
+        serializer = self.read_serializer(data=request.query_params)
+
+        try:
+            serializer.is_valid(raise_exception=True)
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[SEARCH REQUEST PAYLOAD]", request,
+                            serializer.validated_data)
+            page = self.paginate_queryset(self.get_queryset(
+                    serializer.validated_data["q"], serializer.validated_data.get("portfolio_name")
+            ))
+            return self.get_paginated_response(self.write_serializer(page, many=True).data)
+
+        except ValidationError as err:
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[VALIDATION ERROR]", request, serializer.errors)
+            return Response({"Validation Error": _(f"{err.args[0]}")}, status=status.HTTP_400_BAD_REQUEST)
+
+        except NotFound as err:
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[INVALID CURSOR]", request, err.detail)
+            return Response({"Error": err.detail}, status=status.HTTP_404_NOT_FOUND)
+
+        except Exception as err:
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[INTERNAL ERROR]", request, err.args)
+            return Response({"Internal Error": EXTERNAL_ERROR_MSG}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AssetKPITrendAPIView(APIView):
+    """
+    Retrieves how the KPIs of an asset developed over time, read from the snapshots taken after every import.
+    """
+
+    read_serializer = AssetKPITrendReadSerializer
+    write_serializer = AssetKPISnapshotWriteSerializer
+    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+
+    def get(self, request, *args, **kwargs):
+        """Handles GET requests to retrieve the KPIs trend of an asset."""
+
+        serializer = self.read_serializer(data=request.data)
+
+        try:
+            serializer.is_valid(raise_exception=True)
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[TREND REQUEST PAYLOAD]", request,
+                            serializer.validated_data)
+            asset_ref = serializer.validated_data["asset_ref"]
+            asset = Asset.objects.filter(reference=asset_ref).only("id").first()
+            if asset is None:
+                raise NotFound(_(f"No asset found with reference {asset_ref}"))
+
+            # Range scan over the (asset, snapshot_date) unique index
+            snapshots = AssetKPISnapshot.objects.filter(
+                    asset=asset, snapshot_date__gte=serializer.validated_data["date_from"],
+                    snapshot_date__lte=serializer.validated_data["date_to"]
+            ).order_by("snapshot_date")
+
+            return Response({"asset": asset_ref, "snapshots": self.write_serializer(snapshots, many=True).data})
+
+        except ValidationError as err:
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[VALIDATION ERROR]", request, serializer.errors)
+            return Response({"Validation Error": _(f"{err.args[0]}")}, status=status.HTTP_400_BAD_REQUEST)
+
+        except NotFound as err:
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[NOT FOUND]", request, err.detail)
+            return Response({"Error": err.detail}, status=status.HTTP_404_NOT_FOUND)
+
+        except Exception as err:
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[INTERNAL ERROR]", request, err.args)
+            return Response({"Internal Error": EXTERNAL_ERROR_MSG}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AssetInfoExportAPIView(APIView):
+    """
+    Streams every asset's aggregated info as CSV or NDJSON.
+    """
+
+    read_serializer = AssetInfoExportReadSerializer
+    renderer_classes = [JSONRenderer, PassthroughRenderer]
+    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+
+    def _accepts_gzip(self, request):
+        return settings.ASSETS_EXPORT_GZIP and "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", "")
+
+    def get(self, request, *args, **kwargs):
+        """Handles GET requests to stream the aggregated info of all the assets."""
+
+        serializer = self.read_serializer(data=request.query_params)
+
+        try:
+            serializer.is_valid(raise_exception=True)
+        except ValidationError as err:
+            logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[EXPORT VALIDATION ERROR]", request, serializer.errors)
+            return Response({"Validation Error": _(f"{err.args[0]}")}, status=status.HTTP_400_BAD_REQUEST)
+
+        export_format = serializer.validated_data["export_format"]
+        compress = self._accepts_gzip(request)
+        logging_message(ASSETS_INFO_AGGREGATION_LOGGER, "[EXPORT REQUEST]", request, serializer.validated_data)
+
+        response = StreamingHttpResponse(
+                stream_asset_kpis(Asset.objects.all(), export_format, settings.ASSETS_EXPORT_CHUNK_SIZE, compress),
+                content_type=EXPORT_CONTENT_TYPES[export_format]
+        )
+        response["Content-Disposition"] = f'attachment; filename="assets_kpis.{export_format}"'
+        if compress:
+            response["Content-Encoding"] = "gzip"
+        patch_vary_headers(response, ["Accept-Encoding"])
+
+        return response
+
+
+class MetricsAPIView(APIView):
+    """
+    Serves the metrics of the app process and of the celery workers children in the Prometheus text format.
+    """
+
+    renderer_classes = [JSONRenderer, PassthroughRenderer]
+    # Scraped at a steady pace by the monitoring
+    throttle_classes = []
+
+    def get(self, request, *args, **kwargs):
+        """Handles GET requests to scrape the metrics."""
+
+        if not settings.METRICS_ENDPOINT:
+            return Response({"Error": _("The metrics aren't exposed")}, status=status.HTTP_404_NOT_FOUND)
+
+        return HttpResponse(collect_metrics().render_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
 class UploadDocumentViewSet(viewsets.ModelViewSet):
     """
     Viewset for handling the uploaded portfolio data sheets
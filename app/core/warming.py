@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+from django.conf import settings
+from django.db import connection
+
+from .caching import bump_data_version, get_data_version
+from .forecast import cached_forecast, default_forecast_months
+from .models import Asset, Portfolio
+from .payloads import asset_payloads, asset_rows, portfolio_payloads
+
+
+CACHE_WARMING_LOGGER = logging.getLogger("queue_tasks")
+
+
+def warm_forecasts(version=None):
+    """
+    Builds and caches the default forecast of the whole data and of every portfolio
+    :param version: the data version to cache the forecasts for, defaults to the current one
+    :return: number of warmed forecasts
+    """
+    if not settings.FORECAST_CACHE_TIMEOUT:
+        return 0
+
+    portfolio_names = [None] + list(Portfolio.objects.order_by("name").values_list("name", flat=True))
+    for portfolio_name in portfolio_names:
+        cached_forecast(default_forecast_months(), portfolio_name=portfolio_name, version=version, refresh=True)
+
+    return len(portfolio_names)
+
+
+def _chunks(ids, size):
+    return [ids[start:start + size] for start in range(0, len(ids), size)]
+
+
+def _warm_chunk(queryset, payloads, ids, version):
+    try:
+        return len(payloads(list(queryset.filter(id__in=ids).order_by("id")), version=version, refresh=True))
+    finally:
+        # Every warming thread opens its own connection
+        if settings.CACHE_WARMING_CONCURRENCY > 1:
+            connection.close()
+
+
+def warm_aggregations(asset_ids=(), portfolio_ids=(), version=None):
+    """
+    Builds and caches the aggregation payloads of the given assets and portfolios along with the ones of the first
+    listing pages, at most CACHE_WARMING_CONCURRENCY chunks at once so warming doesn't starve the imports
+    :param asset_ids: ids of the assets to warm
+    :param portfolio_ids: ids of the portfolios to warm
+    :param version: the data version to cache the payloads for, defaults to the current one
+    :return: number of warmed payloads
+    """
+    if not settings.AGGREGATION_CACHE_TIMEOUT:
+        return 0
+
+    page_size = settings.ASSETS_PAGE_SIZE
+    first_assets = Asset.objects.order_by("-updated_at", "-id").values_list("id", flat=True)[:page_size]
+    first_portfolios = Portfolio.objects.order_by("name", "id").values_list("id", flat=True)[:page_size]
+    asset_ids, portfolio_ids = set(asset_ids) | set(first_assets), set(portfolio_ids) | set(first_portfolios)
+
+    chunks = [(asset_rows(Asset.objects.all()), asset_payloads, ids) for ids in _chunks(sorted(asset_ids), page_size)]
+    chunks += [(Portfolio.objects.all(), portfolio_payloads, ids) for ids in _chunks(sorted(portfolio_ids), page_size)]
+    if settings.CACHE_WARMING_CONCURRENCY <= 1:
+        return sum(_warm_chunk(queryset, payloads, ids, version) for queryset, payloads, ids in chunks)
+
+    with ThreadPoolExecutor(max_workers=settings.CACHE_WARMING_CONCURRENCY) as executor:
+        return sum(executor.map(lambda chunk: _warm_chunk(*chunk, version), chunks))
+
+
+def refresh_caches(asset_ids=(), portfolio_ids=()):
+    """
+    Moves the data version forward without making the readers compute everything cold: the results of the next
+    version are cached first, and the version is published only afterwards
+    :param asset_ids: ids of the assets whose payloads should be warmed besides the first listing pages
+    :param portfolio_ids: ids of the portfolios whose payloads should be warmed besides the first listing pages
+    :return: the new data version
+    """
+    next_version = get_data_version() + 1
+    warmed = warm_forecasts(version=next_version)
+    warmed += warm_aggregations(asset_ids, portfolio_ids, version=next_version)
+    version = bump_data_version()
+
+    if version != next_version:
+        # Data changed concurrently, its own version bump left the warmed results unreachable
+        CACHE_WARMING_LOGGER.debug("[CACHE WARMING - SKIPPED]\nWarmed version %s but got %s", next_version, version)
+    else:
+        CACHE_WARMING_LOGGER.debug("[CACHE WARMING - PASSED]\nWarmed %s forecast(s) for version %s", warmed, version)
+
+    return version